@@ -1,31 +1,60 @@
-from fastapi import FastAPI, Request, Form, UploadFile, File, HTTPException, Body
-from fastapi.responses import JSONResponse, StreamingResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request, Form, UploadFile, File, HTTPException, Body, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, FileResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
 from pydantic import BaseModel
-from typing import Optional
-import io
-import pandas as pd
-from docx import Document
-from docx.shared import Pt, Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib import colors
-from datetime import date
+from typing import Optional, List, Dict
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+import asyncio
+import hashlib
+import logging
+import time
 from urllib.parse import quote
 import os
-from openpyxl import load_workbook
-from openpyxl.styles import Alignment, Font
 
-from .models import store
+from .models import (
+    store, pool_stats, ITOG_FIELDS, CONFLICT_MODES, ConflictError, MissingRowsError
+)
+from . import migrations
+from .importer import import_itog, ImportFormatError
+from .jobs import export_jobs, ExportJob, ExportQueueFull
+from .async_store import AsyncDataStore, ThreadedStore
+from .timetable import timetable, week_start
+from .occupancy import occupancy
+from .generator import generator, GeneratorBusy
+from .workload import counts_from_rows, workload, workload_rows
+from . import metrics
+from .assets import StaticAssets
+from .metrics import MetricsMiddleware
+from .profiling import ProfilerMiddleware, profiler
+from .events import EVENTS_HEARTBEAT, events, format_sse, missed_events, parse_event_id
+
+log = logging.getLogger(__name__)
 
 BASE_DIR = Path(__file__).resolve().parent
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # импорт модуля не трогает БД: схема, индексы в памяти и сжатая статика — здесь, при старте воркера
+    timings = app.state.startup = {}
+    for hook in (apply_migrations, load_indexes, load_static):
+        started = time.perf_counter()
+        hook()
+        timings[hook.__name__] = round(time.perf_counter() - started, 3)
+    log.info("startup: %s", timings)
+    try:
+        yield
+    finally:
+        stop_export_jobs()
+        await close_backend()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilerMiddleware)
 
 
 # --- Pydantic Models (Схемы данных для JSON) ---
@@ -54,48 +83,134 @@ class ItogSchema(BaseModel):
     id_au_fk: Optional[int] = None
     type: Optional[str] = None
 
+    def to_fields(self):
+        return {
+            "date": self.data, "time": self.time, "object_id": self.id_obj_fk,
+            "group_id": self.id_group_fk, "prep_id": self.id_prep_fk,
+            "aud_id": self.id_au_fk, "type": self.type,
+        }
+
+
+class ItogBatchOp(BaseModel):
+    op: str  # create | update | delete
+    id: Optional[int] = None
+    item: Optional[ItogSchema] = None
+
+
+class ItogBatchSchema(BaseModel):
+    operations: List[ItogBatchOp]
+
+
+class GeneratorRequirementSchema(BaseModel):
+    group_id: int
+    object_id: Optional[int] = None
+    prep_id: Optional[int] = None
+    hours: int
+    type: Optional[str] = None
+
+
+class GeneratorSchema(BaseModel):
+    date_from: str
+    date_to: str
+    times: List[str]
+    weekdays: Optional[List[int]] = None  # 0 — понедельник; по умолчанию пн–пт
+    auditorii: Optional[List[int]] = None  # по умолчанию все
+    requirements: List[GeneratorRequirementSchema]
+    time_budget: Optional[float] = None  # секунд
+    dry_run: bool = False
+
+
+class ExportJobSchema(BaseModel):
+    kind: str  # excel | word | pdf
+    params: Dict[str, Optional[str]] = {}
 
-# --- Настройка шрифтов (оставляем как было) ---
-try:
-    font_paths = [
-        "C:/Windows/Fonts/arial.ttf",
-        "C:/Windows/Fonts/arialuni.ttf",
-        "/usr/share/fonts/truetype/msttcorefonts/Arial.ttf",
-        "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
-    ]
-    arial_font_path = None
-    for font_path in font_paths:
-        if os.path.exists(font_path):
-            arial_font_path = font_path
-            break
-    if arial_font_path:
-        pdfmetrics.registerFont(TTFont('Arial', arial_font_path))
-        pdfmetrics.registerFont(TTFont('Arial-Bold', arial_font_path))
-    else:
-        pdfmetrics.registerFont(TTFont('Arial', 'Helvetica'))
-        pdfmetrics.registerFont(TTFont('Arial-Bold', 'Helvetica-Bold'))
-except Exception as e:
-    try:
-        pdfmetrics.registerFont(TTFont('Arial', 'Helvetica'))
-        pdfmetrics.registerFont(TTFont('Arial-Bold', 'Helvetica-Bold'))
-    except:
-        pass
-
-
-# --- Middleware ---
-@app.middleware("http")
-async def no_cache_static(request: Request, call_next):
-    response = await call_next(request)
-    if request.url.path.startswith("/static/") and (
-            request.url.path.endswith(".js") or request.url.path.endswith(".css")):
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
-    return response
 
+class ProfilingSchema(BaseModel):
+    enabled: Optional[bool] = None
+    slow_ms: Optional[float] = None
+    explain: Optional[bool] = None
+    trace: Optional[bool] = None
+    n_plus_one: Optional[int] = None  # повторов одного оператора за запрос
+    clear: bool = False
 
-app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
+
+# --- Статика: имена с хэшем содержимого (app/assets.py), в шаблонах — static_url('js/app.js') ---
+static_assets = StaticAssets(BASE_DIR / "static")
+app.mount("/static", static_assets, name="static")
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
+templates.env.globals["static_url"] = static_assets.url
+
+
+# --- Доступ к данным: DB_ASYNC=1 — asyncpg без пула потоков (app/async_store.py) ---
+DB_ASYNC = os.environ.get("DB_ASYNC", "0") == "1"
+backend = AsyncDataStore(store.cache) if DB_ASYNC else ThreadedStore(store)
+
+
+# --- ETag ---
+# ETag = хэш (путь, параметры запроса, счётчики изменений таблиц). Счётчики читаются
+# одним запросом к последовательностям, поэтому 304 обходится без ORM и сборки JSON.
+def _etag(request: Request, versions) -> str:
+    raw = f"{request.url.path}?{sorted(request.query_params.multi_items())}#{versions}"
+    return 'W/"' + hashlib.sha1(raw.encode("utf-8")).hexdigest() + '"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    # слабое сравнение (RFC 7232): W/ не учитывается
+    tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+async def _conditional(request: Request, tables, build) -> Response:
+    """304, если у клиента актуальная версия, иначе await build() с заголовком ETag.
+
+    Прочитанные версии таблиц доступны build() в request.state.versions; справочники
+    из кэша build() сверяет с ними же, чтобы тело не оказалось старше своего ETag.
+    """
+    request.state.versions = await backend.table_versions(*tables)
+    etag = _etag(request, request.state.versions)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response = await build()
+    response.headers.update(headers)
+    return response
+
+
+async def _json(rows) -> JSONResponse:
+    # списки бывают большими: orjson кодирует их на порядок быстрее json.dumps
+    return ORJSONResponse(await rows)
+
+
+# --- Схема БД: миграции при старте (DB_AUTO_MIGRATE=0 — только вручную) ---
+DB_AUTO_MIGRATE = os.environ.get("DB_AUTO_MIGRATE", "1") == "1"
+
+
+def apply_migrations():
+    if DB_AUTO_MIGRATE:
+        migrations.upgrade()
+    for m in migrations.missing_indexes():
+        migrations.log.warning("missing index %s on %s", m["index"], m["table"])
+
+
+def load_indexes():
+    timetable.load()
+    occupancy.load()
+
+
+def load_static():
+    static_assets.load()
+
+
+def stop_export_jobs():
+    export_jobs.shutdown()
+    generator.shutdown()
+
+
+async def close_backend():
+    await backend.dispose()
 
 
 # --- Главная страница ---
@@ -104,519 +219,562 @@ def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 
+# --- Служебное: состояние пула соединений и кэша справочников ---
+@app.get("/api/pool_stats")
+def get_pool_stats():
+    return JSONResponse(pool_stats())
+
+
+@app.get("/api/cache_stats")
+def get_cache_stats():
+    return JSONResponse(dict(store.cache.stats(), timetable=timetable.stats(),
+                             occupancy=occupancy.stats(), workload=workload.stats(),
+                             event_subscribers=events.subscribers))
+
+
+# --- Метрики Prometheus: время ответа по маршрутам, SQL на запрос, экспорты (app/metrics.py) ---
+metrics.Gauge("db_pool_checked_out", "Connections checked out of the sync pool", lambda: pool_stats()["checked_out"])
+metrics.Gauge("events_subscribers", "Open /api/events streams", lambda: events.subscribers)
+
+
+@app.get("/metrics")
+def get_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# --- Профилирование SQL на ходу: медленные запросы с EXPLAIN, N+1, трассы (app/profiling.py) ---
+@app.get("/api/profiling")
+def get_profiling():
+    return JSONResponse(profiler.status())
+
+
+@app.post("/api/profiling")
+def set_profiling(data: ProfilingSchema):
+    if data.clear:
+        profiler.clear()
+    return JSONResponse(profiler.configure(**data.dict(exclude={"clear"})))
+
+
+@app.get("/api/profiling/traces/{trace_id}")
+def get_profiling_trace(trace_id: int):
+    trace = profiler.trace(trace_id)
+    if trace is None:
+        raise HTTPException(404, "Trace not found")
+    return JSONResponse(trace)
+
+
+# --- Лента изменений (SSE): /api/events?group_id=.. — занятия построчно, справочники — reload ---
+@app.get("/api/events")
+async def get_events(request: Request, group_id: int = None, prep_id: int = None, aud_id: int = None):
+    versions = await backend.table_versions()
+    sub = events.subscribe({"group_id": group_id, "prep_id": prep_id, "aud_id": aud_id}, versions)
+    events.start_polling(backend.table_versions)
+    last_event_id = request.headers.get("last-event-id")
+
+    async def stream():
+        try:
+            if last_event_id:
+                # переподключение: пропущенные строки не хранятся, изменившиеся таблицы перечитываются
+                for event in missed_events(parse_event_id(last_event_id), versions):
+                    yield format_sse(event)
+            else:
+                # только id, без data: браузер запомнит его для Last-Event-ID
+                yield "id: " + ".".join(str(versions[t]) for t in versions) + "\n\n"
+            while True:
+                event = await sub.get(EVENTS_HEARTBEAT)
+                if event is not None:
+                    yield format_sse(event)
+                elif await request.is_disconnected():
+                    break
+                else:
+                    yield ": ping\n\n"
+        finally:
+            events.unsubscribe(sub)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# --- Справочники: поиск по search_lc идёт в БД, limit — для автодополнения ---
+SEARCH_LIMIT_DEFAULT = 50
+SEARCH_LIMIT_MAX = 1000
+
+
 # --- Groups ---
 @app.get("/api/groups")
-def get_groups(name: str = None):
-    groups = store.list_groups()
-    if name:
-        name = name.lower()
-        groups = [g for g in groups if name in g["name"].lower()]
-    return JSONResponse(groups)
+async def get_groups(request: Request, name: str = None, limit: int = None):
+    if name and not limit:
+        limit = SEARCH_LIMIT_DEFAULT
+    return await _conditional(request, ("groups",), lambda: _json(
+        backend.list_groups(name, limit=min(limit, SEARCH_LIMIT_MAX) if limit else None,
+                            version=request.state.versions["groups"])))
 
 
 @app.post("/api/groups")
-def post_group(item: GroupSchema):
+async def post_group(item: GroupSchema):
     if not item.name:
         raise HTTPException(400, "name required")
-    return JSONResponse(store.create_group(name=item.name))
+    return JSONResponse(await backend.create_group(name=item.name))
 
 
 @app.put("/api/groups/{id_group}")
-def put_group(id_group: int, item: GroupSchema):
-    updated = store.update_group(id_group, item.name)
+async def put_group(id_group: int, item: GroupSchema):
+    updated = await backend.update_group(id_group, item.name)
     if not updated:
         raise HTTPException(404, "Group not found")
     return JSONResponse(updated)
 
 
 @app.delete("/api/groups/{id_group}")
-def delete_group(id_group: int):
-    success = store.delete_group(id_group)
-    if not success:
+async def delete_group(id_group: int):
+    lessons = await backend.delete_group(id_group)
+    if lessons is None:
         raise HTTPException(404, "Group not found")
-    return JSONResponse({"ok": True})
+    return JSONResponse({"ok": True, "lessons": lessons})
 
 
 # --- Objects (subjects) ---
 @app.get("/api/objects")
-def get_objects(name: str = None):
-    objs = store.list_objects()
-    if name:
-        name = name.lower()
-        objs = [o for o in objs if name in o["name"].lower()]
-    return JSONResponse(objs)
+async def get_objects(request: Request, name: str = None, limit: int = None):
+    if name and not limit:
+        limit = SEARCH_LIMIT_DEFAULT
+    return await _conditional(request, ("objects",), lambda: _json(
+        backend.list_objects(name, limit=min(limit, SEARCH_LIMIT_MAX) if limit else None,
+                             version=request.state.versions["objects"])))
 
 
 @app.post("/api/objects")
-def post_object(item: ObjectSchema):
+async def post_object(item: ObjectSchema):
     if not item.name:
         raise HTTPException(400, "name required")
-    return JSONResponse(store.create_object(name=item.name))
+    return JSONResponse(await backend.create_object(name=item.name))
 
 
 @app.put("/api/objects/{id_obj}")
-def put_object(id_obj: int, item: ObjectSchema):
-    updated = store.update_object(id_obj, item.name)
+async def put_object(id_obj: int, item: ObjectSchema):
+    updated = await backend.update_object(id_obj, item.name)
     if not updated:
         raise HTTPException(404, "Object not found")
     return JSONResponse(updated)
 
 
 @app.delete("/api/objects/{id_obj}")
-def delete_object(id_obj: int):
-    success = store.delete_object(id_obj)
-    if not success:
+async def delete_object(id_obj: int):
+    lessons = await backend.delete_object(id_obj)
+    if lessons is None:
         raise HTTPException(404, "Object not found")
-    return JSONResponse({"ok": True})
+    return JSONResponse({"ok": True, "lessons": lessons})
 
 
 # --- Preps (teachers) ---
 @app.get("/api/preps")
-def get_preps(fio: str = None):
-    preps = store.list_preps()
-    if fio:
-        fio = fio.lower()
-        preps = [p for p in preps if fio in p["fio"].lower()]
-    return JSONResponse(preps)
+async def get_preps(request: Request, fio: str = None, limit: int = None):
+    if fio and not limit:
+        limit = SEARCH_LIMIT_DEFAULT
+    return await _conditional(request, ("preps",), lambda: _json(
+        backend.list_preps(fio, limit=min(limit, SEARCH_LIMIT_MAX) if limit else None,
+                           version=request.state.versions["preps"])))
 
 
 @app.post("/api/preps")
-def post_prep(item: PrepSchema):
+async def post_prep(item: PrepSchema):
     if not item.fio:
         raise HTTPException(400, "fio required")
-    return JSONResponse(store.create_prep(fio=item.fio))
+    return JSONResponse(await backend.create_prep(fio=item.fio))
 
 
 @app.put("/api/preps/{id_prep}")
-def put_prep(id_prep: int, item: PrepSchema):
-    updated = store.update_prep(id_prep, item.fio)
+async def put_prep(id_prep: int, item: PrepSchema):
+    updated = await backend.update_prep(id_prep, item.fio)
     if not updated:
         raise HTTPException(404, "Prep not found")
     return JSONResponse(updated)
 
 
 @app.delete("/api/preps/{id_prep}")
-def delete_prep(id_prep: int):
-    success = store.delete_prep(id_prep)
-    if not success:
+async def delete_prep(id_prep: int):
+    lessons = await backend.delete_prep(id_prep)
+    if lessons is None:
         raise HTTPException(404, "Prep not found")
-    return JSONResponse({"ok": True})
+    return JSONResponse({"ok": True, "lessons": lessons})
 
 
 # --- Auditorii ---
 @app.get("/api/auditorii")
-def get_auditorii(number: str = None):
-    auds = store.list_aud()
-    if number:
-        number = number.lower()
-        auds = [a for a in auds if number in a["number"].lower()]
-    return JSONResponse(auds)
+async def get_auditorii(request: Request, number: str = None, limit: int = None):
+    if number and not limit:
+        limit = SEARCH_LIMIT_DEFAULT
+    return await _conditional(request, ("auditorii",), lambda: _json(
+        backend.list_aud(number, limit=min(limit, SEARCH_LIMIT_MAX) if limit else None,
+                         version=request.state.versions["auditorii"])))
+
+
+# Свободные аудитории: ?date=2024-09-02&time=08:00 — в слот, без time — на весь день,
+# week=true — во все дни недели, содержащей date
+@app.get("/api/auditorii/free")
+async def get_free_auditorii(request: Request, day: str = Query(..., alias="date"), time: str = None,
+                             week: bool = False):
+    try:
+        d = date.fromisoformat(day)
+    except ValueError:
+        raise HTTPException(400, "date must be YYYY-MM-DD")
+    days = [week_start(d) + timedelta(days=i) for i in range(7)] if week else [d]
+    return await _conditional(request, ("itog", "auditorii"), lambda: _free_auditorii_response(
+        request, [x.isoformat() for x in days], time))
+
+
+async def _free_auditorii_response(request: Request, days: List[str], time: Optional[str]) -> JSONResponse:
+    if not occupancy.is_current(request.state.versions["itog"]):
+        await run_in_threadpool(occupancy.load, request.state.versions["itog"])
+    rooms = await backend.list_aud(version=request.state.versions["auditorii"])
+    free = set(occupancy.free([r["id"] for r in rooms], days, time))
+    return ORJSONResponse([r for r in rooms if r["id"] in free])
 
 
 @app.post("/api/auditorii")
-def post_aud(item: AudSchema):
+async def post_aud(item: AudSchema):
     if not item.number:
         raise HTTPException(400, "number required")
-    return JSONResponse(store.create_aud(number=item.number))
+    return JSONResponse(await backend.create_aud(number=item.number))
 
 
 @app.put("/api/auditorii/{id_aud}")
-def put_aud(id_aud: int, item: AudSchema):
-    updated = store.update_aud(id_aud, item.number)
+async def put_aud(id_aud: int, item: AudSchema):
+    updated = await backend.update_aud(id_aud, item.number)
     if not updated:
         raise HTTPException(404, "Auditorium not found")
     return JSONResponse(updated)
 
 
 @app.delete("/api/auditorii/{id_aud}")
-def delete_aud(id_aud: int):
-    success = store.delete_aud(id_aud)
-    if not success:
+async def delete_aud(id_aud: int):
+    lessons = await backend.delete_aud(id_aud)
+    if lessons is None:
         raise HTTPException(404, "Auditorium not found")
-    return JSONResponse({"ok": True})
+    return JSONResponse({"ok": True, "lessons": lessons})
 
 
 # --- Itog (schedule) ---
-@app.get("/api/itog")
-def get_itog(
-        date_from: str = None, date_to: str = None,
-        group_id: str = None, prep_id: str = None, aud_id: str = None,
-        object_id: str = None, type: str = None
-):
+ITOG_PAGE_DEFAULT = 100
+ITOG_PAGE_MAX = 1000
+
+
+def _iso_date(value: Optional[str], name: str) -> Optional[str]:
+    """Дата YYYY-MM-DD из параметра запроса как есть; пустая — None, неверная — 400."""
+    if not value:
+        return None
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(400, f"{name} must be YYYY-MM-DD")
+    return value
+
+
+def _itog_filters(date_from, date_to, group_id, prep_id, aud_id, object_id, type):
     filt = {}
     if date_from: filt["date_from"] = date_from
     if date_to: filt["date_to"] = date_to
-    if group_id: filt["group_id"] = group_id
-    if prep_id: filt["prep_id"] = prep_id
-    if aud_id: filt["aud_id"] = aud_id
-    if object_id: filt["object_id"] = object_id
+    # id проверяем здесь, чтобы и список целиком, и страницы отвечали на мусор 400
+    for name, value in (("group_id", group_id), ("prep_id", prep_id), ("aud_id", aud_id), ("object_id", object_id)):
+        if value:
+            if not value.isdigit():
+                raise HTTPException(400, f"{name} must be an integer")
+            filt[name] = value
     if type: filt["type"] = type
-    return JSONResponse(store.list_itog(filters=filt if filt else None))
+    return filt or None
+
+
+def _itog_fields(fields: Optional[str]):
+    if not fields:
+        return None
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in names if f not in ITOG_FIELDS]
+    if unknown:
+        raise HTTPException(400, f"unknown fields: {', '.join(unknown)}")
+    return names
+
+
+@app.get("/api/itog")
+async def get_itog(
+        request: Request,
+        date_from: str = None, date_to: str = None,
+        group_id: str = None, prep_id: str = None, aud_id: str = None,
+        object_id: str = None, type: str = None,
+        limit: int = None, cursor: str = None, fields: str = None
+):
+    date_from, date_to = _iso_date(date_from, "date_from"), _iso_date(date_to, "date_to")
+    filt = _itog_filters(date_from, date_to, group_id, prep_id, aud_id, object_id, type)
+    field_list = _itog_fields(fields)
+    return await _conditional(request, ("itog",), lambda: _itog_response(filt, field_list, limit, cursor))
+
+
+async def _itog_response(filt, field_list, limit: Optional[int], cursor: Optional[str]) -> JSONResponse:
+    # Без limit/cursor — прежнее поведение: весь список одним ответом
+    if limit is None and cursor is None:
+        rows = await backend.list_itog(filters=filt, fields=field_list)
+        return ORJSONResponse(rows, headers={"X-Total-Count": str(len(rows)),
+                                             "Access-Control-Expose-Headers": "X-Total-Count"})
+
+    limit = max(1, min(limit or ITOG_PAGE_DEFAULT, ITOG_PAGE_MAX))
+    try:
+        # total считаем только на первой странице, чтобы страницы по курсору не делали count(*)
+        rows, next_cursor, total = await backend.page_itog(
+            filters=filt, limit=limit, cursor=cursor, fields=field_list, with_total=cursor is None
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    headers = {"Access-Control-Expose-Headers": "X-Total-Count, X-Next-Cursor"}
+    if total is not None:
+        headers["X-Total-Count"] = str(total)
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return ORJSONResponse(rows, headers=headers)
+
+
+# --- Недельная сетка: /api/timetable?group_id=..&week=2024-09-02 (или prep_id / aud_id) ---
+@app.get("/api/timetable")
+async def get_timetable(request: Request, week: str = None,
+                        group_id: int = None, prep_id: int = None, aud_id: int = None):
+    owners = [(k, v) for k, v in (("group", group_id), ("prep", prep_id), ("aud", aud_id)) if v is not None]
+    if len(owners) != 1:
+        raise HTTPException(400, "exactly one of group_id, prep_id, aud_id is required")
+    try:
+        day = date.fromisoformat(week) if week else date.today()
+    except ValueError:
+        raise HTTPException(400, "week must be YYYY-MM-DD")
+    kind, owner_id = owners[0]
+    return await _conditional(request, ("itog",), lambda: _timetable_response(request, kind, str(owner_id), day))
+
+
+async def _timetable_response(request: Request, kind: str, owner_id: str, day: date) -> JSONResponse:
+    # сетка отстала (запись другого воркера, импорт) — перестраиваем; параллельные запросы
+    # ждут одну перестройку и не повторяют её (load сверяет версию под замком)
+    if not timetable.is_current(request.state.versions["itog"]):
+        await run_in_threadpool(timetable.load, request.state.versions["itog"])
+    return ORJSONResponse(timetable.grid(kind, owner_id, day))
+
+
+# --- Нагрузка преподавателей за период: часы = занятия × LESSON_HOURS ---
+@app.get("/api/workload")
+async def get_workload(request: Request, date_from: str = None, date_to: str = None, prep_id: str = None):
+    date_from, date_to = _iso_date(date_from, "date_from"), _iso_date(date_to, "date_to")
+    # названия берутся из справочников, поэтому их версии тоже входят в ETag
+    return await _conditional(request, ("itog", "groups", "objects", "preps", "auditorii"),
+                              lambda: _workload_response(request, date_from, date_to, prep_id))
+
+
+async def _workload_response(request: Request, date_from, date_to, prep_id) -> JSONResponse:
+    period = (date_from or None, date_to or None)
+    version = request.state.versions["itog"]
+    counts = workload.get(period, version)
+    if counts is None:
+        counts = counts_from_rows(await backend.workload_counts(*period))
+        workload.put(period, version, counts)
+    return ORJSONResponse(await run_in_threadpool(workload_rows, counts, prep_id))
+
+
+def _conflict_mode(on_conflict: Optional[str]) -> Optional[str]:
+    if on_conflict and on_conflict not in CONFLICT_MODES:
+        raise HTTPException(400, f"on_conflict must be one of: {', '.join(CONFLICT_MODES)}")
+    return on_conflict
+
+
+@app.get("/api/itog/conflicts")
+async def get_itog_conflicts(request: Request, date_from: str = None, date_to: str = None):
+    date_from, date_to = _iso_date(date_from, "date_from"), _iso_date(date_to, "date_to")
+    return await _conditional(request, ("itog",), lambda: _json(
+        backend.itog_conflicts(date_from=date_from, date_to=date_to)))
 
 
 @app.post("/api/itog")
-def post_itog(item: ItogSchema):
-    t = store.create_itog(
-        item.data, item.time, item.id_obj_fk,
-        item.id_group_fk, item.id_prep_fk,
-        item.id_au_fk, item.type
-    )
+async def post_itog(item: ItogSchema, on_conflict: str = None):
+    _iso_date(item.data, "data")
+    try:
+        t = await backend.create_itog(
+            item.data, item.time, item.id_obj_fk,
+            item.id_group_fk, item.id_prep_fk,
+            item.id_au_fk, item.type,
+            on_conflict=_conflict_mode(on_conflict)
+        )
+    except ConflictError as e:
+        raise HTTPException(409, {"message": "schedule conflict", "conflicts": e.conflicts})
     return JSONResponse(t)
 
 
 @app.put("/api/itog/{id_itog}")
-def put_itog(id_itog: int, item: ItogSchema):
-    updated = store.update_itog(
-        id_itog,
-        date=item.data,
-        time=item.time,
-        object_id=item.id_obj_fk,
-        group_id=item.id_group_fk,
-        prep_id=item.id_prep_fk,
-        aud_id=item.id_au_fk,
-        type=item.type
-    )
+async def put_itog(id_itog: int, item: ItogSchema, on_conflict: str = None):
+    _iso_date(item.data, "data")
+    try:
+        updated = await backend.update_itog(id_itog, on_conflict=_conflict_mode(on_conflict), **item.to_fields())
+    except ConflictError as e:
+        raise HTTPException(409, {"message": "schedule conflict", "conflicts": e.conflicts})
     if not updated:
         raise HTTPException(404, "Not found")
     return JSONResponse(updated)
 
+@app.post("/api/itog/batch")
+async def post_itog_batch(batch: ItogBatchSchema, on_conflict: str = None):
+    creates, updates, deletes, seen = [], [], [], set()
+    for n, op in enumerate(batch.operations):
+        if op.item is not None:
+            _iso_date(op.item.data, f"operations[{n}]: data")
+        if op.op == "create":
+            if op.item is None:
+                raise HTTPException(400, f"operations[{n}]: item required")
+            creates.append(op.item.to_fields())
+            continue
+        if op.op not in ("update", "delete"):
+            raise HTTPException(400, f"operations[{n}]: unknown op {op.op!r}")
+        if op.id is None:
+            raise HTTPException(400, f"operations[{n}]: id required")
+        if op.id in seen:
+            raise HTTPException(400, f"operations[{n}]: id {op.id} used twice")
+        seen.add(op.id)
+        if op.op == "delete":
+            deletes.append(op.id)
+        elif op.item is None:
+            raise HTTPException(400, f"operations[{n}]: item required")
+        else:
+            updates.append({"id": op.id, **op.item.to_fields()})
+    try:
+        result = await backend.batch_itog(creates, updates, deletes, on_conflict=_conflict_mode(on_conflict))
+    except MissingRowsError as e:
+        raise HTTPException(404, {"message": "Not found", "ids": [str(i) for i in e.ids]})
+    except ConflictError as e:
+        raise HTTPException(409, {"message": "schedule conflict", "conflicts": e.conflicts})
+    return JSONResponse(result)
+
+
 @app.delete("/api/itog/{id_itog}")
-def delete_itog(id_itog: int):
-    success = store.delete_itog(id_itog)
+async def delete_itog(id_itog: int):
+    success = await backend.delete_itog(id_itog)
     if not success:
         raise HTTPException(404, "Not found")
     return JSONResponse({"ok": True})
 
 
-# --- Export PDF ---
+# --- Export ---
+# Документы собираются в пуле процессов (app/jobs.py) и кэшируются на диске до изменения
+# данных. Синхронные ссылки ждут задание через await и не занимают поток из пула FastAPI;
+# Excel при промахе кэша собирается потоком прямо в ответ (и параллельно в кэш).
+def _export_headers(job: ExportJob) -> Dict[str, str]:
+    encoded_filename = quote(job.filename)
+    return {"Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}",
+            "Access-Control-Expose-Headers": "Content-Disposition",
+            "ETag": f'"{job.key}"', "Cache-Control": "no-cache"}
+
+
+def _export_response(job: ExportJob) -> FileResponse:
+    return FileResponse(export_jobs.path(job), media_type=job.media_type, headers=_export_headers(job))
+
+
+async def _submit_export(kind: str, params: Optional[dict] = None) -> ExportJob:
+    try:
+        return await run_in_threadpool(export_jobs.submit, kind, params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExportQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+
+async def _export_now(request: Request, kind: str, params: Optional[dict] = None) -> Response:
+    try:
+        job = await run_in_threadpool(export_jobs.prepare, kind, params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # ключ кэша учитывает тип, параметры и версию данных — им же служит ETag
+    etag = f'"{job.key}"'
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    try:
+        started = await run_in_threadpool(export_jobs.start, job, True)
+    except ExportQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    # куски потоковой сборки читает только запрос, который её начал; остальные ждут файл
+    if started is job and job.chunks is not None:
+        return StreamingResponse(job.chunks, media_type=job.media_type, headers=_export_headers(job))
+    job = started
+    if job.future is not None:
+        try:
+            await asyncio.wrap_future(job.future)
+        except Exception:
+            pass  # причина уже в job.status / job.error
+    if job.status != "done":
+        raise HTTPException(status_code=500, detail=job.error)
+    return _export_response(job)
+
+
 @app.get("/api/export_pdf")
-def export_pdf():
-    itogs = store.list_itog()
-    groups = store.list_groups()
-    preps = store.list_preps()
-
-    current_year = date.today().year
-    if itogs:
-        dates = [r.get("date") for r in itogs if r.get("date")]
-        if dates:
-            min_date = min(dates)
-            month = int(min_date.split('-')[1]) if '-' in min_date else date.today().month
-            semester = "осенний" if 9 <= month <= 12 else "весенний"
-            academic_year = f"{current_year}/{current_year + 1}" if semester == "осенний" else f"{current_year - 1}/{current_year}"
-        else:
-            semester = "осенний"
-            academic_year = f"{current_year}/{current_year + 1}"
-    else:
-        semester = "осенний"
-        academic_year = f"{current_year}/{current_year + 1}"
-
-    buf = io.BytesIO()
-    c = canvas.Canvas(buf, pagesize=A4)
-    width, height = A4
-    c.setFont("Arial", 12)
-
-    left_margin = 50
-    top_margin = height - 50
-    line_height = 20
-    small_line_height = 16
-    current_y = top_margin
-
-    c.setFont("Arial-Bold", 14)
-    c.drawCentredString(width / 2, current_y, "МИНИСТЕРСТВО ОБРАЗОВАНИЯ МОСКОВСКОЙ ОБЛАСТИ")
-    current_y -= line_height * 1.5
-    c.setFont("Arial-Bold", 12)
-    c.drawCentredString(width / 2, current_y, "ГОСУДАРСТВЕННОЕ ОБРАЗОВАТЕЛЬНОЕ УЧРЕЖДЕНИЕ")
-    current_y -= line_height
-    c.drawCentredString(width / 2, current_y, "ВЫСШЕГО ОБРАЗОВАНИЯ МОСКОВСКОЙ ОБЛАСТИ")
-    current_y -= line_height
-    c.drawCentredString(width / 2, current_y, "«ГОСУДАРСТВЕННЫЙ ГУМАНИТАРНО-ТЕХНОЛОГИЧЕСКИЙ УНИВЕРСИТЕТ»")
-    current_y -= line_height
-    c.drawCentredString(width / 2, current_y, "(ГГТУ)")
-    current_y -= line_height
-    c.drawCentredString(width / 2, current_y, "ЛИКИНО-ДУЛЕВСКИЙ ПОЛИТЕХНИЧЕСКИЙ КОЛЛЕДЖ – ФИЛИАЛ ГГТУ")
-    current_y -= line_height * 2
-
-    c.setFont("Arial-Bold", 16)
-    c.drawCentredString(width / 2, current_y, "ПРИКАЗ")
-    current_y -= line_height * 2
-
-    c.setFont("Arial", 12)
-    today = date.today()
-    date_str = today.strftime("от «%d» %B %Y г.").replace("January", "января").replace("February", "февраля").replace(
-        "March", "марта").replace("April", "апреля").replace("May", "мая").replace("June", "июня").replace("July",
-                                                                                                           "июля").replace(
-        "August", "августа").replace("September", "сентября").replace("October", "октября").replace("November",
-                                                                                                    "ноября").replace(
-        "December", "декабря")
-
-    c.drawString(left_margin, current_y, date_str)
-    c.drawRightString(width - left_margin, current_y, "№_____")
-    current_y -= line_height * 1.5
-
-    c.drawCentredString(width / 2, current_y, "г. Ликино-Дулёво")
-    current_y -= line_height * 2
-
-    c.setFont("Arial-Bold", 14)
-    c.drawCentredString(width / 2, current_y, "Об утверждении расписания занятий")
-    current_y -= line_height
-    c.drawCentredString(width / 2, current_y, f"на {semester} семестр {academic_year} учебного года")
-    current_y -= line_height * 2
-
-    c.setFont("Arial", 12)
-    text_lines = [
-        "В целях организации учебного процесса и обеспечения выполнения учебных планов,",
-        "ПРИКАЗЫВАЮ:",
-        "",
-        "1. Утвердить расписание занятий для всех учебных групп колледжа",
-        f"   на {semester} семестр {academic_year} учебного года.",
-        "",
-        "2. Диспетчеру учебной части довести утверждённое расписание до сведения",
-        "   преподавателей и студентов.",
-        "",
-        "3. Контроль за исполнением настоящего приказа возложить на",
-        "   заместителя директора по учебной работе ___________________ /Ф.И.О./",
-        "",
-        "Основание: утверждённый учебный план специальностей."
-    ]
-
-    for line in text_lines:
-        if current_y < 200:
-            c.showPage()
-            current_y = height - 50
-            c.setFont("Arial", 12)
-        if line.strip() == "":
-            current_y -= small_line_height / 2
-        else:
-            c.drawString(left_margin, current_y, line)
-            current_y -= small_line_height
-    current_y -= line_height
-
-    if current_y > 250 and itogs and groups and preps:
-        c.setFont("Arial-Bold", 12)
-        c.drawString(left_margin, current_y, "Сведения о расписании:")
-        current_y -= line_height
-        c.setFont("Arial", 10)
-        stats_lines = [
-            f"• Количество учебных групп: {len(groups)}",
-            f"• Количество преподавателей: {len(preps)}",
-            f"• Общее количество занятий: {len(itogs)}",
-        ]
-        if dates:
-            stats_lines.append(f"• Период действия: с {min(dates)} по {max(dates)}")
-        for line in stats_lines:
-            if current_y < 180: break
-            c.drawString(left_margin + 10, current_y, line)
-            current_y -= small_line_height
-        current_y -= line_height
-
-    if current_y < 150:
-        c.showPage()
-        current_y = height - 100
-
-    c.setFont("Arial", 12)
-    c.drawString(left_margin, current_y, "Директор колледжа")
-    c.drawString(left_margin + 170, current_y, "_____________________")
-    c.drawString(left_margin + 320, current_y, "/Петров Р.М./")
-
-    c.save()
-    buf.seek(0)
-    filename = f"Приказ_об_утверждении_расписания_{semester}_семестр_{academic_year}.pdf"
-    encoded_filename = quote(filename)
-
-    return StreamingResponse(
-        buf,
-        media_type="application/pdf",
-        headers={
-            "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}",
-            "Access-Control-Expose-Headers": "Content-Disposition"
-        }
-    )
+async def export_pdf(request: Request):
+    return await _export_now(request, "pdf")
 
 
-# --- Export Excel ---
 @app.get("/api/export_excel")
-def export_excel():
-    itogs = store.list_itog()
-    objs = {o["id"]: o["name"] for o in store.list_objects()}
-    groups = {g["id"]: g["name"] for g in store.list_groups()}
-    preps = {p["id"]: p["fio"] for p in store.list_preps()}
-    auds = {a["id"]: a["number"] for a in store.list_aud()}
-
-    buf = io.BytesIO()
-    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
-        rows = []
-        row_number = 1
-        for r in itogs:
-            import random
-            hours = random.randint(30, 100)
-            row = {
-                "№": row_number,
-                "ФИО преподавателя": preps.get(r.get("prep_id"), "Не указан"),
-                "Должность": "Преподаватель",
-                "Дисциплина": objs.get(r.get("object_id"), "Не указана"),
-                "Кол-во часов": hours,
-                "Группа": groups.get(r.get("group_id"), "Не указана"),
-                "Аудитория": auds.get(r.get("aud_id"), "Не указана"),
-                "Всего часов": hours
-            }
-            rows.append(row)
-            row_number += 1
-        if not rows:
-            rows.append(
-                {"№": 1, "ФИО преподавателя": "Нет данных", "Должность": "", "Дисциплина": "", "Кол-во часов": 0,
-                 "Группа": "", "Аудитория": "", "Всего часов": 0})
-
-        df = pd.DataFrame(rows)
-        df.to_excel(writer, sheet_name="Нагрузка преподавателей", index=False, startrow=7)
-        workbook = writer.book
-        worksheet = writer.sheets['Нагрузка преподавателей']
-
-        worksheet.merge_cells('A1:H1')
-        worksheet['A1'] = "МИНИСТЕРСТВО ОБРАЗОВАНИЯ МОСКОВСКОЙ ОБЛАСТИ"
-        worksheet['A1'].font = Font(bold=True, size=12)
-        worksheet['A1'].alignment = Alignment(horizontal='center', vertical='center')
-
-        # ... (код оформления Excel, сокращен для краткости, так как он не влияет на Postman) ...
-        # (Вставьте остальной код оформления из вашего оригинального файла, он корректен)
-        # Для удобства, если вы хотите полный файл, я оставлю логику Excel оформления как была:
-
-        worksheet.merge_cells('A2:H2')
-        worksheet['A2'] = "ГОСУДАРСТВЕННОЕ ОБРАЗОВАТЕЛЬНОЕ УЧРЕЖДЕНИЕ ВЫСШЕГО"
-        worksheet['A2'].alignment = Alignment(horizontal='center', vertical='center')
-        worksheet.merge_cells('A3:H3')
-        worksheet['A3'] = "ОБРАЗОВАНИЯ МОСКОВСКОЙ ОБЛАСТИ"
-        worksheet['A3'].alignment = Alignment(horizontal='center', vertical='center')
-        worksheet.merge_cells('A4:H4')
-        worksheet['A4'] = "«ГОСУДАРСТВЕННЫЙ ГУМАНИТАРНО-ТЕХНОЛОГИЧЕСКИЙ УНИВЕРСИТЕТ»"
-        worksheet['A4'].alignment = Alignment(horizontal='center', vertical='center')
-        worksheet.merge_cells('A5:H5')
-        worksheet['A5'] = "(ГГТУ)"
-        worksheet['A5'].alignment = Alignment(horizontal='center', vertical='center')
-        worksheet.merge_cells('A6:H6')
-        worksheet['A6'] = "ЛИКИНО-ДУЛЕВСКИЙ ПОЛИТЕХНИЧЕСКИЙ КОЛЛЕДЖ – ФИЛИАЛ ГГТУ"
-        worksheet['A6'].alignment = Alignment(horizontal='center', vertical='center')
-        worksheet.merge_cells('A7:H7')
-        worksheet['A7'] = "РАСПРЕДЕЛЕНИЕ УЧЕБНОЙ НАГРУЗКИ ПРЕПОДАВАТЕЛЕЙ"
-        worksheet['A7'].font = Font(bold=True, size=14)
-        worksheet['A7'].alignment = Alignment(horizontal='center', vertical='center')
-
-        from openpyxl.styles import Border, Side
-        thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'),
-                             bottom=Side(style='thin'))
-
-        for col_idx in range(1, 9):
-            cell = worksheet.cell(row=9, column=col_idx)
-            cell.border = thin_border
-
-        for row_idx in range(len(df)):
-            for col_idx in range(1, 9):
-                cell = worksheet.cell(row=10 + row_idx, column=col_idx)
-                cell.border = thin_border
-
-    buf.seek(0)
-    filename = "Распределение_учебной_нагрузки_преподавателей.xlsx"
-    encoded_filename = quote(filename)
-    return StreamingResponse(
-        buf,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}",
-                 "Access-Control-Expose-Headers": "Content-Disposition"}
-    )
-
-
-# --- Export Word ---
+async def export_excel(request: Request, date_from: str = None, date_to: str = None):
+    return await _export_now(request, "excel", {"date_from": date_from, "date_to": date_to})
+
+
 @app.get("/api/export_word")
-def export_word(group: str = None, date_start: str = None, date_end: str = None):
-    itogs = store.list_itog()
-    objs = {o["id"]: o["name"] for o in store.list_objects()}
-    groups = {g["id"]: g["name"] for g in store.list_groups()}
-    preps = {p["id"]: p["fio"] for p in store.list_preps()}
-    auds = {a["id"]: a["number"] for a in store.list_aud()}
-
-    if group:
-        group_id = next((gid for gid, gname in groups.items() if gname == group), None)
-        if group_id:
-            itogs = [r for r in itogs if str(r.get("group_id")) == str(group_id)]
-        else:
-            itogs = []
-    if date_start:
-        itogs = [r for r in itogs if r.get("date") >= date_start]
-    if date_end:
-        itogs = [r for r in itogs if r.get("date") <= date_end]
-
-    doc = Document()
-    title = doc.add_paragraph()
-    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    run = title.add_run("МИНИСТЕРСТВО ОБРАЗОВАНИЯ МОСКОВСКОЙ ОБЛАСТИ\n")
-    run.bold = True
-    run.font.size = Pt(12)
-    title.add_run("ГОСУДАРСТВЕННОЕ ОБРАЗОВАТЕЛЬНОЕ УЧРЕЖДЕНИЕ ВЫСШЕГО\n").bold = True
-    title.add_run("ОБРАЗОВАНИЯ МОСКОВСКОЙ ОБЛАСТИ\n").bold = True
-    title.add_run("«ГОСУДАРСТВЕННЫЙ ГУМАНИТАРНО-ТЕХНОЛОГИЧЕСКИЙ УНИВЕРСИТЕТ»\n").bold = True
-    title.add_run("(ГГТУ)\n").bold = True
-    title.add_run("ЛИКИНО-ДУЛЕВСКИЙ ПОЛИТЕХНИЧЕСКИЙ КОЛЛЕДЖ – ФИЛИАЛ ГГТУ\n").bold = True
-
-    group_name = group
-    if not group_name and itogs:
-        first_group_id = itogs[0].get("group_id")
-        group_name = groups.get(first_group_id, "ГРУППА")
-
-    doc_title = doc.add_paragraph()
-    doc_title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    title_run = doc_title.add_run(f"РАСПИСАНИЕ ЗАНЯТИЙ ГРУППЫ {group_name}\n")
-    title_run.bold = True
-    title_run.font.size = Pt(14)
-
-    dates = [r.get("date") for r in itogs if r.get("date")]
-    if dates:
-        period_text = f' с "{min(dates)}" по "{max(dates)}" {date.today().year} г.\n'
-    else:
-        period_text = f'на {date.today().year} учебный год\n'
-    doc_title.add_run(period_text).bold = True
-
-    table = doc.add_table(rows=1, cols=6)
-    table.style = 'Table Grid'
-    hdr_cells = table.rows[0].cells
-    headers = ["Дата", "Время", "Дисциплина", "Преподаватель", "Аудитория", "Тип занятия"]
-    for i, h in enumerate(headers):
-        hdr_cells[i].text = h
-        hdr_cells[i].paragraphs[0].runs[0].bold = True
-        hdr_cells[i].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-    for r in itogs:
-        row_cells = table.add_row().cells
-        row_cells[0].text = str(r.get("date") or "")
-        row_cells[1].text = str(r.get("time") or "")
-        row_cells[2].text = objs.get(r.get("object_id"), "") or ""
-        row_cells[3].text = preps.get(r.get("prep_id"), "") or ""
-        row_cells[4].text = auds.get(r.get("aud_id"), "") or ""
-        row_cells[5].text = str(r.get("type") or "")
-        for cell in row_cells:
-            for paragraph in cell.paragraphs:
-                paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-    doc.add_paragraph("\n")
-    signatures = doc.add_paragraph()
-    signatures.alignment = WD_ALIGN_PARAGRAPH.LEFT
-    signatures.add_run("Составил: __________________ /____________________/\n").bold = True
-    signatures.add_run("Проверил: __________________ /____________________/\n").bold = True
-    signatures.add_run("Утвердил: __________________ /____________________/").bold = True
-
-    buf = io.BytesIO()
-    doc.save(buf)
-    buf.seek(0)
-    filename = f"Расписание_занятий_группы_{group_name}.docx"
-    encoded_filename = quote(filename)
-    return StreamingResponse(
-        buf,
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}",
-                 "Access-Control-Expose-Headers": "Content-Disposition"}
-    )
-
-
-# --- Import (если нужен) ---
+async def export_word(request: Request, group: str = None, date_start: str = None, date_end: str = None):
+    return await _export_now(request, "word", {"group": group, "date_start": date_start, "date_end": date_end})
+
+
+@app.post("/api/export_jobs", status_code=202)
+async def create_export_job(payload: ExportJobSchema):
+    job = await _submit_export(payload.kind, payload.params)
+    return job.to_dict()
+
+
+@app.get("/api/export_jobs/{job_id}")
+def get_export_job(job_id: str):
+    job = export_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job.to_dict()
+
+
+@app.get("/api/export_jobs/{job_id}/download")
+def download_export_job(request: Request, job_id: str):
+    job = export_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=job.to_dict())
+    if _etag_matches(request, f'"{job.key}"'):
+        return Response(status_code=304, headers={"ETag": f'"{job.key}"', "Cache-Control": "no-cache"})
+    return _export_response(job)
+
+
+# --- Import ---
+# def, а не async def: разбор файла и COPY блокирующие, выполняются в пуле потоков
 @app.post("/api/import")
-async def import_data(file: UploadFile = File(...)):
-    # Логика импорта не меняется, так как там UploadFile, а не Pydantic model
-    return JSONResponse({"count": 0})
\ No newline at end of file
+def import_data(file: UploadFile = File(...), create_missing: bool = False, strict: bool = False,
+                encoding: str = "utf-8-sig"):
+    try:
+        result = import_itog(file.file, file.filename, create_missing=create_missing, strict=strict,
+                             encoding=encoding)
+    except ImportFormatError as e:
+        raise HTTPException(400, str(e))
+    return JSONResponse(result)
+
+
+# --- Генератор расписания: задание в фоне, прогресс — GET /api/generate/{id} ---
+@app.post("/api/generate", status_code=202)
+async def start_generation(payload: GeneratorSchema):
+    try:
+        job = await run_in_threadpool(generator.submit, payload.dict())
+    except GeneratorBusy as e:
+        raise HTTPException(409, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return job.to_dict()
+
+
+@app.get("/api/generate/{job_id}")
+def get_generation(job_id: str):
+    job = generator.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Generator job not found")
+    return job.to_dict()
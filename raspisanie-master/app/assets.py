@@ -0,0 +1,153 @@
+# app/assets.py
+# Статика с хэшем содержимого в имени: js/app.js -> js/app.3f2a9c1b0d.js. Шаблон получает адрес
+# через static_url('js/app.js'), такие ответы кэшируются браузером на год (immutable) — новый
+# app.js после деплоя придёт под новым именем. Сжатые варианты (gzip, brotli при установленном
+# пакете brotli) готовятся один раз при старте приложения (load() из lifespan) и отдаются по
+# Accept-Encoding; у каждого варианта свой ETag. Изменения на диске видны после перезапуска.
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+
+try:
+    import brotli
+except ImportError:  # необязательная зависимость: без неё только gzip
+    brotli = None
+
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", str(365 * 24 * 3600)))
+STATIC_HASH_LEN = 10
+COMPRESSIBLE = {".js", ".css", ".html", ".svg", ".json", ".txt", ".map"}
+COMPRESS_MIN_SIZE = 512
+
+
+class Asset(NamedTuple):
+    name: str  # путь с хэшем, относительно каталога статики
+    etag: str  # ETag исходника; у сжатых вариантов — с суффиксом кодировки (etag_for)
+    media_type: str
+    bodies: Dict[str, bytes]  # кодировка ("identity", "gzip", "br") -> тело
+
+    def etag_for(self, encoding: str) -> str:
+        # сильный ETag обязан различать представления (RFC 7232), а сжатые байты другие
+        return self.etag if encoding == "identity" else f'{self.etag[:-1]}-{encoding}"'
+
+
+def _fingerprint(rel: str, digest: str) -> str:
+    stem, dot, ext = rel.rpartition(".")
+    return f"{stem}.{digest}.{ext}" if dot and "/" not in ext else f"{rel}.{digest}"
+
+
+def _compress(rel: str, data: bytes) -> Dict[str, bytes]:
+    bodies = {"identity": data}
+    if Path(rel).suffix not in COMPRESSIBLE or len(data) < COMPRESS_MIN_SIZE:
+        return bodies
+    variants = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(data, quality=11)
+    # вариант, который не меньше исходника, не нужен
+    bodies.update((k, v) for k, v in variants.items() if len(v) < len(data))
+    return bodies
+
+
+def _accepted(header: str) -> Dict[str, float]:
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if coding:
+            accepted[coding.lower()] = q
+    return accepted
+
+
+class StaticAssets:
+    """ASGI-приложение для /static: имена с хэшем — immutable, прежние имена — no-cache + ETag."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+        self._by_path: Optional[Dict[str, Asset]] = None  # исходный путь -> Asset
+        self._by_name: Dict[str, Asset] = {}  # путь с хэшем -> Asset
+
+    def _scan(self) -> None:
+        by_path, by_name = {}, {}
+        for file in sorted(p for p in self.directory.rglob("*") if p.is_file()):
+            rel = file.relative_to(self.directory).as_posix()
+            data = file.read_bytes()
+            digest = hashlib.sha256(data).hexdigest()[:STATIC_HASH_LEN]
+            media_type = mimetypes.guess_type(rel)[0] or "application/octet-stream"
+            if media_type.startswith("text/") or media_type == "application/javascript":
+                media_type += "; charset=utf-8"
+            asset = Asset(_fingerprint(rel, digest), f'"{digest}"', media_type, _compress(rel, data))
+            by_path[rel] = asset
+            by_name[asset.name] = asset
+        self._by_path, self._by_name = by_path, by_name
+
+    def load(self) -> None:
+        """Чтение и сжатие всех файлов (gzip-9, brotli-11) — при старте, вне обработки запросов."""
+        with self._lock:
+            if self._by_path is None:
+                self._scan()
+
+    def _assets(self) -> Dict[str, Asset]:
+        if self._by_path is None:
+            self.load()
+        return self._by_path
+
+    def url(self, path: str) -> str:
+        """Адрес для шаблона; файла нет — адрес без хэша (ответит 404, как и раньше)."""
+        asset = self._assets().get(path.lstrip("/"))
+        return "/static/" + (asset.name if asset else path.lstrip("/"))
+
+    def stats(self) -> Dict[str, int]:
+        assets = self._assets()
+        return {
+            "files": len(assets),
+            "bytes": sum(len(a.bodies["identity"]) for a in assets.values()),
+            "gzip_bytes": sum(len(a.bodies.get("gzip", a.bodies["identity"])) for a in assets.values()),
+        }
+
+    def _response(self, request: Request, asset: Asset, immutable: bool) -> Response:
+        cache = f"public, max-age={STATIC_MAX_AGE}, immutable" if immutable else "no-cache"
+        accepted = _accepted(request.headers.get("accept-encoding", ""))
+        encoding = next((c for c in ("br", "gzip") if c in asset.bodies and accepted.get(c, 0) > 0), "identity")
+        etag = asset.etag_for(encoding)
+        headers = {"Cache-Control": cache, "ETag": etag, "Vary": "Accept-Encoding"}
+        if request.headers.get("if-none-match") in (etag, "W/" + etag):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        body = asset.bodies[encoding]
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            body = b""
+        return Response(body, media_type=asset.media_type, headers=headers)
+
+    async def __call__(self, scope, receive, send) -> None:
+        request = Request(scope, receive)
+        if request.method not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=405)
+        else:
+            path = scope["path"].lstrip("/")
+            if self._by_path is None:
+                # приложение запущено без lifespan: сжатие — в пуле потоков, не в event loop
+                await run_in_threadpool(self.load)
+            assets = self._by_path
+            if path in self._by_name:
+                response = self._response(request, self._by_name[path], immutable=True)
+            elif path in assets:
+                # старые ссылки без хэша продолжают работать, но с проверкой при каждом запросе
+                response = self._response(request, assets[path], immutable=False)
+            else:
+                response = PlainTextResponse("Not Found", status_code=404)
+        await response(scope, receive, send)
@@ -0,0 +1,132 @@
+# app/async_store.py
+# Async-доступ к данным для async def эндпоинтов (DB_ASYNC=1).
+# AsyncDataStore выполняет ту же логику DataStore через AsyncSession.run_sync на движке
+# asyncpg: запросы не блокируют event loop и не занимают поток из пула FastAPI.
+# ThreadedStore — прежний синхронный DataStore за тем же async-интерфейсом.
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from .metrics import instrument_engine
+from .profiling import profiler
+from .models import (
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_TIMEOUT, VERSIONED_TABLES,
+    DataStore, RefCache, bump_versions_sql, notify_changed, table_versions, table_versions_sql,
+)
+
+ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL", DATABASE_URL.replace("+psycopg2", "+asyncpg"))
+
+# методы DataStore, доступные через async-интерфейс
+STORE_METHODS = (
+    "list_groups", "create_group", "update_group", "delete_group",
+    "list_objects", "create_object", "update_object", "delete_object",
+    "list_preps", "create_prep", "update_prep", "delete_prep",
+    "list_aud", "create_aud", "update_aud", "delete_aud",
+    "list_itog", "page_itog", "create_itog", "update_itog", "delete_itog", "itog_conflicts", "batch_itog",
+    "workload_counts",
+)
+
+
+class _BoundStore(DataStore):
+    """DataStore поверх уже открытой сессии: commit и _changed выполняет вызывающий."""
+
+    def __init__(self, cache: RefCache, db: Session):
+        super().__init__(cache)
+        self._db = db
+        self.changed: List[str] = []
+        self.itog: Optional[list] = []
+
+    @contextmanager
+    def _session(self):
+        yield self._db
+
+    def _changed(self, *tables: str, itog=None) -> None:
+        self.changed.extend(tables)
+        if "itog" in tables:
+            # одна запись без списка строк делает неизвестным весь набор
+            self.itog = self.itog + itog if itog is not None and self.itog is not None else None
+
+
+class AsyncDataStore:
+    def __init__(self, cache: Optional[RefCache] = None, url: str = ASYNC_DATABASE_URL):
+        self.cache = cache or RefCache()
+        self.engine = create_async_engine(
+            url,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_pre_ping=True,
+        )
+        instrument_engine(self.engine.sync_engine)
+        profiler.add_engine(self.engine.sync_engine)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    async def _call(self, method: str, /, *args, **kwargs) -> Any:
+        started = time.monotonic()
+        async with self.sessions() as db:
+            async with db.begin():
+                bound = None
+
+                def run(sync_db: Session):
+                    nonlocal bound
+                    bound = _BoundStore(self.cache, sync_db)
+                    return getattr(bound, method)(*args, **kwargs)
+
+                result = await db.run_sync(run)
+        # после commit, как в DataStore._changed
+        if bound.changed:
+            await self._changed(*dict.fromkeys(bound.changed), itog=bound.itog, started=started)
+        return result
+
+    async def _changed(self, *tables: str, itog=None, started: Optional[float] = None) -> None:
+        for table in tables:
+            self.cache.invalidate(table)
+        async with self.engine.begin() as conn:
+            versions = dict(zip(tables, (await conn.execute(bump_versions_sql(tables))).one()))
+        notify_changed(tables, versions, itog, started)
+
+    async def table_versions(self, *tables: str) -> Dict[str, int]:
+        tables = tables or VERSIONED_TABLES
+        async with self.engine.connect() as conn:
+            return dict(zip(tables, (await conn.execute(table_versions_sql(tables))).one()))
+
+    async def dispose(self) -> None:
+        # пул asyncpg привязан к event loop, поэтому при остановке приложения его закрываем
+        await self.engine.dispose()
+
+
+class ThreadedStore:
+    """Синхронный DataStore с async-интерфейсом: каждый вызов уходит в пул потоков."""
+
+    def __init__(self, store: DataStore):
+        self.store = store
+        self.cache = store.cache
+
+    async def _call(self, method: str, /, *args, **kwargs) -> Any:
+        return await run_in_threadpool(getattr(self.store, method), *args, **kwargs)
+
+    async def table_versions(self, *tables: str) -> Dict[str, int]:
+        return await run_in_threadpool(table_versions, *tables)
+
+    async def dispose(self) -> None:
+        pass
+
+
+def _async_method(name: str):
+    async def method(self, *args, **kwargs):
+        return await self._call(name, *args, **kwargs)
+
+    method.__name__ = name
+    method.__doc__ = getattr(DataStore, name).__doc__
+    return method
+
+
+for _name in STORE_METHODS:
+    setattr(AsyncDataStore, _name, _async_method(_name))
+    setattr(ThreadedStore, _name, _async_method(_name))
@@ -0,0 +1,161 @@
+# app/events.py
+# Лента изменений для /api/events (Server-Sent Events). Записи DataStore приходят через
+# add_change_listener и раздаются подписчикам этого процесса: по занятиям — построчно
+# (create / update / delete со строкой в формате /api/itog), по справочникам и массовым
+# записям (импорт, генератор, удаление справочника) — событие reload для таблицы.
+# Записи других воркеров видны по счётчикам data_version_*: их проверяет фоновый опрос.
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Set
+
+from .models import VERSIONED_TABLES, add_change_listener
+
+log = logging.getLogger(__name__)
+
+EVENTS_QUEUE_MAX = int(os.getenv("EVENTS_QUEUE_MAX", "1000"))
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", "5"))
+# больше строк в одной записи (удаление справочника) — один reload вместо построчных событий
+EVENTS_ROWS_MAX = int(os.getenv("EVENTS_ROWS_MAX", "500"))
+EVENT_FILTERS = ("group_id", "prep_id", "aud_id")
+
+
+def _itog_events(versions: Dict[str, int], itog) -> List[Dict[str, Any]]:
+    if itog is None or len(itog) > EVENTS_ROWS_MAX:
+        return [{"table": "itog", "op": "reload", "version": versions["itog"]}]
+    events = []
+    for old, new in itog:
+        op = "create" if old is None else "delete" if new is None else "update"
+        event = {"table": "itog", "op": op, "version": versions["itog"], "row": new or {"id": old["id"]}}
+        if old is not None:
+            event["old"] = old
+        events.append(event)
+    return events
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    return f"id: {event['id']}\nevent: {event['table']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def parse_event_id(value: Optional[str]) -> Dict[str, int]:
+    """Last-Event-ID -> счётчики таблиц; id события — счётчики всех таблиц через точку."""
+    try:
+        return dict(zip(VERSIONED_TABLES, (int(v) for v in (value or "").split("."))))
+    except ValueError:
+        return {}
+
+
+def missed_events(seen: Dict[str, int], versions: Dict[str, int]) -> List[Dict[str, Any]]:
+    """После переподключения: reload для таблиц, изменившихся с последнего полученного события."""
+    event_id = ".".join(str(versions[t]) for t in VERSIONED_TABLES)
+    return [{"table": t, "op": "reload", "version": versions[t], "id": event_id}
+            for t in VERSIONED_TABLES if versions[t] > seen.get(t, 0)]
+
+
+class Subscription:
+    def __init__(self, filters: Dict[str, str]):
+        self.filters = filters
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=EVENTS_QUEUE_MAX)
+        self.overflow: Optional[Dict[str, Any]] = None
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        if event["table"] != "itog" or event["op"] == "reload" or not self.filters:
+            return True
+        # update, уводящий занятие из группы, тоже нужен её подписчикам — чтобы убрать строку
+        rows = [event.get("old") or {}, event["row"]]
+        return any(r.get(k) == v for r in rows for k, v in self.filters.items())
+
+    def put(self, event: Dict[str, Any]) -> None:
+        if self.overflow is not None:
+            self.overflow["id"] = event["id"]
+            return
+        if not self.matches(event):
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # клиент не успевает: вместо потерянных строк — одна перезагрузка всех таблиц
+            self.overflow = {"table": "*", "op": "reload", "version": event["version"], "id": event["id"]}
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        if self.overflow is not None and self.queue.empty():
+            event, self.overflow = self.overflow, None
+            return event
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBus:
+    def __init__(self):
+        self._subscribers: Set[Subscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._versions: Dict[str, int] = {}
+        self._poller: Optional[asyncio.Task] = None
+
+    def subscribe(self, filters: Optional[Dict[str, Any]] = None, versions=None) -> Subscription:
+        """Вызывается из event loop приложения; versions — текущие счётчики для фонового опроса."""
+        self._loop = asyncio.get_running_loop()
+        for table, version in (versions or {}).items():
+            self._versions[table] = max(self._versions.get(table, 0), version)
+        sub = Subscription({k: str(v) for k, v in (filters or {}).items() if k in EVENT_FILTERS and v})
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        self._subscribers.discard(sub)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def _dispatch(self, events: List[Dict[str, Any]]) -> None:
+        for event in events:
+            self._versions[event["table"]] = max(self._versions.get(event["table"], 0), event["version"])
+            event["id"] = ".".join(str(self._versions.get(t, 0)) for t in VERSIONED_TABLES)
+            for sub in list(self._subscribers):
+                sub.put(event)
+
+    def publish(self, events: List[Dict[str, Any]]) -> None:
+        # пишут и из пула потоков, и из event loop — раздаём всегда в loop
+        loop = self._loop
+        if loop is None or loop.is_closed() or not self._subscribers:
+            return
+        try:
+            loop.call_soon_threadsafe(self._dispatch, events)
+        except RuntimeError:
+            pass
+
+    def on_change(self, tables, versions: Dict[str, int], itog, started=None) -> None:
+        events = []
+        for table in tables:
+            if table == "itog":
+                events.extend(_itog_events(versions, itog))
+            else:
+                events.append({"table": table, "op": "reload", "version": versions[table]})
+        self.publish(events)
+
+    def start_polling(self, read_versions) -> None:
+        """Опрос счётчиков для записей других воркеров; один на процесс, пока есть подписчики."""
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.get_running_loop().create_task(self._poll(read_versions))
+
+    async def _poll(self, read_versions) -> None:
+        while self._subscribers:
+            await asyncio.sleep(EVENTS_POLL_INTERVAL)
+            try:
+                versions = await read_versions()
+            except Exception:
+                log.exception("events: reading table versions failed")
+                continue
+            # свои записи уже разосланы построчно и учтены в _versions
+            self._dispatch([{"table": t, "op": "reload", "version": v}
+                            for t, v in versions.items() if v > self._versions.get(t, 0)])
+
+
+# ----------------- singleton -----------------
+events = EventBus()
+add_change_listener(events.on_change)
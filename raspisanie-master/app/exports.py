@@ -0,0 +1,361 @@
+# app/exports.py
+# Содержимое экспортов. Функции отдают байты или итераторы байтов и не зависят от FastAPI.
+import io
+import logging
+import os
+import re
+import threading
+import zipfile
+from datetime import date
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+from xml.sax.saxutils import escape
+
+from .models import store
+from .workload import workload, workload_rows
+from .xlsx_stream import (
+    _INVALID_XML, XlsxStreamWriter, STYLE_TITLE, STYLE_CENTER, STYLE_HEADING, STYLE_CELL, STYLE_HEADER_CELL, styled
+)
+
+log = logging.getLogger(__name__)
+
+# ----------------- Excel: распределение нагрузки -----------------
+EXCEL_FILENAME = "Распределение_учебной_нагрузки_преподавателей.xlsx"
+EXCEL_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+EXCEL_SHEET = "Нагрузка преподавателей"
+EXCEL_HEADERS = ["№", "ФИО преподавателя", "Должность", "Дисциплина", "Кол-во часов", "Группа", "Аудитория",
+                 "Всего часов"]
+EXCEL_COL_WIDTHS = [6, 32, 16, 30, 14, 14, 12, 14]
+EXCEL_TITLE = [
+    ("МИНИСТЕРСТВО ОБРАЗОВАНИЯ МОСКОВСКОЙ ОБЛАСТИ", STYLE_TITLE),
+    ("ГОСУДАРСТВЕННОЕ ОБРАЗОВАТЕЛЬНОЕ УЧРЕЖДЕНИЕ ВЫСШЕГО", STYLE_CENTER),
+    ("ОБРАЗОВАНИЯ МОСКОВСКОЙ ОБЛАСТИ", STYLE_CENTER),
+    ("«ГОСУДАРСТВЕННЫЙ ГУМАНИТАРНО-ТЕХНОЛОГИЧЕСКИЙ УНИВЕРСИТЕТ»", STYLE_CENTER),
+    ("(ГГТУ)", STYLE_CENTER),
+    ("ЛИКИНО-ДУЛЕВСКИЙ ПОЛИТЕХНИЧЕСКИЙ КОЛЛЕДЖ – ФИЛИАЛ ГГТУ", STYLE_CENTER),
+    ("РАСПРЕДЕЛЕНИЕ УЧЕБНОЙ НАГРУЗКИ ПРЕПОДАВАТЕЛЕЙ", STYLE_HEADING),
+]
+
+
+def excel_rows(date_from: Optional[str] = None, date_to: Optional[str] = None) -> Iterator[List[Any]]:
+    for text, style in EXCEL_TITLE:
+        yield [(text, style)]
+    yield styled(EXCEL_HEADERS, STYLE_HEADER_CELL)
+
+    # строка на (преподаватель, дисциплина, группа); часы — из агрегата в БД
+    rows = workload_rows(workload.counts(date_from, date_to))
+    for n, r in enumerate(rows, 1):
+        yield styled([
+            n, r["prep"], "Преподаватель", r["object"], r["hours"], r["group"], r["auditorii"], r["total_hours"],
+        ], STYLE_CELL)
+    if not rows:
+        yield styled([1, "Нет данных", "", "", 0, "", "", 0], STYLE_CELL)
+
+
+def excel_stream(date_from: Optional[str] = None, date_to: Optional[str] = None) -> Iterator[bytes]:
+    writer = XlsxStreamWriter(
+        EXCEL_SHEET,
+        col_widths=EXCEL_COL_WIDTHS,
+        merges=[f"A{i}:H{i}" for i in range(1, len(EXCEL_TITLE) + 1)],
+    )
+    return writer.stream(excel_rows(date_from, date_to))
+
+
+# ----------------- Word: расписание группы -----------------
+# Документ-шаблон собирается python-docx один раз; строки таблицы потом
+# размножаются строковой подстановкой в document.xml, без add_row().cells на каждое занятие.
+WORD_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+WORD_HEADERS = ["Дата", "Время", "Дисциплина", "Преподаватель", "Аудитория", "Тип занятия"]
+WORD_FIELDS = ["date", "time", "object_id", "group_id", "prep_id", "aud_id", "type"]
+
+_word_template: Optional[Tuple[Dict[str, bytes], str, List[Union[str, int]], str]] = None
+_word_template_lock = threading.Lock()
+_CELL_PLACEHOLDER = re.compile(r"\{\{C(\d)\}\}")
+
+
+def _build_word_template() -> Tuple[Dict[str, bytes], str, List[Union[str, int]], str]:
+    from docx import Document
+    from docx.shared import Pt
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+    doc = Document()
+    title = doc.add_paragraph()
+    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    run = title.add_run("МИНИСТЕРСТВО ОБРАЗОВАНИЯ МОСКОВСКОЙ ОБЛАСТИ\n")
+    run.bold = True
+    run.font.size = Pt(12)
+    title.add_run("ГОСУДАРСТВЕННОЕ ОБРАЗОВАТЕЛЬНОЕ УЧРЕЖДЕНИЕ ВЫСШЕГО\n").bold = True
+    title.add_run("ОБРАЗОВАНИЯ МОСКОВСКОЙ ОБЛАСТИ\n").bold = True
+    title.add_run("«ГОСУДАРСТВЕННЫЙ ГУМАНИТАРНО-ТЕХНОЛОГИЧЕСКИЙ УНИВЕРСИТЕТ»\n").bold = True
+    title.add_run("(ГГТУ)\n").bold = True
+    title.add_run("ЛИКИНО-ДУЛЕВСКИЙ ПОЛИТЕХНИЧЕСКИЙ КОЛЛЕДЖ – ФИЛИАЛ ГГТУ\n").bold = True
+
+    doc_title = doc.add_paragraph()
+    doc_title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    title_run = doc_title.add_run("РАСПИСАНИЕ ЗАНЯТИЙ ГРУППЫ {{GROUP}}\n")
+    title_run.bold = True
+    title_run.font.size = Pt(14)
+    doc_title.add_run("{{PERIOD}}").bold = True
+
+    table = doc.add_table(rows=2, cols=len(WORD_HEADERS))
+    table.style = 'Table Grid'
+    for i, h in enumerate(WORD_HEADERS):
+        cell = table.rows[0].cells[i]
+        cell.text = h
+        cell.paragraphs[0].runs[0].bold = True
+        cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
+        data_cell = table.rows[1].cells[i]
+        data_cell.text = "{{C%d}}" % i
+        data_cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    doc.add_paragraph("\n")
+    signatures = doc.add_paragraph()
+    signatures.alignment = WD_ALIGN_PARAGRAPH.LEFT
+    signatures.add_run("Составил: __________________ /____________________/\n").bold = True
+    signatures.add_run("Проверил: __________________ /____________________/\n").bold = True
+    signatures.add_run("Утвердил: __________________ /____________________/").bold = True
+
+    buf = io.BytesIO()
+    doc.save(buf)
+    with zipfile.ZipFile(io.BytesIO(buf.getvalue())) as zf:
+        parts = {name: zf.read(name) for name in zf.namelist()}
+    xml = parts["word/document.xml"].decode("utf-8")
+    marker = xml.index("{{C0}}")
+    row_start = xml.rindex("<w:tr", 0, marker)
+    row_end = xml.index("</w:tr>", marker) + len("</w:tr>")
+    # строка-шаблон: чередование литералов и номеров ячеек
+    pieces: List[Union[str, int]] = []
+    for i, piece in enumerate(_CELL_PLACEHOLDER.split(xml[row_start:row_end])):
+        pieces.append(int(piece) if i % 2 else piece)
+    return parts, xml[:row_start], pieces, xml[row_end:]
+
+
+def _word_parts():
+    global _word_template
+    if _word_template is None:
+        with _word_template_lock:
+            if _word_template is None:
+                _word_template = _build_word_template()
+    return _word_template
+
+
+def _xml_text(value: Any) -> str:
+    return escape(_INVALID_XML.sub("", str(value))) if value is not None else ""
+
+
+def word_document(group: Optional[str] = None, date_start: Optional[str] = None,
+                  date_end: Optional[str] = None) -> Tuple[bytes, str]:
+    """Расписание группы в DOCX: (байты, имя файла)."""
+    filters = {"group_name": group, "date_from": date_start, "date_to": date_end}
+    itogs = store.list_itog(filters={k: v for k, v in filters.items() if v}, fields=WORD_FIELDS)
+    objs = store.ref_names("objects")
+    preps = store.ref_names("preps")
+    auds = store.ref_names("auditorii")
+
+    group_name = group
+    if not group_name and itogs:
+        group_name = store.ref_names("groups").get(itogs[0]["group_id"], "ГРУППА")
+
+    dates = [r["date"] for r in itogs if r["date"]]
+    if dates:
+        period_text = f' с "{min(dates)}" по "{max(dates)}" {date.today().year} г.\n'
+    else:
+        period_text = f'на {date.today().year} учебный год\n'
+
+    parts, head, row_pieces, tail = _word_parts()
+    out = [head.replace("{{GROUP}}", _xml_text(group_name)).replace("{{PERIOD}}", _xml_text(period_text))]
+    for r in itogs:
+        cells = (
+            _xml_text(r["date"] or ""),
+            _xml_text(r["time"] or ""),
+            _xml_text(objs.get(r["object_id"], "")),
+            _xml_text(preps.get(r["prep_id"], "")),
+            _xml_text(auds.get(r["aud_id"], "")),
+            _xml_text(r["type"] or ""),
+        )
+        out.extend(cells[p] if isinstance(p, int) else p for p in row_pieces)
+    out.append(tail)
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, data in parts.items():
+            zf.writestr(name, "".join(out).encode("utf-8") if name == "word/document.xml" else data)
+    return buf.getvalue(), f"Расписание_занятий_группы_{group_name}.docx"
+
+
+# ----------------- PDF: приказ об утверждении расписания -----------------
+# (обычный, жирный): TTF с кириллицей; Arial.ttf в регулярном начертании годится и для жирного
+PDF_FONT_PATHS = [
+    ("C:/Windows/Fonts/arial.ttf", "C:/Windows/Fonts/arialbd.ttf"),
+    ("C:/Windows/Fonts/arialuni.ttf", None),
+    ("/usr/share/fonts/truetype/msttcorefonts/Arial.ttf", "/usr/share/fonts/truetype/msttcorefonts/Arial_Bold.ttf"),
+    ("/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+     "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf"),
+    ("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"),
+]
+_pdf_fonts: Optional[Tuple[str, str]] = None
+
+
+def _register_pdf_fonts() -> Tuple[str, str]:
+    """Имена шрифтов (обычный, жирный); регистрируются один раз на процесс (в т.ч. воркер экспорта).
+
+    Без TTF остаются встроенные Helvetica: документ собирается, но кириллица в нём не видна.
+    """
+    global _pdf_fonts
+    if _pdf_fonts is not None:
+        return _pdf_fonts
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    _pdf_fonts = ("Helvetica", "Helvetica-Bold")
+    for regular, bold in PDF_FONT_PATHS:
+        if not os.path.exists(regular):
+            continue
+        try:
+            pdfmetrics.registerFont(TTFont("Arial", regular))
+            pdfmetrics.registerFont(TTFont("Arial-Bold", bold if bold and os.path.exists(bold) else regular))
+        except Exception:
+            log.warning("cannot register PDF font %s", regular, exc_info=True)
+            continue
+        _pdf_fonts = ("Arial", "Arial-Bold")
+        break
+    else:
+        log.warning("no TTF font with Cyrillic found, PDF falls back to Helvetica")
+    return _pdf_fonts
+
+
+def pdf_document() -> Tuple[bytes, str]:
+    """Приказ в PDF: (байты, имя файла)."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    font, font_bold = _register_pdf_fonts()
+    itogs = store.list_itog(fields=["date"])
+    groups = store.list_groups()
+    preps = store.list_preps()
+
+    current_year = date.today().year
+    if itogs:
+        dates = [r.get("date") for r in itogs if r.get("date")]
+        if dates:
+            min_date = min(dates)
+            month = int(min_date.split('-')[1]) if '-' in min_date else date.today().month
+            semester = "осенний" if 9 <= month <= 12 else "весенний"
+            academic_year = f"{current_year}/{current_year + 1}" if semester == "осенний" else f"{current_year - 1}/{current_year}"
+        else:
+            semester = "осенний"
+            academic_year = f"{current_year}/{current_year + 1}"
+    else:
+        semester = "осенний"
+        academic_year = f"{current_year}/{current_year + 1}"
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+    width, height = A4
+    c.setFont(font, 12)
+
+    left_margin = 50
+    top_margin = height - 50
+    line_height = 20
+    small_line_height = 16
+    current_y = top_margin
+
+    c.setFont(font_bold, 14)
+    c.drawCentredString(width / 2, current_y, "МИНИСТЕРСТВО ОБРАЗОВАНИЯ МОСКОВСКОЙ ОБЛАСТИ")
+    current_y -= line_height * 1.5
+    c.setFont(font_bold, 12)
+    c.drawCentredString(width / 2, current_y, "ГОСУДАРСТВЕННОЕ ОБРАЗОВАТЕЛЬНОЕ УЧРЕЖДЕНИЕ")
+    current_y -= line_height
+    c.drawCentredString(width / 2, current_y, "ВЫСШЕГО ОБРАЗОВАНИЯ МОСКОВСКОЙ ОБЛАСТИ")
+    current_y -= line_height
+    c.drawCentredString(width / 2, current_y, "«ГОСУДАРСТВЕННЫЙ ГУМАНИТАРНО-ТЕХНОЛОГИЧЕСКИЙ УНИВЕРСИТЕТ»")
+    current_y -= line_height
+    c.drawCentredString(width / 2, current_y, "(ГГТУ)")
+    current_y -= line_height
+    c.drawCentredString(width / 2, current_y, "ЛИКИНО-ДУЛЕВСКИЙ ПОЛИТЕХНИЧЕСКИЙ КОЛЛЕДЖ – ФИЛИАЛ ГГТУ")
+    current_y -= line_height * 2
+
+    c.setFont(font_bold, 16)
+    c.drawCentredString(width / 2, current_y, "ПРИКАЗ")
+    current_y -= line_height * 2
+
+    c.setFont(font, 12)
+    today = date.today()
+    date_str = today.strftime("от «%d» %B %Y г.").replace("January", "января").replace("February", "февраля").replace(
+        "March", "марта").replace("April", "апреля").replace("May", "мая").replace("June", "июня").replace("July",
+                                                                                                           "июля").replace(
+        "August", "августа").replace("September", "сентября").replace("October", "октября").replace("November",
+                                                                                                    "ноября").replace(
+        "December", "декабря")
+
+    c.drawString(left_margin, current_y, date_str)
+    c.drawRightString(width - left_margin, current_y, "№_____")
+    current_y -= line_height * 1.5
+
+    c.drawCentredString(width / 2, current_y, "г. Ликино-Дулёво")
+    current_y -= line_height * 2
+
+    c.setFont(font_bold, 14)
+    c.drawCentredString(width / 2, current_y, "Об утверждении расписания занятий")
+    current_y -= line_height
+    c.drawCentredString(width / 2, current_y, f"на {semester} семестр {academic_year} учебного года")
+    current_y -= line_height * 2
+
+    c.setFont(font, 12)
+    text_lines = [
+        "В целях организации учебного процесса и обеспечения выполнения учебных планов,",
+        "ПРИКАЗЫВАЮ:",
+        "",
+        "1. Утвердить расписание занятий для всех учебных групп колледжа",
+        f"   на {semester} семестр {academic_year} учебного года.",
+        "",
+        "2. Диспетчеру учебной части довести утверждённое расписание до сведения",
+        "   преподавателей и студентов.",
+        "",
+        "3. Контроль за исполнением настоящего приказа возложить на",
+        "   заместителя директора по учебной работе ___________________ /Ф.И.О./",
+        "",
+        "Основание: утверждённый учебный план специальностей."
+    ]
+
+    for line in text_lines:
+        if current_y < 200:
+            c.showPage()
+            current_y = height - 50
+            c.setFont(font, 12)
+        if line.strip() == "":
+            current_y -= small_line_height / 2
+        else:
+            c.drawString(left_margin, current_y, line)
+            current_y -= small_line_height
+    current_y -= line_height
+
+    if current_y > 250 and itogs and groups and preps:
+        c.setFont(font_bold, 12)
+        c.drawString(left_margin, current_y, "Сведения о расписании:")
+        current_y -= line_height
+        c.setFont(font, 10)
+        stats_lines = [
+            f"• Количество учебных групп: {len(groups)}",
+            f"• Количество преподавателей: {len(preps)}",
+            f"• Общее количество занятий: {len(itogs)}",
+        ]
+        if dates:
+            stats_lines.append(f"• Период действия: с {min(dates)} по {max(dates)}")
+        for line in stats_lines:
+            if current_y < 180: break
+            c.drawString(left_margin + 10, current_y, line)
+            current_y -= small_line_height
+        current_y -= line_height
+
+    if current_y < 150:
+        c.showPage()
+        current_y = height - 100
+
+    c.setFont(font, 12)
+    c.drawString(left_margin, current_y, "Директор колледжа")
+    c.drawString(left_margin + 170, current_y, "_____________________")
+    c.drawString(left_margin + 320, current_y, "/Петров Р.М./")
+
+    c.save()
+    filename = f"Приказ_об_утверждении_расписания_{semester}_семестр_{academic_year}.pdf"
+    return buf.getvalue(), filename
@@ -0,0 +1,465 @@
+# app/generator.py
+# Генератор расписания: по требованиям (группа, дисциплина, преподаватель, часы), аудиториям
+# и сетке слотов строит занятия без накладок по группе, преподавателю и аудитории.
+# Недели решаются независимо и параллельно в пуле процессов; внутри недели — жадная
+# расстановка «самые загруженные первыми» с ремонтом перестановкой и перезапусками с другим
+# seed до исчерпания бюджета времени. Результат пишется в Itog одним COPY (copy_itog_rows);
+# перед записью слоты блокируются и сверяются заново — занятия, добавленные за время решения,
+# выигрывают, а совпавшие с ними строки генератора уходят в unplaced.
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from .importer import copy_itog_rows
+from .models import Itog, lock_itog_slots, session_scope, store
+from .workload import LESSON_HOURS
+
+log = logging.getLogger(__name__)
+
+GENERATOR_WORKERS = int(os.getenv("GENERATOR_WORKERS", str(os.cpu_count() or 1)))
+GENERATOR_MAX_BUDGET = float(os.getenv("GENERATOR_MAX_BUDGET", "600"))
+GENERATOR_MP_CONTEXT = os.getenv("GENERATOR_MP_CONTEXT", "spawn")
+GENERATOR_KEEP_JOBS = 20
+
+# занятие недели: (индекс требования, группа, преподаватель)
+Lesson = Tuple[int, int, Optional[int]]
+
+
+class GeneratorBusy(RuntimeError):
+    pass
+
+
+# ----------------- Решатель одной недели (выполняется в воркере) -----------------
+_progress_queue = None
+_cancel_event = None
+
+
+def _worker_init(progress, cancel) -> None:
+    global _progress_queue, _cancel_event
+    _progress_queue, _cancel_event = progress, cancel
+
+
+def _report(week: int, placed: int) -> None:
+    if _progress_queue is not None:
+        try:
+            _progress_queue.put_nowait((week, placed))
+        except Exception:
+            pass
+
+
+def _out_of_time(deadline: float) -> bool:
+    return time.time() >= deadline or (_cancel_event is not None and _cancel_event.is_set())
+
+
+class _WeekSolver:
+    """Состояние расстановки одной недели: кто занят в каком слоте."""
+
+    def __init__(self, lessons: List[Lesson], objects: List[int], slot_days: List[int], rooms: List[int],
+                 busy: Dict[str, Set[Tuple[int, int]]], rng: random.Random):
+        self.lessons = lessons
+        self.objects = objects
+        self.slot_days = slot_days
+        self.rng = rng
+        self.group_at: Dict[Tuple[int, int], int] = {}  # (группа, слот) -> занятие
+        self.prep_at: Dict[Tuple[int, int], int] = {}
+        self.room_at: Dict[Tuple[int, int], int] = {}
+        self.fixed_groups = busy["group"]
+        self.fixed_preps = busy["prep"]
+        self.free_rooms = [[r for r in rooms if (r, s) not in busy["aud"]] for s in range(len(slot_days))]
+        self.day_load: Dict[Tuple[int, int], int] = {}  # (группа, день) -> занятий
+        self.day_objects: Dict[Tuple[int, int, int], int] = {}  # (группа, дисциплина, день) -> занятий
+        self.assigned: Dict[int, Tuple[int, int]] = {}  # занятие -> (слот, аудитория)
+
+    def _group_free(self, g: int, s: int) -> bool:
+        return (g, s) not in self.group_at and (g, s) not in self.fixed_groups
+
+    def _prep_free(self, p: Optional[int], s: int) -> bool:
+        return p is None or ((p, s) not in self.prep_at and (p, s) not in self.fixed_preps)
+
+    def feasible(self, i: int, s: int) -> bool:
+        _, g, p = self.lessons[i]
+        return bool(self.free_rooms[s]) and self._group_free(g, s) and self._prep_free(p, s)
+
+    def score(self, i: int, s: int) -> float:
+        # меньше — лучше: равномерно по дням и не больше одной пары дисциплины в день
+        req, g, _ = self.lessons[i]
+        day = self.slot_days[s]
+        same = self.day_objects.get((g, self.objects[req], day), 0)
+        return self.day_load.get((g, day), 0) * 2 + same * 5 + self.rng.random()
+
+    def place(self, i: int, s: int) -> None:
+        req, g, p = self.lessons[i]
+        room = self.free_rooms[s].pop()
+        day = self.slot_days[s]
+        self.group_at[(g, s)] = i
+        if p is not None:
+            self.prep_at[(p, s)] = i
+        self.room_at[(room, s)] = i
+        self.day_load[(g, day)] = self.day_load.get((g, day), 0) + 1
+        key = (g, self.objects[req], day)
+        self.day_objects[key] = self.day_objects.get(key, 0) + 1
+        self.assigned[i] = (s, room)
+
+    def unplace(self, i: int) -> int:
+        req, g, p = self.lessons[i]
+        s, room = self.assigned.pop(i)
+        day = self.slot_days[s]
+        del self.group_at[(g, s)]
+        if p is not None:
+            del self.prep_at[(p, s)]
+        del self.room_at[(room, s)]
+        self.free_rooms[s].append(room)
+        self.day_load[(g, day)] -= 1
+        self.day_objects[(g, self.objects[req], day)] -= 1
+        return s
+
+    def greedy(self, order: List[int]) -> List[int]:
+        unplaced = []
+        slots = range(len(self.slot_days))
+        for i in order:
+            candidates = [s for s in slots if self.feasible(i, s)]
+            if not candidates:
+                unplaced.append(i)
+                continue
+            self.place(i, min(candidates, key=lambda s: self.score(i, s)))
+        return unplaced
+
+    def repair(self, i: int) -> bool:
+        """Ставит i в слот, откуда единственное мешающее занятие переезжает в другой слот."""
+        _, g, p = self.lessons[i]
+        slots = list(range(len(self.slot_days)))
+        self.rng.shuffle(slots)
+        for s in slots:
+            if (g, s) in self.fixed_groups or (p is not None and (p, s) in self.fixed_preps):
+                continue
+            blockers = {self.group_at.get((g, s)), self.prep_at.get((p, s)) if p is not None else None} - {None}
+            if len(blockers) != 1:
+                continue
+            (b,) = blockers
+            old = self.unplace(b)
+            if self.feasible(i, s):
+                self.place(i, s)
+                moved = [t for t in range(len(self.slot_days)) if t != old and self.feasible(b, t)]
+                if moved:
+                    self.place(b, min(moved, key=lambda t: self.score(b, t)))
+                    return True
+                self.unplace(i)
+            self.place(b, old)
+        return False
+
+
+def solve_week(week: int, lessons: List[Lesson], objects: List[int], slot_days: List[int], rooms: List[int],
+               busy: Dict[str, Set[Tuple[int, int]]], seed: int, deadline: float) -> Dict[str, Any]:
+    """Лучшая найденная расстановка недели к deadline (time.time()): перезапуски с новым seed."""
+    rng = random.Random(seed)
+    # сначала занятия самых загруженных преподавателей и групп
+    prep_load: Dict[Optional[int], int] = {}
+    group_load: Dict[int, int] = {}
+    for _, g, p in lessons:
+        prep_load[p] = prep_load.get(p, 0) + 1
+        group_load[g] = group_load.get(g, 0) + 1
+    best, restarts = None, 0
+    while True:
+        restarts += 1
+        solver = _WeekSolver(lessons, objects, slot_days, rooms, busy, rng)
+        order = sorted(range(len(lessons)), key=lambda i: (
+            -prep_load[lessons[i][2]] if lessons[i][2] is not None else 0,
+            -group_load[lessons[i][1]], rng.random(),
+        ))
+        unplaced = solver.greedy(order)
+        for _ in range(3):
+            if not unplaced or _out_of_time(deadline):
+                break
+            unplaced = [i for i in unplaced if not solver.repair(i)]
+        if best is None or len(unplaced) < len(best["unplaced"]):
+            best = {"assigned": dict(solver.assigned), "unplaced": unplaced}
+        _report(week, len(lessons) - len(best["unplaced"]))
+        if not best["unplaced"] or _out_of_time(deadline):
+            break
+    return {"week": week, "assigned": best["assigned"], "unplaced": best["unplaced"], "restarts": restarts}
+
+
+# ----------------- Постановка задачи -----------------
+def _weeks(date_from: date, date_to: date, weekdays: List[int]) -> List[List[date]]:
+    """Учебные дни периода, сгруппированные по неделям."""
+    weeks: Dict[date, List[date]] = {}
+    d = date_from
+    while d <= date_to:
+        if d.weekday() in weekdays:
+            weeks.setdefault(d - timedelta(days=d.weekday()), []).append(d)
+        d += timedelta(days=1)
+    return [weeks[k] for k in sorted(weeks)]
+
+
+def _spread(n: int, parts: int, offset: int = 0) -> List[int]:
+    """n поровну на parts; остаток — на недели начиная с offset, чтобы не копился в первых."""
+    return [n // parts + (1 if (w - offset) % parts < n % parts else 0) for w in range(parts)]
+
+
+def _period(params: Dict[str, Any]) -> Tuple[date, date]:
+    date_from = date.fromisoformat(params["date_from"])
+    date_to = date.fromisoformat(params["date_to"])
+    if date_to < date_from:
+        raise ValueError("date_to раньше date_from")
+    return date_from, date_to
+
+
+def build_problem(params: Dict[str, Any], rooms: List[Any], existing: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Проверка входа и разбиение на недели; ValueError — ошибка во входных данных.
+
+    existing — уже стоящие занятия периода (date, time, group_id, prep_id, aud_id).
+    """
+    date_from, date_to = _period(params)
+    times = list(dict.fromkeys(params["times"]))
+    weekdays = params.get("weekdays") or [0, 1, 2, 3, 4]
+    if not times or not all(0 <= d <= 6 for d in weekdays):
+        raise ValueError("нужны times и weekdays от 0 (пн) до 6 (вс)")
+    budget = min(float(params.get("time_budget") or 60), GENERATOR_MAX_BUDGET)
+    rooms = [int(r) for r in rooms]
+    if not rooms:
+        raise ValueError("нет аудиторий")
+    weeks = _weeks(date_from, date_to, weekdays)
+    if not weeks:
+        raise ValueError("в периоде нет учебных дней")
+    requirements = params["requirements"]
+    for r in requirements:
+        if not r.get("group_id") or not r.get("hours") or int(r["hours"]) <= 0:
+            raise ValueError("у каждого требования нужны group_id и hours > 0")
+
+    # занятия требования (часы / LESSON_HOURS) делятся между неделями поровну
+    week_lessons: List[List[Lesson]] = [[] for _ in weeks]
+    for k, r in enumerate(requirements):
+        count = math.ceil(int(r["hours"]) / LESSON_HOURS)
+        prep = int(r["prep_id"]) if r.get("prep_id") else None
+        for w, n in enumerate(_spread(count, len(weeks), k)):
+            week_lessons[w].extend([(k, int(r["group_id"]), prep)] * n)
+
+    # уже стоящие занятия периода занимают свои слоты
+    weeks_data = []
+    for w, days in enumerate(weeks):
+        slots = [(d.isoformat(), t) for d in days for t in times]
+        index = {slot: s for s, slot in enumerate(slots)}
+        busy: Dict[str, Set[Tuple[int, int]]] = {"group": set(), "prep": set(), "aud": set()}
+        for row in existing:
+            s = index.get((row["date"], row["time"]))
+            if s is None:
+                continue
+            for kind in busy:
+                if row[f"{kind}_id"]:
+                    busy[kind].add((int(row[f"{kind}_id"]), s))
+        weeks_data.append({"slots": slots, "lessons": week_lessons[w], "busy": busy,
+                           "slot_days": [days.index(date.fromisoformat(d)) for d, _ in slots]})
+    return {"weeks": weeks_data, "rooms": rooms, "budget": budget, "requirements": requirements,
+            "objects": [int(r["object_id"]) if r.get("object_id") else 0 for r in requirements]}
+
+
+def drop_taken(db, placed: List[Tuple[int, Tuple[Any, ...]]]) -> Tuple[List[Tuple[int, Tuple[Any, ...]]], List[int]]:
+    """Сверка решения с Itog под блокировками слотов (в транзакции записи).
+
+    placed — пары (индекс требования, строка для COPY). Возвращает строки, которые всё ещё
+    свободны по группе, преподавателю и аудитории, и индексы требований отброшенных строк.
+    """
+    if not placed:
+        return placed, []
+    slots = {(row[0], row[1]) for _, row in placed}
+    lock_itog_slots(db, slots)
+    days = sorted(d for d, _ in slots)
+    query = select(Itog.date, Itog.time, Itog.group_id, Itog.prep_id, Itog.aud_id).where(
+        Itog.date.between(days[0], days[-1]), Itog.time.in_({t for _, t in slots}))
+    busy = set()
+    for d, t, g, p, a in db.execute(query):
+        busy.update((kind, v, d.isoformat(), t) for kind, v in (("group", g), ("prep", p), ("aud", a)) if v)
+    kept, dropped = [], []
+    for req, row in placed:
+        d, t, _, g, p, a, _ = row
+        if any((kind, v, d, t) in busy for kind, v in (("group", g), ("prep", p), ("aud", a)) if v):
+            dropped.append(req)
+        else:
+            kept.append((req, row))
+    return kept, dropped
+
+
+class GeneratorJob:
+    def __init__(self, params: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.status = "queued"  # queued | running | done | failed | cancelled
+        self.error: Optional[str] = None
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.lessons = 0
+        self.placed: Dict[int, int] = {}  # неделя -> лучшее число расставленных среди её seed
+        self.tasks_total = 0
+        self.tasks_done = 0
+        self.inserted = 0
+        self.unplaced: List[Dict[str, Any]] = []
+        self.preview: Optional[List[Dict[str, Any]]] = None
+        self.cancel = threading.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {
+            "id": self.id, "status": self.status, "error": self.error,
+            "elapsed": round((self.finished or time.time()) - self.started, 2),
+            "progress": {
+                "tasks_done": self.tasks_done, "tasks_total": self.tasks_total,
+                "lessons": self.lessons, "placed": sum(self.placed.values()),
+            },
+            "inserted": self.inserted,
+            "unplaced": self.unplaced,
+        }
+        if self.preview is not None:
+            result["preview"] = self.preview
+        return result
+
+
+class ScheduleGenerator:
+    """Одна генерация за раз: оркестратор в фоновом потоке, решатели — в пуле процессов."""
+
+    def __init__(self, workers: int = GENERATOR_WORKERS):
+        self.workers = max(1, workers)
+        self._jobs: Dict[str, GeneratorJob] = {}
+        self._running: Optional[GeneratorJob] = None
+        self._lock = threading.Lock()
+
+    def submit(self, params: Dict[str, Any]) -> GeneratorJob:
+        problem = self.prepare(params)
+        job = GeneratorJob(params)
+        with self._lock:
+            if self._running is not None:
+                raise GeneratorBusy("генерация уже идёт")
+            self._running = job
+            self._jobs[job.id] = job
+            for old in list(self._jobs)[:-GENERATOR_KEEP_JOBS]:
+                del self._jobs[old]
+        threading.Thread(target=self._run, args=(job, problem), name=f"generator-{job.id[:8]}", daemon=True).start()
+        return job
+
+    def get(self, job_id: str) -> Optional[GeneratorJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            job = self._running
+        if job is not None:
+            job.cancel.set()
+
+    @staticmethod
+    def prepare(params: Dict[str, Any]) -> Dict[str, Any]:
+        """Задача по параметрам запроса: аудитории и уже стоящие занятия периода — из БД."""
+        _period(params)
+        rooms = params.get("auditorii") or [a["id"] for a in store.list_aud()]
+        existing = store.list_itog(filters={"date_from": params["date_from"], "date_to": params["date_to"]},
+                                   fields=["date", "time", "group_id", "prep_id", "aud_id"])
+        return build_problem(params, rooms, existing)
+
+    def _run(self, job: GeneratorJob, problem: Dict[str, Any]) -> None:
+        job.status = "running"
+        try:
+            placed = self._solve(job, problem)
+            if job.cancel.is_set():
+                job.status = "cancelled"
+            elif job.params.get("dry_run"):
+                job.preview = [dict(zip(("date", "time", "object_id", "group_id", "prep_id", "aud_id", "type"),
+                                        (str(v) if isinstance(v, int) else v for v in r))) for _, r in placed]
+                job.status = "done"
+            else:
+                # слоты читались в prepare, решение могло идти минуты: сверяемся ещё раз под блокировками
+                with session_scope() as db:
+                    placed, dropped = drop_taken(db, placed)
+                    copy_itog_rows(db, [row for _, row in placed])
+                store.mark_changed("itog")
+                if dropped:
+                    log.warning("generator %s: %d lessons clashed with lessons added meanwhile", job.id, len(dropped))
+                    self._add_unplaced(job, dropped)
+                job.inserted = len(placed)
+                job.status = "done"
+        except Exception as e:
+            log.exception("schedule generation failed")
+            job.status, job.error = "failed", str(e)
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                self._running = None
+
+    def _solve(self, job: GeneratorJob, problem: Dict[str, Any]) -> List[Tuple[int, Tuple[Any, ...]]]:
+        """Пары (индекс требования, строка для COPY) по лучшему решению каждой недели."""
+        weeks = [w for w in problem["weeks"] if w["lessons"]]
+        job.lessons = sum(len(w["lessons"]) for w in weeks)
+        # недель меньше, чем воркеров — на неделю несколько seed, берём лучший
+        seeds = max(1, self.workers // max(1, len(weeks)))
+        tasks = [(w, seed) for w in range(len(weeks)) for seed in range(seeds)]
+        job.tasks_total = len(tasks)
+        deadline = time.time() + problem["budget"]
+        ctx = multiprocessing.get_context(GENERATOR_MP_CONTEXT)
+        progress, cancel = ctx.Queue(), ctx.Event()
+        best: Dict[int, Dict[str, Any]] = {}
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(tasks)), mp_context=ctx,
+                                 initializer=_worker_init, initargs=(progress, cancel)) as pool:
+            pending = {
+                pool.submit(solve_week, w, weeks[w]["lessons"], problem["objects"], weeks[w]["slot_days"],
+                            problem["rooms"], weeks[w]["busy"], seed * 7919 + w, deadline)
+                for w, seed in tasks
+            }
+            while pending and not job.cancel.is_set():
+                done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                self._drain(job, progress)
+                for f in done:
+                    result = f.result()
+                    w = result["week"]
+                    job.tasks_done += 1
+                    if w not in best or len(result["unplaced"]) < len(best[w]["unplaced"]):
+                        best[w] = result
+                    job.placed[w] = len(weeks[w]["lessons"]) - len(best[w]["unplaced"])
+            # отмена: воркеры бросают перебор на ближайшей проверке, незапущенные задачи снимаются
+            if pending:
+                cancel.set()
+                for f in pending:
+                    f.cancel()
+
+        requirements = problem["requirements"]
+        placed, unplaced = [], []
+        for w, result in best.items():
+            week = weeks[w]
+            for i, (s, room) in result["assigned"].items():
+                req, g, p = week["lessons"][i]
+                d, t = week["slots"][s]
+                r = requirements[req]
+                placed.append((req, (d, t, int(r["object_id"]) if r.get("object_id") else None, g, p, room,
+                                     r.get("type"))))
+            unplaced.extend(week["lessons"][i][0] for i in result["unplaced"])
+        self._add_unplaced(job, unplaced)
+        placed.sort(key=lambda x: (x[1][0], x[1][1], x[1][3]))
+        return placed
+
+    @staticmethod
+    def _add_unplaced(job: GeneratorJob, requirements: List[int]) -> None:
+        counts = {u["requirement"]: u["lessons"] for u in job.unplaced}
+        for k in requirements:
+            counts[k] = counts.get(k, 0) + 1
+        job.unplaced = [{"requirement": k, "lessons": n} for k, n in sorted(counts.items())]
+
+    @staticmethod
+    def _drain(job: GeneratorJob, progress) -> None:
+        # промежуточные результаты перезапусков: пока неделя решается, показываем лучший
+        while True:
+            try:
+                week, placed = progress.get_nowait()
+            except queue.Empty:
+                return
+            job.placed[week] = max(job.placed.get(week, 0), placed)
+
+
+# ----------------- singleton -----------------
+generator = ScheduleGenerator()
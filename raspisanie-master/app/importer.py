@@ -0,0 +1,252 @@
+# app/importer.py
+# Массовый импорт занятий из CSV/XLSX: файл читается построчно, названия
+# справочников переводятся в id по словарям в памяти, строки пишутся пачками
+# через COPY в одной транзакции.
+import codecs
+import csv
+import io
+from datetime import date, datetime, time
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from .models import Group, Object, Prepod, Aud, Itog, normalize_search, session_scope, store
+
+IMPORT_BATCH = 5000
+MAX_REPORTED_ERRORS = 1000
+
+# заголовок столбца (после normalize_search) -> поле
+HEADER_ALIASES = {
+    "date": ("дата", "день", "date", "data"),
+    "time": ("время", "time"),
+    "object": ("предмет", "дисциплина", "object", "subject"),
+    "group": ("группа", "group"),
+    "prep": ("преподаватель", "фио преподавателя", "фио", "prep", "teacher"),
+    "aud": ("аудитория", "aud", "room", "auditorium"),
+    "type": ("тип", "тип занятия", "type"),
+}
+_HEADER_MAP = {alias: field for field, aliases in HEADER_ALIASES.items() for alias in aliases}
+
+# поле -> (модель, атрибут с названием, ключ в отчёте)
+REF_FIELDS = {
+    "object": (Object, "name", "objects"),
+    "group": (Group, "name", "groups"),
+    "prep": (Prepod, "fio", "preps"),
+    "aud": (Aud, "number", "auditorii"),
+}
+
+COPY_SQL = 'COPY "Itog" (data, "time", id_obj_fk, id_group_fk, id_prep_fk, id_au_fk, type) FROM STDIN'
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+# ----------------- Чтение файла -----------------
+def _csv_rows(fileobj: BinaryIO, encoding: str) -> Iterator[List[Any]]:
+    text_stream = io.TextIOWrapper(fileobj, encoding=encoding, newline="")
+    first = text_stream.readline()
+    if not first:
+        return
+    # Excel в русской локали сохраняет CSV через «;»
+    delimiter = max((";", ",", "\t"), key=first.count)
+    yield next(csv.reader([first], delimiter=delimiter))
+    yield from csv.reader(text_stream, delimiter=delimiter)
+
+
+def _xlsx_rows(fileobj: BinaryIO) -> Iterator[List[Any]]:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        for row in wb.worksheets[0].iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        wb.close()
+
+
+def iter_rows(fileobj: BinaryIO, filename: str, encoding: str = "utf-8-sig") -> Iterator[List[Any]]:
+    name = (filename or "").lower()
+    if name.endswith(".xlsx") or name.endswith(".xlsm"):
+        return _xlsx_rows(fileobj)
+    if name.endswith(".csv") or name.endswith(".txt"):
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            raise ImportFormatError(f"неизвестная кодировка: {encoding}")
+        return _csv_rows(fileobj, encoding)
+    raise ImportFormatError("поддерживаются только .csv и .xlsx")
+
+
+def _header(row: List[Any]) -> Dict[str, int]:
+    columns = {}
+    for i, cell in enumerate(row):
+        field = _HEADER_MAP.get(normalize_search(str(cell)) if cell is not None else "")
+        if field and field not in columns:
+            columns[field] = i
+    if "date" not in columns or "time" not in columns:
+        raise ImportFormatError("нужны как минимум столбцы «Дата» и «Время»")
+    return columns
+
+
+# ----------------- Разбор значений -----------------
+def _parse_date(value: Any) -> Optional[date]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    s = str(value).strip()
+    try:
+        return date.fromisoformat(s)
+    except ValueError:
+        pass
+    for fmt in ("%d.%m.%Y", "%d.%m.%y", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(s, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"неверная дата: {s}")
+
+
+def _parse_time(value: Any) -> Optional[str]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, (time, datetime)):
+        return value.strftime("%H:%M")
+    s = str(value).strip().replace(".", ":")
+    # H:MM или H:MM:SS (секунды отбрасываем)
+    parts = s.split(":")
+    if len(parts) in (2, 3) and all(p.isdigit() for p in parts):
+        h, m = int(parts[0]), int(parts[1])
+        if h < 24 and m < 60 and (len(parts) == 2 or int(parts[2]) < 60):
+            return f"{h:02d}:{m:02d}"
+    raise ValueError(f"неверное время: {s}")
+
+
+def _cell(row: List[Any], columns: Dict[str, int], field: str) -> Any:
+    i = columns.get(field)
+    if i is None or i >= len(row):
+        return None
+    value = row[i]
+    if isinstance(value, str):
+        value = value.strip()
+    return value if value != "" else None
+
+
+# ----------------- Запись -----------------
+def _load_ref_maps(db: Session) -> Dict[str, Dict[str, int]]:
+    maps = {}
+    for field, (model, attr, _) in REF_FIELDS.items():
+        maps[field] = {normalize_search(name): pk for pk, name in db.query(model.id, getattr(model, attr))}
+    return maps
+
+
+def _copy_value(value: Any) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    s = str(value)
+    return s.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def copy_itog_rows(db: Session, rows: List[Tuple[Any, ...]]) -> None:
+    """Пишет (data, time, obj, group, prep, aud, type) в Itog: COPY для psycopg2, иначе executemany."""
+    if not rows:
+        return
+    dbapi_conn = db.connection().connection.dbapi_connection
+    cursor = dbapi_conn.cursor()
+    if hasattr(cursor, "copy_expert"):
+        buf = io.StringIO()
+        for r in rows:
+            buf.write("\t".join(_copy_value(v) for v in r))
+            buf.write("\n")
+        buf.seek(0)
+        try:
+            cursor.copy_expert(COPY_SQL, buf)
+        finally:
+            cursor.close()
+        return
+    cursor.close()
+    keys = ("date", "time", "object_id", "group_id", "prep_id", "aud_id", "type")
+    db.execute(insert(Itog), [dict(zip(keys, r)) for r in rows])
+
+
+def import_itog(fileobj: BinaryIO, filename: str, create_missing: bool = False,
+                strict: bool = False, encoding: str = "utf-8-sig") -> Dict[str, Any]:
+    try:
+        return _import_rows(iter_rows(fileobj, filename, encoding), create_missing, strict)
+    except UnicodeDecodeError:
+        raise ImportFormatError(f"файл не в кодировке {encoding} (для CSV из Excel попробуйте encoding=cp1251)")
+
+
+def _import_rows(rows: Iterator[List[Any]], create_missing: bool, strict: bool) -> Dict[str, Any]:
+    header = next(rows, None)
+    if header is None:
+        raise ImportFormatError("пустой файл")
+    columns = _header(header)
+
+    errors: List[Dict[str, Any]] = []
+    error_count = 0
+    created = {key: 0 for _, _, key in REF_FIELDS.values()}
+    imported = 0
+    total = 0
+    with session_scope() as db:
+        maps = _load_ref_maps(db)
+        # названия в файле повторяются: кэшируем сырое значение -> id, минуя normalize_search
+        seen: Dict[str, Dict[str, int]] = {field: {} for field in REF_FIELDS}
+        batch: List[Tuple[Any, ...]] = []
+        for line_no, row in enumerate(rows, start=2):
+            if not any(v not in (None, "") for v in row):
+                continue
+            total += 1
+            try:
+                values = [_parse_date(_cell(row, columns, "date")), _parse_time(_cell(row, columns, "time"))]
+                for field, (model, attr, key) in REF_FIELDS.items():
+                    name = _cell(row, columns, field)
+                    if name is None:
+                        values.append(None)
+                        continue
+                    name = str(name)
+                    pk = seen[field].get(name)
+                    if pk is None:
+                        pk = seen[field][name] = maps[field].get(normalize_search(name))
+                    if pk is None:
+                        del seen[field][name]
+                        if not create_missing:
+                            raise ValueError(f"не найдено ({key}): {name}")
+                        ref = model(**{attr: name})
+                        db.add(ref)
+                        db.flush()
+                        pk = maps[field][normalize_search(name)] = seen[field][name] = ref.id
+                        created[key] += 1
+                    values.append(pk)
+                type_val = _cell(row, columns, "type")
+                values.append(str(type_val) if type_val is not None else None)
+            except ValueError as e:
+                error_count += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"row": line_no, "error": str(e)})
+                continue
+            batch.append(tuple(values))
+            if len(batch) >= IMPORT_BATCH:
+                copy_itog_rows(db, batch)
+                imported += len(batch)
+                batch = []
+        if strict and error_count:
+            # всё или ничего: откатываем транзакцию целиком
+            db.rollback()
+            return {"count": 0, "rows": total, "error_count": error_count, "errors": errors,
+                    "created": {key: 0 for key in created}}
+        copy_itog_rows(db, batch)
+        imported += len(batch)
+    # пустой импорт ничего не меняет — версии (и ETag) не трогаем
+    changed = (["itog"] if imported else []) + [key for key, n in created.items() if n]
+    if changed:
+        store.mark_changed(*changed)
+    return {"count": imported, "rows": total, "error_count": error_count, "errors": errors, "created": created}
@@ -0,0 +1,305 @@
+# app/jobs.py
+# Фоновые экспорты: документы собираются в ограниченном пуле процессов, готовые файлы
+# кэшируются на диске по ключу (тип, параметры, версия данных). Повторный экспорт без
+# изменений в расписании отдаётся с диска без пересборки.
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from . import metrics
+from .exports import EXCEL_FILENAME, EXCEL_MEDIA_TYPE, WORD_MEDIA_TYPE
+from .models import data_version
+
+log = logging.getLogger(__name__)
+
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+EXPORT_QUEUE_MAX = int(os.getenv("EXPORT_QUEUE_MAX", "20"))
+EXPORT_CACHE_DIR = Path(os.getenv("EXPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "raspisanie_exports")))
+EXPORT_CACHE_MAX_FILES = int(os.getenv("EXPORT_CACHE_MAX_FILES", "100"))
+EXPORT_JOB_TTL = int(os.getenv("EXPORT_JOB_TTL", "3600"))
+# spawn: воркер не наследует потоки и открытые соединения родителя
+EXPORT_MP_CONTEXT = os.getenv("EXPORT_MP_CONTEXT", "spawn")
+
+# тип -> (допустимые параметры, media type, расширение файла в кэше)
+EXPORT_KINDS: Dict[str, Tuple[Tuple[str, ...], str, str]] = {
+    "excel": (("date_from", "date_to"), EXCEL_MEDIA_TYPE, "xlsx"),
+    "word": (("group", "date_start", "date_end"), WORD_MEDIA_TYPE, "docx"),
+    "pdf": ((), "application/pdf", "pdf"),
+}
+# собираются потоком: при промахе кэша синхронная ссылка отдаёт первые байты сразу
+STREAM_KINDS = ("excel",)
+# параметры-даты уходят в SQL: неверный формат — ошибка запроса (400), а не сбой сборки
+EXPORT_DATE_PARAMS = ("date_from", "date_to", "date_start", "date_end")
+
+
+class ExportQueueFull(RuntimeError):
+    pass
+
+
+# ----------------- Воркер (отдельный процесс) -----------------
+def _worker_init() -> None:
+    # при fork пул соединений родителя использовать нельзя
+    from .models import engine
+    engine.dispose(close=False)
+
+
+def _build(kind: str, params: Dict[str, str], path: str, meta_path: str, meta: Dict[str, Any]) -> None:
+    from . import exports
+
+    started = time.perf_counter()
+    tmp = f"{path}.{os.getpid()}.part"
+    if kind == "excel":
+        with open(tmp, "wb") as f:
+            for chunk in exports.excel_stream(**params):
+                f.write(chunk)
+        filename = exports.EXCEL_FILENAME
+    else:
+        content, filename = exports.word_document(**params) if kind == "word" else exports.pdf_document()
+        with open(tmp, "wb") as f:
+            f.write(content)
+    _commit_file(tmp, path, meta_path, dict(meta, filename=filename), started, str(os.getpid()))
+
+
+def _commit_file(tmp: str, path: str, meta_path: str, meta: Dict[str, Any], started: float,
+                 suffix: str) -> Dict[str, Any]:
+    os.replace(tmp, path)
+    # метаданные пишутся последними: их наличие означает готовый файл
+    meta = dict(meta, size=os.path.getsize(path), seconds=time.perf_counter() - started)
+    with open(f"{meta_path}.{suffix}.part", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(f"{meta_path}.{suffix}.part", meta_path)
+    return meta
+
+
+# ----------------- Задания -----------------
+class ExportJob:
+    def __init__(self, kind: str, params: Dict[str, str], key: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.key = key
+        self.status = "queued"  # queued | running | done | failed
+        self.cached = False
+        self.error: Optional[str] = None
+        self.filename: Optional[str] = None
+        self.size: Optional[int] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.future: Optional[Future] = None
+        self.chunks: Optional[Iterator[bytes]] = None  # сборка потоком в этом процессе (start(sync=True))
+
+    @property
+    def media_type(self) -> str:
+        return EXPORT_KINDS[self.kind][1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        status = self.status
+        if status == "queued" and self.future is not None and self.future.running():
+            status = "running"
+        return {
+            "id": self.id, "kind": self.kind, "params": self.params, "status": status,
+            "cached": self.cached, "filename": self.filename, "size": self.size, "error": self.error,
+        }
+
+
+class ExportJobs:
+    """Очередь экспортов поверх ProcessPoolExecutor (создаётся при первом задании)."""
+
+    def __init__(self, cache_dir: Path = EXPORT_CACHE_DIR, workers: int = EXPORT_WORKERS):
+        self.cache_dir = Path(cache_dir)
+        self.workers = max(1, workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, ExportJob] = {}
+        self._inflight: Dict[str, ExportJob] = {}
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(EXPORT_MP_CONTEXT),
+                initializer=_worker_init,
+            )
+        return self._executor
+
+    @staticmethod
+    def clean_params(kind: str, params: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        if kind not in EXPORT_KINDS:
+            raise ValueError(f"неизвестный тип экспорта: {kind}")
+        allowed = EXPORT_KINDS[kind][0]
+        params = {k: str(v) for k, v in (params or {}).items() if v not in (None, "")}
+        unknown = sorted(set(params) - set(allowed))
+        if unknown:
+            raise ValueError(f"неизвестные параметры для {kind}: {', '.join(unknown)}")
+        for name in EXPORT_DATE_PARAMS:
+            if name in params:
+                try:
+                    date.fromisoformat(params[name])
+                except ValueError:
+                    raise ValueError(f"{name}: ожидается дата YYYY-MM-DD")
+        return params
+
+    @staticmethod
+    def cache_key(kind: str, params: Dict[str, str], version: str) -> str:
+        raw = json.dumps({"kind": kind, "params": params, "version": version}, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def path(self, job: ExportJob) -> Path:
+        return self.cache_dir / f"{job.key}.{EXPORT_KINDS[job.kind][2]}"
+
+    def _meta_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def _read_meta(self, job: ExportJob) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._meta_path(job.key), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if self.path(job).exists() else None
+
+    def prepare(self, kind: str, params: Optional[Dict[str, Any]] = None) -> ExportJob:
+        """Задание с готовым ключом кэша (он же ETag), ещё не поставленное в очередь."""
+        params = self.clean_params(kind, params)
+        return ExportJob(kind, params, self.cache_key(kind, params, data_version()))
+
+    def submit(self, kind: str, params: Optional[Dict[str, Any]] = None) -> ExportJob:
+        return self.start(self.prepare(kind, params))
+
+    def start(self, job: ExportJob, sync: bool = False) -> ExportJob:
+        """Готовый файл из кэша, то же задание в работе или новое задание в пуле.
+
+        sync=True — ответ ждут в том же запросе: попадание в кэш не заводит запись задания,
+        а STREAM_KINDS при промахе собираются здесь же, куски доступны в job.chunks по мере
+        сборки и заодно пишутся в кэш. Такие сборки тоже занимают место в очереди, и
+        одинаковые запросы, пришедшие за время сборки, ждут её job.future.
+        """
+        kind, params = job.kind, job.params
+        stream = sync and kind in STREAM_KINDS
+        meta = self._read_meta(job)
+        with self._lock:
+            self._trim()
+            metrics.export_requests.inc(kind=kind, cached="true" if meta is not None else "false")
+            if meta is not None:
+                job.status, job.cached = "done", True
+                job.filename, job.size, job.finished = meta["filename"], meta["size"], time.time()
+                if not sync:
+                    self._jobs[job.id] = job
+                return job
+            # такой же экспорт уже собирается — отдаём то же задание
+            running = self._inflight.get(job.key)
+            if running is not None:
+                return running
+            if len(self._inflight) >= EXPORT_QUEUE_MAX:
+                raise ExportQueueFull("очередь экспортов заполнена")
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._jobs[job.id] = job
+            self._inflight[job.key] = job
+            if stream:
+                job.status, job.filename, job.future = "running", EXCEL_FILENAME, Future()
+            else:
+                meta = {"kind": kind, "params": params}
+                job.future = self._pool().submit(
+                    _build, kind, params, str(self.path(job)), str(self._meta_path(job.key)), meta
+                )
+        if stream:
+            # первый кусок — здесь же: с запущенного генератора обрыв ответа (GeneratorExit)
+            # снимает задание из очереди, а не-запущенный просто потерялся бы
+            chunks = self._stream(job)
+            try:
+                job.chunks = itertools.chain((next(chunks, b""),), chunks)
+            except Exception:
+                pass  # _stream уже отметил задание failed
+            return job
+        job.future.add_done_callback(partial(self._finished, job))
+        return job
+
+    def _finished(self, job: ExportJob, future: Future) -> None:
+        error = future.exception() if not future.cancelled() else RuntimeError("отменено")
+        meta = self._read_meta(job) if error is None else None
+        with self._lock:
+            self._inflight.pop(job.key, None)
+            job.finished = time.time()
+            if meta is None:
+                job.status, job.error = "failed", str(error or "файл экспорта не найден")
+                log.error("export %s %s failed: %s", job.kind, job.params, job.error)
+                return
+            job.status, job.filename, job.size = "done", meta["filename"], meta["size"]
+        self._built(job, meta)
+
+    def _stream(self, job: ExportJob) -> Iterator[bytes]:
+        from . import exports
+
+        started = time.perf_counter()
+        tmp = f"{self.path(job)}.{job.id}.part"
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in exports.excel_stream(**job.params):
+                    f.write(chunk)
+                    yield chunk
+            meta = _commit_file(tmp, str(self.path(job)), str(self._meta_path(job.key)),
+                                {"kind": job.kind, "params": job.params, "filename": job.filename}, started, job.id)
+        except BaseException as e:
+            # в том числе обрыв соединения (GeneratorExit): недописанный файл в кэш не попадает
+            with self._lock:
+                self._inflight.pop(job.key, None)
+                job.status, job.error, job.finished = "failed", str(e) or type(e).__name__, time.time()
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            job.future.set_exception(e if isinstance(e, Exception) else RuntimeError(job.error))
+            raise
+        with self._lock:
+            self._inflight.pop(job.key, None)
+            job.status, job.size, job.finished = "done", meta["size"], time.time()
+        job.future.set_result(None)
+        self._built(job, meta)
+
+    def _built(self, job: ExportJob, meta: Dict[str, Any]) -> None:
+        metrics.export_seconds.observe(meta.get("seconds", 0.0), kind=job.kind)
+        metrics.export_bytes.observe(meta["size"], kind=job.kind)
+        self._evict()
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _trim(self) -> None:
+        # под self._lock: забываем давно завершённые задания (файлы остаются в кэше)
+        deadline = time.time() - EXPORT_JOB_TTL
+        for job_id in [j.id for j in self._jobs.values() if j.finished and j.finished < deadline]:
+            del self._jobs[job_id]
+
+    def _evict(self) -> None:
+        try:
+            metas = sorted(self.cache_dir.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        except OSError:
+            return
+        for meta_path in metas[EXPORT_CACHE_MAX_FILES:]:
+            for path in self.cache_dir.glob(f"{meta_path.stem}.*"):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+export_jobs = ExportJobs()
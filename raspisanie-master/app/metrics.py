@@ -0,0 +1,232 @@
+# app/metrics.py
+# Метрики в текстовом формате Prometheus (/metrics) без сторонних пакетов: время ответа по
+# маршрутам, число SQL-запросов и время в БД на запрос (события движка SQLAlchemy), время
+# сборки и размер экспортов. Счётчики — в памяти процесса: при нескольких воркерах uvicorn
+# каждый отдаёт свои, суммирует Prometheus.
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500, 1000)
+SIZE_BUCKETS = (1e4, 1e5, 1e6, 1e7, 1e8)
+# долгоживущие ответы: их «время ответа» — время соединения, в гистограмме оно только мешает
+SKIP_ROUTES = {"/api/events"}
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # метки -> [счётчики по корзинам (не накопительные), сумма, число]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = next((i for i, b in enumerate(self.buckets) if value <= b), len(self.buckets))
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return entry[2] if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        lines = []
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = 'le="%s"' % ("+Inf" if bound == float("inf") else _number(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Значение считается при каждом чтении /metrics."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]):
+        super().__init__(name, help)
+        self.fn = fn
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {_number(self.fn())}"]
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render() -> str:
+    return "\n".join(m.render() for m in REGISTRY) + "\n"
+
+
+# ----------------- метрики приложения -----------------
+http_requests = Counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_duration = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+request_queries = Histogram("http_request_db_queries", "SQL statements per HTTP request", ("method", "route"),
+                            QUERY_COUNT_BUCKETS)
+request_db_seconds = Histogram("http_request_db_seconds", "Time spent in SQL per HTTP request", ("method", "route"))
+db_queries = Counter("db_queries_total", "SQL statements executed, including background work")
+db_seconds = Counter("db_query_seconds_total", "Time spent executing SQL statements")
+export_seconds = Histogram("export_build_seconds", "Export document build time", ("kind",))
+export_bytes = Histogram("export_size_bytes", "Export document size", ("kind",), SIZE_BUCKETS)
+export_requests = Counter("export_requests_total", "Export requests by kind and disk cache hit", ("kind", "cached"))
+
+
+# ----------------- SQL: события движка -----------------
+# [число запросов, секунд в БД] текущего HTTP-запроса; пул потоков получает копию контекста,
+# поэтому запросы из run_in_threadpool попадают в тот же список
+_request_db: ContextVar[Optional[list]] = ContextVar("request_db", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # контекст выполнения — свой на каждый запрос; при ошибке after_cursor_execute не придёт
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    db_queries.inc()
+    db_seconds.inc(elapsed)
+    stats = _request_db.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+
+
+def instrument_engine(engine) -> None:
+    """Подключает счётчики SQL к синхронному Engine (для AsyncEngine — к его .sync_engine)."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# ----------------- HTTP: ASGI middleware -----------------
+def _route_templates(app) -> Dict[object, str]:
+    # шаблон пути вместо фактического (/api/groups/{id_group}), иначе у метрик бесконечно меток
+    templates = {}
+    for route in app.routes:
+        endpoint = getattr(route, "endpoint", None) or getattr(route, "app", None)
+        if endpoint is not None:
+            templates.setdefault(endpoint, route.path)
+    return templates
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._templates: Optional[Dict[object, str]] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        stats = [0, 0.0]
+        token = _request_db.set(stats)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_db.reset(token)
+            self._record(scope, status[0], elapsed, stats)
+
+    def _record(self, scope, status: int, elapsed: float, stats: list) -> None:
+        if self._templates is None and "app" in scope:
+            self._templates = _route_templates(scope["app"])
+        route = (self._templates or {}).get(scope.get("endpoint"), "<unmatched>")
+        if route in SKIP_ROUTES:
+            return
+        method = scope["method"]
+        http_requests.inc(method=method, route=route, status=status)
+        http_duration.observe(elapsed, method=method, route=route)
+        request_queries.observe(stats[0], method=method, route=route)
+        request_db_seconds.observe(stats[1], method=method, route=route)
@@ -0,0 +1,244 @@
+# app/migrations.py
+# Версионированные миграции схемы.
+#   python -m app.migrations upgrade   — применить недостающие
+#   python -m app.migrations status    — текущая версия
+#   python -m app.migrations check     — сравнить индексы с живой БД (код 1, если чего-то нет)
+import logging
+import sys
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.engine import Connection
+
+from .models import Base, Group, Object, Prepod, Aud, VERSIONED_TABLES, engine, version_seq, normalize_search
+
+log = logging.getLogger(__name__)
+
+SCHEMA_TABLE = "schema_version"
+# pg_advisory_xact_lock: несколько воркеров uvicorn не применяют миграции одновременно
+MIGRATION_LOCK_KEY = 7301001
+
+
+# ----------------- Миграции -----------------
+def _0001_base_tables(conn: Connection) -> None:
+    # Совпадает с Raspisanie.sql; IF NOT EXISTS — для баз, восстановленных из дампа
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS "Groups" (
+            id_group integer GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            name_gr varchar NOT NULL
+        )'''))
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS "Objects" (
+            id_obj integer GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            name_obj varchar NOT NULL
+        )'''))
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS "Prepodavateli" (
+            id_prep integer GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            fio varchar NOT NULL
+        )'''))
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS "Auditorii" (
+            id_au integer GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            number varchar NOT NULL
+        )'''))
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS "Itog" (
+            id_itog integer GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            data date,
+            "time" varchar(5),
+            id_obj_fk integer REFERENCES "Objects" (id_obj),
+            id_group_fk integer REFERENCES "Groups" (id_group),
+            id_prep_fk integer REFERENCES "Prepodavateli" (id_prep),
+            id_au_fk integer REFERENCES "Auditorii" (id_au),
+            type varchar
+        )'''))
+
+
+SEARCH_LABELS = ((Group, Group.name), (Object, Object.name), (Prepod, Prepod.fio), (Aud, Aud.number))
+
+
+def _refresh_search(conn: Connection, model, label) -> None:
+    # Ключ считается в Python (см. normalize_search), поэтому заполняем не через UPDATE ... lower()
+    rows = conn.execute(model.__table__.select().with_only_columns(model.id, label, model.search)).all()
+    changed = [{"pk": pk, "key": normalize_search(value)} for pk, value, key in rows if key != normalize_search(value)]
+    if changed:
+        pk_col = model.__table__.primary_key.columns[0]
+        conn.execute(model.__table__.update().where(pk_col == bindparam("pk")).values(search_lc=bindparam("key")),
+                     changed)
+
+
+def _0002_search_columns(conn: Connection) -> None:
+    for model, label in SEARCH_LABELS:
+        table = model.__tablename__
+        conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS search_lc varchar'))
+        _refresh_search(conn, model, label)
+        conn.execute(text(
+            f'CREATE INDEX IF NOT EXISTS "ix_{table.lower()}_search_lc" '
+            f'ON "{table}" (search_lc text_pattern_ops)'
+        ))
+    # Триграммный индекс ускоряет поиск по подстроке; pg_trgm может быть недоступен
+    has_trgm = conn.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).first()
+    if has_trgm:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for model in (Group, Object, Prepod, Aud):
+            table = model.__tablename__
+            conn.execute(text(
+                f'CREATE INDEX IF NOT EXISTS "ix_{table.lower()}_search_trgm" '
+                f'ON "{table}" USING gin (search_lc gin_trgm_ops)'
+            ))
+
+
+def _0003_itog_indexes(conn: Connection) -> None:
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_itog_group_date_time ON "Itog" (id_group_fk, data, "time")'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_itog_prep_date_time ON "Itog" (id_prep_fk, data, "time")'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_itog_aud_date_time ON "Itog" (id_au_fk, data, "time")'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_itog_obj ON "Itog" (id_obj_fk)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_itog_date_time_id ON "Itog" (data, "time", id_itog)'))
+    conn.execute(text('ANALYZE "Itog"'))
+
+
+def _0004_data_version(conn: Connection) -> None:
+    conn.execute(text("CREATE SEQUENCE IF NOT EXISTS data_version_seq"))
+
+
+def _0005_table_versions(conn: Connection) -> None:
+    # общий счётчик заменён счётчиками по таблицам
+    for table in VERSIONED_TABLES:
+        conn.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {version_seq(table)}"))
+    conn.execute(text("DROP SEQUENCE IF EXISTS data_version_seq"))
+
+
+def _0006_itog_fk_set_null(conn: Connection) -> None:
+    # удаление записи справочника оставляет занятие с NULL, как делает DataStore._delete_ref;
+    # имена ограничений в восстановленных дампах могут отличаться, поэтому ищем по столбцу
+    for column, ref_table, ref_column in (("id_obj_fk", "Objects", "id_obj"), ("id_group_fk", "Groups", "id_group"),
+                                          ("id_prep_fk", "Prepodavateli", "id_prep"), ("id_au_fk", "Auditorii", "id_au")):
+        names = conn.execute(text('''
+            SELECT c.conname FROM pg_constraint c
+            JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = ANY (c.conkey)
+            WHERE c.conrelid = '"Itog"'::regclass AND c.contype = 'f' AND a.attname = :column'''),
+            {"column": column}).scalars().all()
+        for name in names:
+            conn.execute(text(f'ALTER TABLE "Itog" DROP CONSTRAINT "{name}"'))
+        conn.execute(text(
+            f'ALTER TABLE "Itog" ADD CONSTRAINT "Itog_{column}_fkey" FOREIGN KEY ({column}) '
+            f'REFERENCES "{ref_table}" ({ref_column}) ON DELETE SET NULL'
+        ))
+
+
+# lower() в локали C не трогает кириллицу, поэтому заглавные буквы переводим через translate
+_UPPER = "АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ"
+_LOWER = "абвгдеежзийклмнопрстуфхцчшщъыьэюя"
+
+
+def _0007_search_lc_trigger(conn: Connection) -> None:
+    # search_lc заполняет @validates в ORM; строки, записанные мимо него (сырой SQL, COPY,
+    # Core insert без search), получают ключ от триггера. Он повторяет normalize_search для
+    # кириллицы и латиницы и не трогает ключ, уже посчитанный в Python.
+    conn.execute(text(f'''
+        CREATE OR REPLACE FUNCTION search_lc_fill() RETURNS trigger LANGUAGE plpgsql AS $$
+        DECLARE
+            value text := to_jsonb(NEW) ->> TG_ARGV[0];
+        BEGIN
+            IF NEW.search_lc IS NULL OR (TG_OP = 'UPDATE' AND NEW.search_lc IS NOT DISTINCT FROM OLD.search_lc
+                                         AND value IS DISTINCT FROM to_jsonb(OLD) ->> TG_ARGV[0]) THEN
+                NEW.search_lc := replace(lower(translate(btrim(regexp_replace(value, '\\s+', ' ', 'g')),
+                                                         '{_UPPER}', '{_LOWER}')), 'ё', 'е');
+            END IF;
+            RETURN NEW;
+        END $$'''))
+    for model, label in SEARCH_LABELS:
+        table = model.__tablename__
+        conn.execute(text(f'DROP TRIGGER IF EXISTS search_lc_fill ON "{table}"'))
+        conn.execute(text(
+            f'CREATE TRIGGER search_lc_fill BEFORE INSERT OR UPDATE ON "{table}" '
+            f'FOR EACH ROW EXECUTE FUNCTION search_lc_fill(\'{label.name}\')'
+        ))
+        # строки, вставленные мимо ORM до этой миграции
+        _refresh_search(conn, model, label)
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "base_tables", _0001_base_tables),
+    (2, "search_columns", _0002_search_columns),
+    (3, "itog_indexes", _0003_itog_indexes),
+    (4, "data_version", _0004_data_version),
+    (5, "table_versions", _0005_table_versions),
+    (6, "itog_fk_set_null", _0006_itog_fk_set_null),
+    (7, "search_lc_trigger", _0007_search_lc_trigger),
+]
+
+
+# ----------------- Применение -----------------
+def _ensure_version_table(conn: Connection) -> None:
+    conn.execute(text(f'''
+        CREATE TABLE IF NOT EXISTS {SCHEMA_TABLE} (
+            version integer PRIMARY KEY,
+            name varchar NOT NULL,
+            applied_at timestamp NOT NULL DEFAULT now()
+        )'''))
+
+
+def current_version(bind=engine) -> int:
+    with bind.begin() as conn:
+        _ensure_version_table(conn)
+        return conn.execute(text(f"SELECT coalesce(max(version), 0) FROM {SCHEMA_TABLE}")).scalar()
+
+
+def upgrade(bind=engine) -> List[int]:
+    """Применяет недостающие миграции в одной транзакции, возвращает их номера."""
+    applied_now = []
+    with bind.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        _ensure_version_table(conn)
+        applied = set(conn.execute(text(f"SELECT version FROM {SCHEMA_TABLE}")).scalars())
+        for version, name, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            log.info("applying migration %04d_%s", version, name)
+            migrate(conn)
+            conn.execute(text(f"INSERT INTO {SCHEMA_TABLE} (version, name) VALUES (:v, :n)"),
+                         {"v": version, "n": name})
+            applied_now.append(version)
+    return applied_now
+
+
+def missing_indexes(bind=engine) -> List[Dict[str, object]]:
+    """Индексы, объявленные в моделях, которых нет в живой БД."""
+    insp = inspect(bind)
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            missing.extend({"table": table.name, "index": idx.name, "columns": [c.name for c in idx.columns]}
+                           for idx in table.indexes)
+            continue
+        live = {ix["name"] for ix in insp.get_indexes(table.name)}
+        for idx in table.indexes:
+            if idx.name not in live:
+                missing.append({"table": table.name, "index": idx.name, "columns": [c.name for c in idx.columns]})
+    return missing
+
+
+def main(argv: List[str]) -> int:
+    cmd = argv[0] if argv else "upgrade"
+    if cmd == "upgrade":
+        done = upgrade()
+        print(f"applied: {done or 'nothing'}; version {current_version()}")
+        return 0
+    if cmd == "status":
+        print(f"version {current_version()} of {MIGRATIONS[-1][0]}")
+        return 0
+    if cmd == "check":
+        missing = missing_indexes()
+        for m in missing:
+            print(f"missing index {m['index']} on {m['table']} ({', '.join(m['columns'])})")
+        if not missing:
+            print("all indexes present")
+        return 1 if missing else 0
+    print(f"unknown command: {cmd}", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,72 @@
+# app/occupancy.py
+# Занятость аудиторий: на каждый день — битовая маска на аудиторию, бит = время занятия.
+# «Свободные аудитории» — проход по справочнику с AND по маскам, без запросов к Itog.
+# Загрузка и обновление по записям — общие с недельной сеткой (ItogIndex, app/timetable.py).
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .models import add_change_listener
+from .timetable import ItogIndex
+
+
+class _OccupancyState:
+    def __init__(self):
+        self.slots: Dict[str, int] = {}  # время -> номер бита, по мере появления
+        self.days: Dict[str, Dict[str, int]] = {}  # дата -> {aud_id: маска}
+        self.lessons: Dict[str, Tuple[str, str, int]] = {}  # id занятия -> (дата, aud_id, бит)
+        # занятий в одном (дата, аудитория, бит): бит снимается, когда уходит последнее
+        self.counts: Dict[Tuple[str, str, int], int] = {}
+
+
+class OccupancyIndex(ItogIndex):
+    def _new_state(self) -> _OccupancyState:
+        return _OccupancyState()
+
+    def _add(self, state: _OccupancyState, row: Dict[str, Any]) -> None:
+        self._remove(state, row["id"])
+        if not (row["aud_id"] and row["date"] and row["time"]):
+            return
+        bit = state.slots.setdefault(row["time"], len(state.slots))
+        key = (row["date"], row["aud_id"], bit)
+        state.lessons[row["id"]] = key
+        state.counts[key] = state.counts.get(key, 0) + 1
+        day = state.days.setdefault(row["date"], {})
+        day[row["aud_id"]] = day.get(row["aud_id"], 0) | (1 << bit)
+
+    def _remove(self, state: _OccupancyState, row_id: str) -> None:
+        key = state.lessons.pop(row_id, None)
+        if key is None:
+            return
+        state.counts[key] -= 1
+        if state.counts[key]:
+            return
+        del state.counts[key]
+        d, aud_id, bit = key
+        day = state.days[d]
+        day[aud_id] &= ~(1 << bit)
+        if not day[aud_id]:
+            del day[aud_id]
+        if not day:
+            del state.days[d]
+
+    def free(self, rooms: Iterable[str], days: List[str], time: Optional[str] = None) -> List[str]:
+        """Аудитории из rooms, свободные во все days: в слот time или, без time, весь день."""
+        with self._lock:
+            state = self._state
+            if time is None:
+                mask = -1  # любой бит
+            elif time in state.slots:
+                mask = 1 << state.slots[time]
+            else:
+                return list(rooms)  # в это время занятий нет нигде
+            busy = {a for d in days for a, bits in state.days.get(d, {}).items() if bits & mask}
+        return [a for a in rooms if a not in busy]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"version": self.version, "lessons": len(self._state.lessons),
+                    "days": len(self._state.days), "slots": len(self._state.slots), "loads": self.loads}
+
+
+# ----------------- singleton -----------------
+occupancy = OccupancyIndex()
+add_change_listener(occupancy.on_change)
@@ -0,0 +1,261 @@
+# app/profiling.py
+# Профилирование SQL, включаемое на ходу (POST /api/profiling или PROFILE_QUERIES=1 при старте):
+#   - медленные запросы (дольше slow_ms) с параметрами и планом EXPLAIN;
+#   - N+1: запрос, в котором один и тот же оператор (с точностью до литералов и длины IN-списков)
+#     выполнился n_plus_one раз и больше;
+#   - трасса запроса: все операторы HTTP-запроса по порядку (заголовок X-Query-Trace — её id).
+# Выключенный профилировщик не держит слушателей на движках, а middleware только проверяет флаг.
+import itertools
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+
+from .metrics import _route_templates
+
+log = logging.getLogger(__name__)
+
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "100"))  # записей в каждом журнале
+PROFILE_PARAMS_MAX = 500  # символов repr(параметров) в журнале
+EXPLAIN_PREFIXES = ("select", "insert", "update", "delete", "with")
+DEFAULT_SETTINGS = {
+    "slow_ms": float(os.getenv("PROFILE_SLOW_MS", "100")),
+    "explain": os.getenv("PROFILE_EXPLAIN", "1") == "1",
+    "n_plus_one": int(os.getenv("PROFILE_N_PLUS_ONE", "10")),
+    "trace": os.getenv("PROFILE_TRACE", "0") == "1",
+}
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PARAMS = re.compile(r"%\(\w+\)s|\$\d+|\?")
+_IN_LISTS = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(statement: str) -> str:
+    """Ключ «почти одинаковых» операторов: без литералов, параметров и длины IN-списков."""
+    s = _PARAMS.sub("?", _LITERALS.sub("?", statement))
+    return _SPACES.sub(" ", _IN_LISTS.sub("IN (?)", s)).strip()
+
+
+def _explain_sql(statement: str, parameters, driver: str):
+    # план строится через psycopg2; у asyncpg параметры $1..$n — переводим в %s по порядку вхождения
+    if driver == "psycopg2":
+        return "EXPLAIN " + statement, parameters
+    order = [int(n) - 1 for n in re.findall(r"\$(\d+)", statement)]
+    sql = re.sub(r"\$\d+", "%s", statement.replace("%", "%%"))
+    return "EXPLAIN " + sql, tuple(parameters[i] for i in order) if order else None
+
+
+class _RequestTrace:
+    __slots__ = ("id", "method", "path", "started", "statements")
+
+    def __init__(self, trace_id: int, method: str, path: str):
+        self.id = trace_id
+        self.method = method
+        self.path = path
+        self.started = time.time()
+        self.statements: List[Dict[str, Any]] = []
+
+
+_current: ContextVar[Optional[_RequestTrace]] = ContextVar("query_trace", default=None)
+
+
+class QueryProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.settings: Dict[str, Any] = dict(DEFAULT_SETTINGS)
+        self._engines: List[Any] = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.slow: deque = deque(maxlen=PROFILE_KEEP)
+        self.n_plus_one: deque = deque(maxlen=PROFILE_KEEP)
+        self.traces: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._explain_queue: "queue.Queue" = queue.Queue(maxsize=PROFILE_KEEP)
+        self._explain_thread: Optional[threading.Thread] = None
+
+    # --- включение ---
+    def add_engine(self, engine) -> None:
+        """Синхронный Engine (для AsyncEngine — .sync_engine); первый добавленный строит планы."""
+        with self._lock:
+            self._engines.append(engine)
+            if self.enabled:
+                self._attach(engine)
+
+    def _attach(self, engine) -> None:
+        if not event.contains(engine, "after_cursor_execute", self._after_cursor_execute):
+            event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _detach(self, engine) -> None:
+        if event.contains(engine, "after_cursor_execute", self._after_cursor_execute):
+            event.remove(engine, "before_cursor_execute", self._before_cursor_execute)
+            event.remove(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def configure(self, enabled: Optional[bool] = None, **settings) -> Dict[str, Any]:
+        unknown = set(settings) - set(DEFAULT_SETTINGS)
+        if unknown:
+            raise ValueError(f"unknown profiling settings: {', '.join(sorted(unknown))}")
+        with self._lock:
+            self.settings.update({k: v for k, v in settings.items() if v is not None})
+            if enabled is not None and enabled != self.enabled:
+                for engine in self._engines:
+                    (self._attach if enabled else self._detach)(engine)
+                self.enabled = enabled
+                log.warning("query profiling %s: %s", "enabled" if enabled else "disabled", self.settings)
+        return self.status()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.slow.clear()
+            self.n_plus_one.clear()
+            self.traces.clear()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"enabled": self.enabled, "settings": dict(self.settings),
+                    "slow": list(self.slow), "n_plus_one": list(self.n_plus_one),
+                    "traces": [{k: t[k] for k in ("id", "method", "path", "route", "status", "statements_count",
+                                                  "db_ms")} for t in self.traces.values()]}
+
+    def trace(self, trace_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self.traces.get(trace_id)
+
+    # --- события движка (только пока профилировщик включён) ---
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._profile_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_profile_started", None)
+        if started is None:
+            return
+        ms = (time.perf_counter() - started) * 1000
+        trace = _current.get()
+        if trace is not None:
+            trace.statements.append({"sql": statement, "ms": round(ms, 3), "executemany": executemany})
+        if ms >= self.settings["slow_ms"]:
+            self._slow(conn, statement, parameters, ms, executemany, trace)
+
+    def _slow(self, conn, statement: str, parameters, ms: float, executemany: bool, trace) -> None:
+        entry = {
+            "sql": statement, "ms": round(ms, 1), "at": time.time(),
+            "params": repr(parameters)[:PROFILE_PARAMS_MAX],
+            "request": f"{trace.method} {trace.path}" if trace else None, "plan": None,
+        }
+        log.warning("slow query %.1f ms: %s", ms, _SPACES.sub(" ", statement)[:200])
+        with self._lock:
+            self.slow.append(entry)
+        if self.settings["explain"] and not executemany and statement.lstrip().lower().startswith(EXPLAIN_PREFIXES):
+            try:
+                self._explain_queue.put_nowait((entry, statement, parameters, conn.dialect.driver))
+            except queue.Full:
+                return
+            self._start_explainer()
+
+    # --- EXPLAIN в отдельном потоке, чтобы не удлинять сам запрос ---
+    def _start_explainer(self) -> None:
+        with self._lock:
+            if self._explain_thread is None or not self._explain_thread.is_alive():
+                self._explain_thread = threading.Thread(target=self._explain_loop, name="explain", daemon=True)
+                self._explain_thread.start()
+
+    def _explain_loop(self) -> None:
+        while True:
+            try:
+                entry, statement, parameters, driver = self._explain_queue.get(timeout=30)
+            except queue.Empty:
+                return
+            entry["plan"] = self._explain(statement, parameters, driver)
+
+    def _explain(self, statement: str, parameters, driver: str) -> str:
+        if not self._engines:
+            return "no engine"
+        sql, params = _explain_sql(statement, parameters, driver)
+        # DBAPI-соединение из пула: события курсора движка на нём не срабатывают, поэтому
+        # EXPLAIN не попадает ни в журнал, ни в метрики
+        raw = self._engines[0].raw_connection()
+        try:
+            cursor = raw.cursor()
+            cursor.execute(sql, params)
+            return "\n".join(row[0] for row in cursor.fetchall())
+        except Exception as e:
+            return f"EXPLAIN failed: {e}"
+        finally:
+            raw.close()
+
+    # --- HTTP-запрос ---
+    def begin(self, method: str, path: str):
+        return _current.set(_RequestTrace(next(self._ids), method, path))
+
+    def end(self, token, route: str, status: int) -> Optional[int]:
+        trace = _current.get()
+        _current.reset(token)
+        if trace is None:
+            return None
+        counts: Dict[str, int] = {}
+        for s in trace.statements:
+            key = normalize(s["sql"])
+            counts[key] = counts.get(key, 0) + 1
+        repeated = [(k, n) for k, n in counts.items() if n >= self.settings["n_plus_one"]]
+        db_ms = round(sum(s["ms"] for s in trace.statements), 3)
+        with self._lock:
+            for key, n in repeated:
+                log.warning("N+1 in %s %s: %d x %s", trace.method, route, n, key[:200])
+                self.n_plus_one.append({"request": f"{trace.method} {trace.path}", "route": route,
+                                        "count": n, "sql": key, "at": trace.started})
+            if not self.settings["trace"]:
+                return None
+            self.traces[trace.id] = {
+                "id": trace.id, "method": trace.method, "path": trace.path, "route": route, "status": status,
+                "statements_count": len(trace.statements), "db_ms": db_ms, "statements": trace.statements,
+            }
+            while len(self.traces) > PROFILE_KEEP:
+                self.traces.popitem(last=False)
+        return trace.id
+
+
+class ProfilerMiddleware:
+    """Пока профилировщик выключен — одна проверка флага на запрос."""
+
+    def __init__(self, app):
+        self.app = app
+        self._templates: Optional[Dict[object, str]] = None
+
+    async def __call__(self, scope, receive, send):
+        if not profiler.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+        token = profiler.begin(scope["method"], scope["path"])
+        trace_id = str(_current.get().id).encode()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                # id трассы известен до ответа: под ним она и ляжет в журнал
+                if profiler.settings["trace"]:
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-query-trace", trace_id)]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if self._templates is None and "app" in scope:
+                self._templates = _route_templates(scope["app"])
+            route = (self._templates or {}).get(scope.get("endpoint"), "<unmatched>")
+            profiler.end(token, route, status[0])
+
+
+# ----------------- singleton -----------------
+profiler = QueryProfiler()
+if os.getenv("PROFILE_QUERIES", "0") == "1":
+    profiler.configure(enabled=True)
@@ -81,20 +81,7 @@ function renderTable(tab = null, items = null) {
   if (!Array.isArray(list)) return;
 
   if (currentTab === 'itog') {
-    list.forEach(r => {
-      const tr = document.createElement('tr');
-      tr.dataset.id = r.id;
-      tr.dataset.groupId = r.group_id != null ? String(r.group_id) : '0';
-      tr.dataset.prepId = r.prep_id != null ? String(r.prep_id) : '0';
-      tr.dataset.audId = r.aud_id != null ? String(r.aud_id) : '0';
-
-      const subj = r.object_name || dataCache.objects.find(o => String(o.id) === String(r.object_id))?.name || r.object || '';
-      const grp = r.group_name || dataCache.groups.find(g => String(g.id) === String(r.group_id))?.name || r.group || '';
-      const prep = r.prep_fio || dataCache.preps.find(p => String(p.id) === String(r.prep_id))?.fio || r.prep || '';
-      const aud = r.aud_number || dataCache.auditorii.find(a => String(a.id) === String(r.aud_id))?.number || r.aud || '';
-      tr.innerHTML = `<td>${r.date || ''}</td><td>${r.time || ''}</td><td>${escapeHtml(subj)}</td><td>${escapeHtml(grp)}</td><td>${escapeHtml(prep)}</td><td>${escapeHtml(aud)}</td><td>${escapeHtml(r.type || '')}</td>`;
-      tbody.appendChild(tr);
-    });
+    list.forEach(r => tbody.appendChild(itogRow(r)));
   } else {
     list.forEach(r => {
       const tr = document.createElement('tr');
@@ -108,6 +95,21 @@ function renderTable(tab = null, items = null) {
   }
 }
 
+function itogRow(r) {
+  const tr = document.createElement('tr');
+  tr.dataset.id = r.id;
+  tr.dataset.groupId = r.group_id != null ? String(r.group_id) : '0';
+  tr.dataset.prepId = r.prep_id != null ? String(r.prep_id) : '0';
+  tr.dataset.audId = r.aud_id != null ? String(r.aud_id) : '0';
+
+  const subj = r.object_name || dataCache.objects.find(o => String(o.id) === String(r.object_id))?.name || r.object || '';
+  const grp = r.group_name || dataCache.groups.find(g => String(g.id) === String(r.group_id))?.name || r.group || '';
+  const prep = r.prep_fio || dataCache.preps.find(p => String(p.id) === String(r.prep_id))?.fio || r.prep || '';
+  const aud = r.aud_number || dataCache.auditorii.find(a => String(a.id) === String(r.aud_id))?.number || r.aud || '';
+  tr.innerHTML = `<td>${r.date || ''}</td><td>${r.time || ''}</td><td>${escapeHtml(subj)}</td><td>${escapeHtml(grp)}</td><td>${escapeHtml(prep)}</td><td>${escapeHtml(aud)}</td><td>${escapeHtml(r.type || '')}</td>`;
+  return tr;
+}
+
 function escapeHtml(s) { if (!s && s !== 0) return ''; return String(s).replace(/[&<>"']/g, m => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' })[m]); }
 
 function renderStats() {
@@ -169,6 +171,52 @@ function setActiveTab(tab) {
   loadDataForTab(tab);
 }
 
+// --- Live updates: /api/events (SSE) ---
+// Занятия приходят построчно и правятся в dataCache и таблице на месте; справочники и
+// массовые изменения (импорт, генератор) приходят как reload — перечитывается одна таблица.
+let liveUpdates = false;
+
+function applyItogEvent(ev) {
+  const id = String(ev.row.id);
+  dataCache.itog = dataCache.itog.filter(r => String(r.id) !== id);
+  if (ev.op !== 'delete') dataCache.itog.push(ev.row);
+  renderStats();
+  if (currentTab !== 'itog') return;
+  const tbody = document.querySelector('#main-table tbody');
+  const tr = tbody && tbody.querySelector(`tr[data-id="${id}"]`);
+  if (ev.op === 'delete') { if (tr) tr.remove(); return; }
+  const row = itogRow(ev.row);
+  if (tr) { row.className = tr.className; tr.replaceWith(row); } else if (tbody) tbody.appendChild(row);
+}
+
+async function reloadTable(table) {
+  if (table === '*' || (table === 'itog' && currentTab === 'itog')) { await loadDataForTab(currentTab); return; }
+  if (table === 'itog') { dataCache.itog = await apiGet('/itog') || []; renderStats(); return; }
+  dataCache[table] = await apiGet('/' + table) || [];
+  // названия в расписании берутся из справочников
+  if (currentTab === table || currentTab === 'itog') renderTable();
+  renderStats();
+  populateFilterField();
+}
+
+function connectEvents() {
+  if (!window.EventSource) return;
+  const es = new EventSource('/api/events');
+  es.onopen = () => { liveUpdates = true; };
+  es.onerror = () => { liveUpdates = false; };  // EventSource переподключается сам, с Last-Event-ID
+  const handle = (msg) => {
+    const ev = JSON.parse(msg.data);
+    if (ev.table === 'itog' && ev.op !== 'reload') applyItogEvent(ev);
+    else reloadTable(ev.table).catch(e => console.error('live update error', e));
+  };
+  ['itog', 'groups', 'objects', 'preps', 'auditorii', '*'].forEach(t => es.addEventListener(t, handle));
+}
+
+// после своей записи: при живой ленте изменение придёт событием, иначе перечитываем вкладку
+async function refreshAfterWrite(tab) {
+  if (!liveUpdates) await loadDataForTab(tab);
+}
+
 // --- Modals (Create / Edit) ---
 
 function openModalForCreate() {
@@ -216,7 +264,7 @@ function openModalForCreate() {
         id_au_fk: $('f_aud').value ? parseInt($('f_aud').value) : null,
         type: $('f_type').value || null
       };
-      try { await apiPost('/itog', payload); closeModal(); await loadDataForTab('itog'); }
+      try { await apiPost('/itog', payload); closeModal(); await refreshAfterWrite('itog'); }
       catch (e) { console.error('create itog error', e); alert('Ошибка сохранения (см. консоль)'); }
     };
   } else {
@@ -235,7 +283,7 @@ function openModalForCreate() {
         if (currentTab === 'auditorii') { payload = { number: name }; url = '/auditorii'; }
 
         await apiPost(url, payload);
-        closeModal(); await loadDataForTab(currentTab);
+        closeModal(); await refreshAfterWrite(currentTab);
       } catch (e) { console.error('create error', e); alert('Ошибка создания (см. консоль)'); }
     };
   }
@@ -291,7 +339,7 @@ function openModalForEdit() {
         id_au_fk: $('f_aud').value ? parseInt($('f_aud').value) : null,
         type: $('f_type').value || null
       };
-      try { await apiPut('/itog/' + id, payload); closeModal(); await loadDataForTab('itog'); }
+      try { await apiPut('/itog/' + id, payload); closeModal(); await refreshAfterWrite('itog'); }
       catch (e) { console.error('update itog error', e); alert('Ошибка обновления (см. консоль)'); }
     };
   } else {
@@ -313,7 +361,7 @@ function openModalForEdit() {
         if (currentTab === 'auditorii') { payload = { number: v }; url = '/auditorii/' + id; }
 
         await apiPut(url, payload);
-        closeModal(); await loadDataForTab(currentTab);
+        closeModal(); await refreshAfterWrite(currentTab);
       } catch (e) { console.error('update error', e); alert('Ошибка обновления (см. консоль)'); }
     };
   }
@@ -343,20 +391,24 @@ function fillSelectOptions(selId, items, key, selectedId) {
 
 // --- Delete ---
 async function deleteSelected() {
-  const tr = document.querySelector('#main-table tbody tr.selected');
-  if (!tr) { alert('Выберите строку'); return; }
-  if (!confirm('Удалить?')) return;
-  const id = tr.dataset.id;
+  const selected = Array.from(document.querySelectorAll('#main-table tbody tr.selected'));
+  if (!selected.length) { alert('Выберите строку'); return; }
+  if (!confirm(selected.length > 1 ? `Удалить ${selected.length} записей?` : 'Удалить?')) return;
   try {
-    let url = '';
-    if (currentTab === 'itog') url = '/itog/' + id;
-    if (currentTab === 'groups') url = '/groups/' + id;
-    if (currentTab === 'preps') url = '/preps/' + id;
-    if (currentTab === 'objects') url = '/objects/' + id;
-    if (currentTab === 'auditorii') url = '/auditorii/' + id;
-
-    await apiDelete(url);
-    await loadDataForTab(currentTab);
+    if (currentTab === 'itog') {
+      // одна транзакция на все выбранные занятия
+      const operations = selected.map(tr => ({ op: 'delete', id: parseInt(tr.dataset.id) }));
+      await apiPost('/itog/batch', { operations });
+    } else {
+      const id = selected[0].dataset.id;
+      let url = '';
+      if (currentTab === 'groups') url = '/groups/' + id;
+      if (currentTab === 'preps') url = '/preps/' + id;
+      if (currentTab === 'objects') url = '/objects/' + id;
+      if (currentTab === 'auditorii') url = '/auditorii/' + id;
+      await apiDelete(url);
+    }
+    await refreshAfterWrite(currentTab);
   } catch (e) { console.error('delete error', e); alert('Ошибка удаления (см. консоль)'); }
 }
 
@@ -369,7 +421,7 @@ async function handleImport(e) {
     if(!res.ok) throw new Error("Import failed");
     const json = await res.json();
     alert('Импортировано: ' + (json.count || 0));
-    await loadDataForTab('itog');
+    await refreshAfterWrite('itog');
   } catch (err) { console.error('import error', err); alert('Ошибка импорта'); }
   finally { e.target.value = ''; }
 }
@@ -485,6 +537,11 @@ document.addEventListener("DOMContentLoaded", () => {
   tbody.onclick = (e) => {
     const tr = e.target.closest('tr');
     if (!tr) return;
+    // Ctrl/Cmd+клик — выбрать несколько занятий (для удаления пачкой)
+    if ((e.ctrlKey || e.metaKey) && currentTab === 'itog') {
+      tr.classList.toggle('selected');
+      return;
+    }
     document.querySelectorAll('#main-table tbody tr').forEach(row => {
       row.classList.remove('selected');
     });
@@ -551,4 +608,5 @@ document.addEventListener("DOMContentLoaded", () => {
   });
 
   setActiveTab("itog"); setupFilterOrSortUI("itog");
+  connectEvents();
 });
\ No newline at end of file
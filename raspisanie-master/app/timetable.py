@@ -0,0 +1,163 @@
+# app/timetable.py
+# Недельная сетка расписания (группа / преподаватель / аудитория × неделя) в памяти процесса.
+# Строится одним запросом при старте и дальше обновляется по записям DataStore
+# (add_change_listener), так что /api/timetable собирает ответ из готовых ячеек без запросов к Itog.
+# Записи других воркеров и импорт видны по счётчику data_version_itog: если он ушёл вперёд
+# не на нашу запись, сетка перестраивается при следующем чтении.
+import threading
+from abc import ABC, abstractmethod
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from .models import ITOG_FIELDS, _itog_columns, add_change_listener, session_scope, table_versions_sql
+
+TIMETABLE_KINDS = ("group", "prep", "aud")
+WEEK_DAYS = 7
+
+# (вид, id владельца, понедельник) -> {(день недели, время): {id занятия: строка}}
+Cells = Dict[Tuple[str, str, date], Dict[Tuple[int, str], Dict[str, Dict[str, Any]]]]
+
+
+def week_start(d: date) -> date:
+    return d - timedelta(days=d.weekday())
+
+
+def _cell_keys(row: Dict[str, Any]):
+    """Ячейки, в которые попадает занятие: по одной на группу, преподавателя и аудиторию."""
+    if not row["date"] or not row["time"]:
+        return []
+    d = date.fromisoformat(row["date"])
+    slot = (d.weekday(), row["time"])
+    monday = week_start(d)
+    return [((kind, row[f"{kind}_id"], monday), slot) for kind in TIMETABLE_KINDS if row[f"{kind}_id"]]
+
+
+class ItogIndex(ABC):
+    """Структура в памяти поверх всех занятий, синхронная с data_version_itog.
+
+    Подкласс задаёт _new_state / _add / _remove над своим состоянием; загрузка, версия и
+    применение записей — здесь. Записи применяются по id (удалить прежнюю строку, добавить
+    новую), поэтому повторное применение уже загруженной строки безопасно.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.version: Optional[int] = None  # data_version_itog, которому соответствует индекс
+        self.loads = 0
+        self._state = self._new_state()
+
+    @abstractmethod
+    def _new_state(self):
+        """Пустое состояние индекса."""
+
+    @abstractmethod
+    def _add(self, state, row: Dict[str, Any]) -> None:
+        """Добавляет занятие (строку to_dict) в состояние."""
+
+    @abstractmethod
+    def _remove(self, state, row_id: str) -> None:
+        """Убирает занятие по id; отсутствующий id — не ошибка."""
+
+    def load(self, version: Optional[int] = None) -> None:
+        """Полная перестройка одним SELECT по Itog; читатели до замены видят прежнее состояние.
+
+        version — счётчик, до которого индекс должен дойти: запросы, ждавшие на _load_lock,
+        пока другой поток перестраивал индекс, второй раз его не читают.
+        """
+        with self._load_lock:
+            if version is not None and self.version is not None and self.version >= version:
+                return
+            state = self._new_state()
+            with session_scope() as db:
+                # версию читаем до строк: если строки окажутся новее, следующее чтение перестроит ещё раз
+                version = db.execute(table_versions_sql(("itog",))).scalar()
+                for r in db.connection().execute(select(*_itog_columns(ITOG_FIELDS))):
+                    self._add(state, dict(zip(ITOG_FIELDS, r)))
+            with self._lock:
+                self._state, self.version = state, version
+                self.loads += 1
+
+    def is_current(self, version: int) -> bool:
+        with self._lock:
+            return self.version == version
+
+    def on_change(self, tables, versions: Dict[str, int], itog, started=None) -> None:
+        if "itog" not in tables:
+            return
+        with self._lock:
+            # применяем только свою запись, идущую сразу за версией индекса; иначе индекс отстал
+            if itog is None or self.version is None or versions["itog"] != self.version + 1:
+                return
+            for old, new in itog:
+                if old:
+                    self._remove(self._state, old["id"])
+                if new:
+                    self._add(self._state, new)
+            self.version = versions["itog"]
+
+
+class _TimetableState:
+    def __init__(self):
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        self.cells: Cells = {}
+
+
+class TimetableIndex(ItogIndex):
+    def _new_state(self) -> _TimetableState:
+        return _TimetableState()
+
+    def _add(self, state: _TimetableState, row: Dict[str, Any]) -> None:
+        state.rows[row["id"]] = row
+        for key, slot in _cell_keys(row):
+            state.cells.setdefault(key, {}).setdefault(slot, {})[row["id"]] = row
+
+    def _remove(self, state: _TimetableState, row_id: str) -> None:
+        row = state.rows.pop(row_id, None)
+        if row is None:
+            return
+        for key, slot in _cell_keys(row):
+            week = state.cells.get(key, {})
+            cell = week.get(slot, {})
+            cell.pop(row_id, None)
+            if not cell:
+                week.pop(slot, None)
+            if not week:
+                state.cells.pop(key, None)
+
+    # --- чтение ---
+    def grid(self, kind: str, owner_id: str, day: date) -> Dict[str, Any]:
+        """Неделя, содержащая day: строки — времена занятий, столбцы — дни с понедельника."""
+        if kind not in TIMETABLE_KINDS:
+            raise ValueError(f"unknown timetable kind: {kind}")
+        monday = week_start(day)
+        with self._lock:
+            week = {slot: [dict(r) for r in cell.values()]
+                    for slot, cell in self._state.cells.get((kind, owner_id, monday), {}).items()}
+            version = self.version
+        times = sorted({t for _, t in week})
+        grid: List[List[List[Dict[str, Any]]]] = [
+            [sorted(week.get((d, t), []), key=lambda r: int(r["id"])) for d in range(WEEK_DAYS)]
+            for t in times
+        ]
+        return {
+            "kind": kind,
+            "id": owner_id,
+            "week": monday.isoformat(),
+            "days": [(monday + timedelta(days=d)).isoformat() for d in range(WEEK_DAYS)],
+            "times": times,
+            "grid": grid,
+            "version": version,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"version": self.version, "lessons": len(self._state.rows),
+                    "weeks": len(self._state.cells), "loads": self.loads}
+
+
+# ----------------- singleton -----------------
+timetable = TimetableIndex()
+add_change_listener(timetable.on_change)
@@ -0,0 +1,132 @@
+# app/workload.py
+# Нагрузка преподавателей: часы по (преподаватель, дисциплина, группа) за период.
+# Считается в БД одним GROUP BY (DataStore.workload_counts), результат кэшируется по периоду
+# и дальше правится по записям в Itog так же, как недельная сетка (app/timetable.py).
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .models import add_change_listener, store, table_versions
+
+# академических часов в одном занятии (паре)
+LESSON_HOURS = int(os.getenv("LESSON_HOURS", "2"))
+WORKLOAD_CACHE_MAX = int(os.getenv("WORKLOAD_CACHE_MAX", "32"))
+
+# (prep_id, object_id, group_id) -> {aud_id: число занятий}
+Counts = Dict[Tuple[Optional[str], Optional[str], Optional[str]], Dict[Optional[str], int]]
+
+
+def counts_from_rows(rows) -> Counts:
+    counts: Counts = {}
+    for prep_id, object_id, group_id, aud_id, n in rows:
+        auds = counts.setdefault((prep_id, object_id, group_id), {})
+        auds[aud_id] = auds.get(aud_id, 0) + n
+    return counts
+
+
+def _in_period(row: Dict[str, Any], date_from: Optional[str], date_to: Optional[str]) -> bool:
+    # как фильтр в SQL: при заданной границе занятия без даты не попадают
+    if date_from and (not row["date"] or row["date"] < date_from):
+        return False
+    if date_to and (not row["date"] or row["date"] > date_to):
+        return False
+    return True
+
+
+class WorkloadCache:
+    def __init__(self, max_entries: int = WORKLOAD_CACHE_MAX):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # (date_from, date_to) -> (data_version_itog, counts, когда положено в кэш)
+        self._entries: Dict[Tuple[Optional[str], Optional[str]], Tuple[int, Counts, float]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, period: Tuple[Optional[str], Optional[str]], version: int) -> Optional[Counts]:
+        with self._lock:
+            entry = self._entries.get(period)
+            if entry and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, period: Tuple[Optional[str], Optional[str]], version: int, counts: Counts) -> None:
+        with self._lock:
+            self._entries.pop(period, None)
+            self._entries[period] = (version, counts, time.monotonic())
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+
+    def counts(self, date_from: Optional[str] = None, date_to: Optional[str] = None,
+               version: Optional[int] = None) -> Counts:
+        """Синхронный путь (экспорты): из кэша или одним запросом к БД."""
+        if version is None:
+            version = table_versions("itog")["itog"]
+        period = (date_from or None, date_to or None)
+        counts = self.get(period, version)
+        if counts is None:
+            counts = counts_from_rows(store.workload_counts(*period))
+            self.put(period, version, counts)
+        return counts
+
+    def on_change(self, tables, versions: Dict[str, int], itog, started=None) -> None:
+        if "itog" not in tables:
+            return
+        version = versions["itog"]
+        with self._lock:
+            for period, (entry_version, counts, created) in list(self._entries.items()):
+                # отстал или строки неизвестны — пересчитаем при следующем запросе. Запись, начатая
+                # до помещения в кэш, могла уже попасть в GROUP BY: дельта посчитала бы её дважды
+                if itog is None or entry_version != version - 1 or started is None or started < created:
+                    del self._entries[period]
+                    continue
+                # копия при записи: читатели могут обходить прежний словарь без блокировки
+                counts = dict(counts)
+                for old, new in itog:
+                    for row, delta in ((old, -1), (new, 1)):
+                        if row and _in_period(row, *period):
+                            key = (row["prep_id"], row["object_id"], row["group_id"])
+                            auds = counts[key] = dict(counts.get(key, {}))
+                            auds[row["aud_id"]] = auds.get(row["aud_id"], 0) + delta
+                            if not auds[row["aud_id"]]:
+                                del auds[row["aud_id"]]
+                            if not auds:
+                                del counts[key]
+                self._entries[period] = (version, counts, created)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def workload_rows(counts: Counts, prep_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Строки отчёта с названиями, по преподавателю, дисциплине и группе; total_hours — по преподавателю."""
+    preps = store.ref_names("preps")
+    objs = store.ref_names("objects")
+    groups = store.ref_names("groups")
+    auds = store.ref_names("auditorii")
+    rows, totals = [], {}
+    for (p, o, g), by_aud in counts.items():
+        if prep_id is not None and p != prep_id:
+            continue
+        lessons = sum(by_aud.values())
+        totals[p] = totals.get(p, 0) + lessons * LESSON_HOURS
+        rows.append({
+            "prep_id": p, "prep": preps.get(p, "Не указан"),
+            "object_id": o, "object": objs.get(o, "Не указана"),
+            "group_id": g, "group": groups.get(g, "Не указана"),
+            "auditorii": ", ".join(sorted(auds[a] for a in by_aud if a in auds)) or "Не указана",
+            "lessons": lessons,
+            "hours": lessons * LESSON_HOURS,
+        })
+    for r in rows:
+        r["total_hours"] = totals[r["prep_id"]]
+    rows.sort(key=lambda r: (r["prep_id"] is None, r["prep"], r["object"], r["group"]))
+    return rows
+
+
+# ----------------- singleton -----------------
+workload = WorkloadCache()
+add_change_listener(workload.on_change)
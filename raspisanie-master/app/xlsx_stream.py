@@ -0,0 +1,206 @@
+# app/xlsx_stream.py
+# Потоковая запись XLSX: лист пишется строка за строкой прямо в zip-поток,
+# готовые байты отдаются наружу по мере появления. Память не зависит от числа строк.
+import re
+import zipfile
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape
+
+# Индексы стилей из STYLES_XML (cellXfs)
+STYLE_DEFAULT = 0
+STYLE_TITLE = 1         # жирный 12, по центру
+STYLE_CENTER = 2        # по центру
+STYLE_HEADING = 3       # жирный 14, по центру
+STYLE_CELL = 4          # тонкая рамка
+STYLE_HEADER_CELL = 5   # жирный, рамка, по центру
+
+FLUSH_EVERY = 500
+
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+ROOT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+WORKBOOK_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+_CENTER = '<alignment horizontal="center" vertical="center"/>'
+_THIN = '<{0} style="thin"><color auto="1"/></{0}>'
+STYLES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="4">'
+    '<font><sz val="11"/><name val="Calibri"/><family val="2"/></font>'
+    '<font><b/><sz val="12"/><name val="Calibri"/><family val="2"/></font>'
+    '<font><b/><sz val="14"/><name val="Calibri"/><family val="2"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/><family val="2"/></font>'
+    '</fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="2"><border><left/><right/><top/><bottom/><diagonal/></border>'
+    '<border>' + "".join(_THIN.format(side) for side in ("left", "right", "top", "bottom")) + '<diagonal/></border>'
+    '</borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="6">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1" applyAlignment="1">'
+    + _CENTER + '</xf>'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0" applyAlignment="1">' + _CENTER + '</xf>'
+    '<xf numFmtId="0" fontId="2" fillId="0" borderId="0" xfId="0" applyFont="1" applyAlignment="1">'
+    + _CENTER + '</xf>'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="1" xfId="0" applyBorder="1"/>'
+    '<xf numFmtId="0" fontId="3" fillId="0" borderId="1" xfId="0" applyFont="1" applyBorder="1" '
+    'applyAlignment="1">' + _CENTER + '</xf>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+# Ячейка: значение или (значение, индекс стиля)
+Cell = Any
+
+
+def column_letter(index: int) -> str:
+    """1 -> A, 27 -> AA."""
+    letters = ""
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+class _Sink:
+    """Приёмник для ZipFile: без tell()/seek(), поэтому zipfile пишет потоково (data descriptors)."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _cell_xml(ref: str, cell: Cell) -> str:
+    value, style = cell if isinstance(cell, tuple) else (cell, STYLE_DEFAULT)
+    s_attr = f' s="{style}"' if style else ""
+    if value is None or value == "":
+        return f'<c r="{ref}"{s_attr}/>' if style else ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}"{s_attr} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"{s_attr}><v>{value}</v></c>'
+    text = escape(_INVALID_XML.sub("", str(value)))
+    return f'<c r="{ref}"{s_attr} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+class XlsxStreamWriter:
+    """Один лист; merges — диапазоны вида "A1:H1", известные заранее (пишутся после sheetData)."""
+
+    def __init__(self, sheet_name: str, col_widths: Optional[Sequence[float]] = None,
+                 merges: Sequence[str] = ()):
+        self.sheet_name = sheet_name
+        self.col_widths = list(col_widths or [])
+        self.merges = list(merges)
+
+    def _workbook_xml(self) -> str:
+        name = escape(self.sheet_name[:31], {'"': "&quot;"})
+        return (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>'
+        )
+
+    def _sheet_head(self) -> str:
+        head = (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        )
+        if self.col_widths:
+            head += "<cols>" + "".join(
+                f'<col min="{i}" max="{i}" width="{w}" customWidth="1"/>'
+                for i, w in enumerate(self.col_widths, start=1)
+            ) + "</cols>"
+        return head + "<sheetData>"
+
+    def _sheet_tail(self) -> str:
+        tail = "</sheetData>"
+        if self.merges:
+            tail += f'<mergeCells count="{len(self.merges)}">' + "".join(
+                f'<mergeCell ref="{m}"/>' for m in self.merges
+            ) + "</mergeCells>"
+        return tail + "</worksheet>"
+
+    def stream(self, rows: Iterable[Sequence[Cell]]) -> Iterator[bytes]:
+        sink = _Sink()
+        letters: List[str] = []
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("[Content_Types].xml", CONTENT_TYPES_XML)
+            zf.writestr("_rels/.rels", ROOT_RELS_XML)
+            zf.writestr("xl/workbook.xml", self._workbook_xml())
+            zf.writestr("xl/_rels/workbook.xml.rels", WORKBOOK_RELS_XML)
+            zf.writestr("xl/styles.xml", STYLES_XML)
+            with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+                sheet.write(self._sheet_head().encode("utf-8"))
+                # служебные части и заголовок листа уходят клиенту сразу
+                yield sink.take()
+                buf: List[str] = []
+                for r, row in enumerate(rows, start=1):
+                    while len(letters) < len(row):
+                        letters.append(column_letter(len(letters) + 1))
+                    cells = "".join(_cell_xml(f"{letters[i]}{r}", c) for i, c in enumerate(row))
+                    buf.append(f'<row r="{r}">{cells}</row>')
+                    if len(buf) >= FLUSH_EVERY:
+                        sheet.write("".join(buf).encode("utf-8"))
+                        buf.clear()
+                        # deflate копит данные внутри, поэтому кусок может быть пустым
+                        data = sink.take()
+                        if data:
+                            yield data
+                if buf:
+                    sheet.write("".join(buf).encode("utf-8"))
+                sheet.write(self._sheet_tail().encode("utf-8"))
+        yield sink.take()
+
+
+def styled(values: Iterable[Any], style: int) -> List[Tuple[Any, int]]:
+    return [(v, style) for v in values]
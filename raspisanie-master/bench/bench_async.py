@@ -0,0 +1,109 @@
+# bench/bench_async.py
+# Пропускная способность при многих одновременных клиентах: DB_ASYNC=0 (пул потоков)
+# против DB_ASYNC=1 (asyncpg). Для каждого режима поднимается uvicorn, затем
+# --concurrency клиентов делают --requests запросов к --path.
+#   python bench/bench_async.py --requests 3000 --concurrency 200 --path "/api/itog?limit=100"
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+async def _load(base_url: str, path: str, requests: int, concurrency: int):
+    latencies, errors = [], 0
+    queue = iter(range(requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def worker():
+            nonlocal errors
+            for _ in queue:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def _wait_ready(base_url: str, proc: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("uvicorn exited")
+        try:
+            if httpx.get(base_url + "/api/pool_stats", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("uvicorn did not start")
+
+
+def run_mode(db_async: bool, args) -> dict:
+    env = dict(os.environ, DB_ASYNC="1" if db_async else "0", DB_AUTO_MIGRATE="0")
+    base_url = f"http://127.0.0.1:{args.port}"
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.api:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    try:
+        _wait_ready(base_url, proc)
+        asyncio.run(_load(base_url, args.path, min(args.requests, 200), args.concurrency))  # прогрев
+        latencies, errors, elapsed = asyncio.run(_load(base_url, args.path, args.requests, args.concurrency))
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    return {
+        "mode": "async" if db_async else "threadpool",
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="DB_ASYNC=0 против DB_ASYNC=1 под одновременной нагрузкой")
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--path", default="/api/itog?limit=100")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--json", action="store_true", help="вывести результат в JSON")
+    args = parser.parse_args(argv)
+
+    results = [run_mode(False, args), run_mode(True, args)]
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return 0
+    print(f"{args.path}: {args.requests} запросов, {args.concurrency} клиентов")
+    for r in results:
+        print(f"  {r['mode']:<11} {r['rps']:>8} rps  p50 {r['p50_ms']:>7} ms  p99 {r['p99_ms']:>7} ms  "
+              f"ошибок {r['errors']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
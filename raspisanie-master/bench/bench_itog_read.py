@@ -0,0 +1,92 @@
+# bench/bench_itog_read.py
+# Стоимость строки при чтении большого расписания: прежний путь (ORM Itog + to_dict +
+# json.dumps) против нынешнего (Core select с преобразованием в SQL + orjson).
+# Во временные строки пишется type='bench', после замера они удаляются.
+#   python bench/bench_itog_read.py --rows 100000
+import argparse
+import json
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import orjson
+from sqlalchemy import delete
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.importer import copy_itog_rows  # noqa: E402
+from app.models import ITOG_ORDER, DataStore, Itog, _filter_itog, session_scope  # noqa: E402
+
+MARKER = "bench"
+START = date(2097, 1, 1)
+
+
+def legacy_list(filters):
+    with session_scope() as db:
+        query = _filter_itog(db.query(Itog), filters).order_by(*ITOG_ORDER)
+        return [it.to_dict() for it in query.all()]
+
+
+def legacy_json(rows) -> bytes:
+    return json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def measure(fn, repeat: int):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="ORM + json против Core select + orjson на /api/itog")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="вывести результат в JSON")
+    args = parser.parse_args(argv)
+
+    filters = {"date_from": START.isoformat(), "date_to": (START + timedelta(days=364)).isoformat(),
+               "type": MARKER}
+    store = DataStore()
+    with session_scope() as db:
+        copy_itog_rows(db, [(START + timedelta(days=i % 360), "%02d:00" % (8 + i % 6), None, None, None, None, MARKER)
+                            for i in range(args.rows)])
+    try:
+        t_orm, rows_orm = measure(lambda: legacy_list(filters), args.repeat)
+        t_core, rows_core = measure(lambda: store.list_itog(filters=filters), args.repeat)
+        assert rows_orm == rows_core, "пути вернули разные данные"
+        t_json, body_json = measure(lambda: legacy_json(rows_orm), args.repeat)
+        t_orjson, body_orjson = measure(lambda: orjson.dumps(rows_core), args.repeat)
+        assert json.loads(body_json) == json.loads(body_orjson)
+    finally:
+        with session_scope() as db:
+            db.execute(delete(Itog).where(Itog.type == MARKER))
+
+    n = len(rows_core)
+    results = {
+        "rows": n,
+        "orm_list_us_row": round(t_orm / n * 1e6, 2),
+        "core_list_us_row": round(t_core / n * 1e6, 2),
+        "json_us_row": round(t_json / n * 1e6, 2),
+        "orjson_us_row": round(t_orjson / n * 1e6, 2),
+        "before_us_row": round((t_orm + t_json) / n * 1e6, 2),
+        "after_us_row": round((t_core + t_orjson) / n * 1e6, 2),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{n} строк, лучшее из {args.repeat}")
+    print(f"  выборка  ORM + to_dict        {results['orm_list_us_row']:>7} мкс/строка")
+    print(f"  выборка  Core select          {results['core_list_us_row']:>7} мкс/строка")
+    print(f"  JSON     json.dumps           {results['json_us_row']:>7} мкс/строка")
+    print(f"  JSON     orjson               {results['orjson_us_row']:>7} мкс/строка")
+    print(f"  итого    было {results['before_us_row']} -> стало {results['after_us_row']} мкс/строка")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
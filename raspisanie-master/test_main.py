@@ -4,7 +4,9 @@ from app.api import app
 
 @pytest.fixture
 def client():
-    return TestClient(app)
+    # with: запускает startup-хуки (миграции схемы)
+    with TestClient(app) as c:
+        yield c
 
 test_data = {"group_id": None, "prep_id": None}
 
@@ -39,4 +41,761 @@ def test_5_delete_prep(client):
 
 def test_6_404_on_nonexistent(client):
     response = client.delete("/api/groups/999999")
-    assert response.status_code == 404
\ No newline at end of file
+    assert response.status_code == 404
+
+def test_7_pool_stats(client):
+    response = client.get("/api/pool_stats")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["checked_out"] >= 0
+    assert data["pool_size"] >= 1
+
+def test_8_itog_keyset_pagination(client):
+    created = []
+    for t in ["08:00", "09:40", "11:20"]:
+        r = client.post("/api/itog", json={"data": "2099-01-10", "time": t, "type": "Тест"})
+        created.append(r.json()["id"])
+    params = {"date_from": "2099-01-10", "date_to": "2099-01-10", "limit": 2, "fields": "id,time"}
+    first = client.get("/api/itog", params=params)
+    assert first.status_code == 200
+    assert first.headers["X-Total-Count"] == "3"
+    assert first.json() == [{"id": created[0], "time": "08:00"}, {"id": created[1], "time": "09:40"}]
+    second = client.get("/api/itog", params={**params, "cursor": first.headers["X-Next-Cursor"]})
+    assert second.json() == [{"id": created[2], "time": "11:20"}]
+    assert "X-Next-Cursor" not in second.headers
+    assert client.get("/api/itog", params={"fields": "nope"}).status_code == 400
+    for i in created:
+        client.delete(f"/api/itog/{i}")
+
+def test_9_search_in_db(client):
+    created = [client.post("/api/preps", json={"fio": fio}).json()["id"]
+               for fio in ["Ёлкин Пётр", "Белкин Ёлкин", "Сидоров 50%"]]
+    response = client.get("/api/preps", params={"fio": "ЕЛКИН"})
+    assert response.status_code == 200
+    names = [p["fio"] for p in response.json()]
+    assert names[:2] == ["Ёлкин Пётр", "Белкин Ёлкин"]
+    assert [p["fio"] for p in client.get("/api/preps", params={"fio": "0%"}).json()] == ["Сидоров 50%"]
+    assert len(client.get("/api/preps", params={"fio": "елкин", "limit": 1}).json()) == 1
+    for pid in created:
+        client.delete(f"/api/preps/{pid}")
+
+def test_10_migrations_applied(client):
+    from app import migrations
+    assert migrations.current_version() == migrations.MIGRATIONS[-1][0]
+    assert migrations.missing_indexes() == []
+
+def test_11_itog_conflicts(client):
+    aud = client.post("/api/auditorii", json={"number": "ТЕСТ-101"}).json()["id"]
+    lesson = {"data": "2099-03-02", "time": "10:00", "id_au_fk": int(aud), "type": "Тест"}
+    first = client.post("/api/itog", json=lesson).json()
+    rejected = client.post("/api/itog", params={"on_conflict": "reject"}, json=lesson)
+    assert rejected.status_code == 409
+    assert rejected.json()["detail"]["conflicts"][0]["kinds"] == ["aud"]
+    warned = client.post("/api/itog", params={"on_conflict": "warn"}, json=lesson).json()
+    assert warned["conflicts"][0]["lesson"]["id"] == first["id"]
+    report = client.get("/api/itog/conflicts", params={"date_from": "2099-03-02", "date_to": "2099-03-02"}).json()
+    assert report == [{"date": "2099-03-02", "time": "10:00", "kinds": ["aud"], "ids": [first["id"], warned["id"]],
+                       "aud_id": aud, "prep_id": None, "group_id": None}]
+    assert client.get("/api/itog/conflicts", params={"date_from": "2099-13-01"}).status_code == 400
+    client.delete(f"/api/itog/{warned['id']}")
+    client.delete(f"/api/itog/{first['id']}")
+    client.delete(f"/api/auditorii/{aud}")
+
+def test_12_import_csv(client):
+    csv_text = ("Дата;Время;Группа;Предмет;Преподаватель;Аудитория;Тип\n"
+                "2099-04-01;08:30;ИМП-ГР;ИМП-Предмет;ИМП Преподаватель;ИМП-1;Лекция\n"
+                "02.04.2099;9:40:00;имп-гр;ИМП-Предмет;;;Практика\n"
+                "не дата;10:00;ИМП-ГР;;;;\n")
+    files = {"file": ("schedule.csv", csv_text.encode("utf-8"), "text/csv")}
+    etag = client.get("/api/itog").headers["etag"]
+    missing = client.post("/api/import", files=files).json()
+    assert missing["count"] == 0 and missing["error_count"] == 3
+    # ничего не импортировано — версия itog не сдвинулась
+    assert client.get("/api/itog", headers={"If-None-Match": etag}).status_code == 304
+    response = client.post("/api/import", params={"create_missing": "true"}, files=files)
+    assert response.status_code == 200
+    result = response.json()
+    assert result["count"] == 2
+    assert result["errors"] == [{"row": 4, "error": "неверная дата: не дата"}]
+    assert result["created"]["groups"] == 1
+    rows = client.get("/api/itog", params={"date_from": "2099-04-01", "date_to": "2099-04-02"}).json()
+    assert [(r["date"], r["time"]) for r in rows] == [("2099-04-01", "08:30"), ("2099-04-02", "09:40")]
+    assert rows[0]["group_id"] == rows[1]["group_id"]
+    for r in rows:
+        client.delete(f"/api/itog/{r['id']}")
+    for path, key in [("groups", "group_id"), ("objects", "object_id"), ("preps", "prep_id"), ("auditorii", "aud_id")]:
+        client.delete(f"/api/{path}/{rows[0][key]}")
+    assert client.post("/api/import", files={"file": ("x.pdf", b"%PDF", "application/pdf")}).status_code == 400
+
+def test_13_itog_batch(client):
+    base = client.post("/api/itog", json={"data": "2099-05-04", "time": "08:00", "type": "Тест"}).json()
+    gone = client.post("/api/itog", json={"data": "2099-05-04", "time": "09:40", "type": "Тест"}).json()
+    response = client.post("/api/itog/batch", json={"operations": [
+        {"op": "create", "item": {"data": "2099-05-05", "time": "08:00", "type": "Тест"}},
+        {"op": "update", "id": int(base["id"]), "item": {"time": "11:20"}},
+        {"op": "delete", "id": int(gone["id"])},
+    ]})
+    assert response.status_code == 200
+    result = response.json()
+    assert result["updated"][0]["time"] == "11:20" and result["updated"][0]["type"] == "Тест"
+    assert result["deleted"] == [gone["id"]]
+    created = result["created"][0]
+    assert created["date"] == "2099-05-05"
+    # атомарность: несуществующий id откатывает всю пачку
+    failed = client.post("/api/itog/batch", json={"operations": [
+        {"op": "delete", "id": int(base["id"])},
+        {"op": "delete", "id": 999999999},
+    ]})
+    assert failed.status_code == 404
+    rows = client.get("/api/itog", params={"date_from": "2099-05-04", "date_to": "2099-05-05"}).json()
+    assert sorted(r["id"] for r in rows) == sorted([base["id"], created["id"]])
+    bad = client.post("/api/itog/batch", json={"operations": [{"op": "create", "item": {"data": "05.05.2099"}}]})
+    assert bad.status_code == 400
+    # пустая пачка — без новой версии данных
+    etag = client.get("/api/itog", params={"date_from": "2099-05-04"}).headers["ETag"]
+    assert client.post("/api/itog/batch", json={"operations": []}).json() == {"created": [], "updated": [], "deleted": []}
+    assert client.get("/api/itog", params={"date_from": "2099-05-04"}, headers={"If-None-Match": etag}).status_code == 304
+    client.post("/api/itog/batch", json={"operations": [{"op": "delete", "id": int(r["id"])} for r in rows]})
+
+def test_14_ref_cache_invalidation(client):
+    client.get("/api/objects")
+    before = client.get("/api/cache_stats").json()
+    client.get("/api/objects")
+    after = client.get("/api/cache_stats").json()
+    assert after["hits"] == before["hits"] + 1
+    created = client.post("/api/objects", json={"name": "КЭШ-Предмет"}).json()
+    stats = client.get("/api/cache_stats").json()
+    assert stats["versions"]["objects"] == after["versions"]["objects"] + 1
+    assert created in client.get("/api/objects").json()
+    client.put(f"/api/objects/{created['id']}", json={"name": "КЭШ-Предмет-2"})
+    assert {"id": created["id"], "name": "КЭШ-Предмет-2"} in client.get("/api/objects").json()
+    client.delete(f"/api/objects/{created['id']}")
+    assert all(o["id"] != created["id"] for o in client.get("/api/objects").json())
+
+def test_15_export_excel_streaming(client):
+    import io
+    from openpyxl import load_workbook
+    prep = client.post("/api/preps", json={"fio": "Экспортов Эксель"}).json()
+    lesson = client.post("/api/itog", json={"data": "2099-06-01", "time": "08:00", "id_prep_fk": int(prep["id"])}).json()
+    response = client.get("/api/export_excel")
+    # промах кэша: документ уходит потоком, без Content-Length
+    assert response.status_code == 200 and "content-length" not in response.headers
+    cached = client.get("/api/export_excel")
+    assert cached.headers["content-length"] == str(len(response.content)) and cached.content == response.content
+    ws = load_workbook(io.BytesIO(response.content)).active
+    assert ws["A1"].value == "МИНИСТЕРСТВО ОБРАЗОВАНИЯ МОСКОВСКОЙ ОБЛАСТИ"
+    assert [c.value for c in ws[8]][:2] == ["№", "ФИО преподавателя"]
+    assert "Экспортов Эксель" in [row[1] for row in ws.iter_rows(min_row=9, values_only=True)]
+    assert ws["B9"].border.left.style == "thin"
+    client.delete(f"/api/itog/{lesson['id']}")
+    client.delete(f"/api/preps/{prep['id']}")
+
+
+def test_16_export_word_filters(client):
+    import io
+    from docx import Document
+    group = client.post("/api/groups", json={"name": "ВОРД-<&>"}).json()
+    obj = client.post("/api/objects", json={"name": "Физика"}).json()
+    inside = client.post("/api/itog", json={"data": "2099-07-02", "time": "10:00", "id_group_fk": int(group["id"]),
+                                            "id_obj_fk": int(obj["id"]), "type": "Лекция"}).json()
+    outside = client.post("/api/itog", json={"data": "2099-08-01", "time": "10:00",
+                                             "id_group_fk": int(group["id"])}).json()
+    response = client.get("/api/export_word", params={"group": "ВОРД-<&>", "date_start": "2099-07-01",
+                                                      "date_end": "2099-07-31"})
+    assert response.status_code == 200
+    doc = Document(io.BytesIO(response.content))
+    rows = [[c.text for c in row.cells] for row in doc.tables[0].rows]
+    assert rows == [["Дата", "Время", "Дисциплина", "Преподаватель", "Аудитория", "Тип занятия"],
+                    ["2099-07-02", "10:00", "Физика", "", "", "Лекция"]]
+    assert "ВОРД-<&>" in doc.paragraphs[1].text
+    empty = Document(io.BytesIO(client.get("/api/export_word", params={"group": "НЕТ-ТАКОЙ"}).content))
+    assert len(empty.tables[0].rows) == 1
+    assert client.get("/api/export_word", params={"date_start": "01.07.2099"}).status_code == 400
+    assert client.post("/api/export_jobs", json={"kind": "word", "params": {"date_end": "abc"}}).status_code == 400
+    for lesson in (inside, outside):
+        client.delete(f"/api/itog/{lesson['id']}")
+    client.delete(f"/api/objects/{obj['id']}")
+    client.delete(f"/api/groups/{group['id']}")
+
+
+def test_17_export_jobs_cache(client):
+    import time
+    prep = client.post("/api/preps", json={"fio": "Кэшев Экспорт"}).json()
+    response = client.post("/api/export_jobs", json={"kind": "excel"})
+    assert response.status_code == 202
+    job = response.json()
+    for _ in range(300):
+        if job["status"] in ("done", "failed"):
+            break
+        time.sleep(0.1)
+        job = client.get(f"/api/export_jobs/{job['id']}").json()
+    assert job["status"] == "done"
+    first = client.get(f"/api/export_jobs/{job['id']}/download")
+    assert first.status_code == 200 and first.content[:2] == b"PK"
+    # данные не менялись — тот же файл из кэша без нового задания
+    again = client.post("/api/export_jobs", json={"kind": "excel"}).json()
+    assert again["status"] == "done" and again["cached"]
+    assert client.get(f"/api/export_jobs/{again['id']}/download").content == first.content
+    # после записи версия данных другая — кэш не используется
+    client.put(f"/api/preps/{prep['id']}", json={"fio": "Кэшев Экспорт 2"})
+    assert client.post("/api/export_jobs", json={"kind": "excel"}).json()["cached"] is False
+    assert client.post("/api/export_jobs", json={"kind": "word", "params": {"x": "1"}}).status_code == 400
+    assert client.get("/api/export_jobs/nope").status_code == 404
+    client.delete(f"/api/preps/{prep['id']}")
+
+
+def test_18_etag_not_modified(client):
+    first = client.get("/api/groups")
+    etag = first.headers["ETag"]
+    assert client.get("/api/groups", headers={"If-None-Match": etag}).status_code == 304
+    # другие параметры — другой ETag
+    assert client.get("/api/groups", params={"name": "а"}).headers["ETag"] != etag
+    # запись в другую таблицу не сбрасывает ETag групп
+    itog_etag = client.get("/api/itog", params={"date_from": "2099-09-01"}).headers["ETag"]
+    lesson = client.post("/api/itog", json={"data": "2099-09-01", "time": "08:00", "type": "Тест"}).json()
+    assert client.get("/api/groups", headers={"If-None-Match": etag}).status_code == 304
+    changed = client.get("/api/itog", params={"date_from": "2099-09-01"}, headers={"If-None-Match": itog_etag})
+    assert changed.status_code == 200 and [r["id"] for r in changed.json()] == [lesson["id"]]
+    group = client.post("/api/groups", json={"name": "ЕТАГ-1"}).json()
+    assert client.get("/api/groups", headers={"If-None-Match": etag}).status_code == 200
+    export = client.get("/api/export_word", params={"group": "ЕТАГ-1"})
+    assert client.get("/api/export_word", params={"group": "ЕТАГ-1"},
+                      headers={"If-None-Match": export.headers["ETag"]}).status_code == 304
+    client.delete(f"/api/itog/{lesson['id']}")
+    client.delete(f"/api/groups/{group['id']}")
+
+
+def test_19_async_store():
+    import asyncio
+    from app.async_store import AsyncDataStore
+
+    async def scenario():
+        db = AsyncDataStore()
+        try:
+            before = await db.table_versions("groups", "itog")
+            group = await db.create_group("АСИНК-1")
+            assert [g["id"] for g in await db.list_groups("асинк-1")] == [group["id"]]
+            lesson = await db.create_itog("2099-10-01", "08:00", None, int(group["id"]), None, None, "Тест")
+            rows, next_cursor, total = await db.page_itog({"group_id": group["id"]}, limit=10)
+            assert total == 1 and next_cursor is None and rows[0]["date"] == "2099-10-01"
+            assert [r["id"] for r in await db.list_itog({"date_from": "2099-10-01", "date_to": "2099-10-01"})] == \
+                [lesson["id"]]
+            assert await db.delete_itog(int(lesson["id"]))
+            assert await db.delete_group(int(group["id"])) == 0  # занятие удалено раньше
+            after = await db.table_versions("groups", "itog")
+            assert after["groups"] > before["groups"] and after["itog"] > before["itog"]
+        finally:
+            await db.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_20_itog_fast_read_matches_orm(client):
+    from app.models import Itog, session_scope, store
+    lesson = store.create_itog("2099-11-02", "09:00", None, None, None, None, "Тест")
+    lesson2 = store.create_itog(None, None, None, None, None, None, "Тест")
+    try:
+        filt = {"type": "Тест"}
+        with session_scope() as db:
+            expected = [it.to_dict() for it in db.query(Itog).filter(Itog.type == "Тест")
+                        .order_by(Itog.date.asc().nullslast(), Itog.time.asc().nullslast(), Itog.id.asc())]
+        assert store.list_itog(filters=filt) == expected
+        assert client.get("/api/itog", params={"type": "Тест"}).json() == expected
+        rows, _, _ = store.page_itog(filters=filt, limit=10, fields=["id", "date"])
+        assert rows == [{"id": r["id"], "date": r["date"]} for r in expected]
+    finally:
+        store.delete_itog(int(lesson["id"]))
+        store.delete_itog(int(lesson2["id"]))
+
+
+def test_21_timetable_grid(client):
+    from app.models import store
+    from app.timetable import timetable
+    group = client.post("/api/groups", json={"name": "СЕТКА-1"}).json()
+    gid = group["id"]
+    try:
+        # 2099-11-02 — понедельник
+        a = client.post("/api/itog", json={"data": "2099-11-04", "time": "10:00", "id_group_fk": int(gid), "type": "Тест"}).json()
+        b = client.post("/api/itog", json={"data": "2099-11-02", "time": "08:00", "id_group_fk": int(gid), "type": "Тест"}).json()
+        r = client.get("/api/timetable", params={"group_id": gid, "week": "2099-11-05"})
+        assert r.status_code == 200
+        t = r.json()
+        assert t["week"] == "2099-11-02" and t["times"] == ["08:00", "10:00"] and len(t["days"]) == 7
+        assert [x["id"] for x in t["grid"][0][0]] == [b["id"]] and [x["id"] for x in t["grid"][1][2]] == [a["id"]]
+        loads = timetable.loads
+        # перенос занятия обновляет сетку без перестройки
+        client.put(f"/api/itog/{a['id']}", json={"time": "08:00"})
+        t = client.get("/api/timetable", params={"group_id": gid, "week": "2099-11-02"}).json()
+        assert t["times"] == ["08:00"] and [x["id"] for x in t["grid"][0][2]] == [a["id"]]
+        assert timetable.loads == loads
+        # запись мимо DataStore (другой воркер) — сетка перестраивается по счётчику
+        client.delete(f"/api/itog/{b['id']}")
+        timetable.version -= 1
+        t = client.get("/api/timetable", params={"group_id": gid, "week": "2099-11-02"}).json()
+        assert timetable.loads == loads + 1 and t["grid"][0][0] == []
+        assert client.get("/api/timetable", params={"week": "2099-11-02"}).status_code == 400
+        client.delete(f"/api/itog/{a['id']}")
+    finally:
+        store.delete_group(int(gid))
+
+
+def test_22_workload(client):
+    import io
+    from openpyxl import load_workbook
+    from app.workload import workload
+    prep = client.post("/api/preps", json={"fio": "Нагрузкин Н.Н."}).json()
+    obj = client.post("/api/objects", json={"name": "Нагрузковедение"}).json()
+    g1 = client.post("/api/groups", json={"name": "НАГР-1"}).json()
+    g2 = client.post("/api/groups", json={"name": "НАГР-2"}).json()
+    period = {"date_from": "2099-12-01", "date_to": "2099-12-31", "prep_id": prep["id"]}
+    ids = []
+
+    def lesson(d, group):
+        ids.append(client.post("/api/itog", json={
+            "data": d, "time": "08:00", "id_obj_fk": int(obj["id"]), "id_group_fk": int(group["id"]),
+            "id_prep_fk": int(prep["id"]), "type": "Тест"}).json()["id"])
+
+    try:
+        lesson("2099-12-01", g1)
+        lesson("2099-12-02", g1)
+        lesson("2099-12-03", g2)
+        lesson("2100-01-10", g2)  # вне периода
+        rows = client.get("/api/workload", params=period).json()
+        assert [(r["group"], r["hours"], r["total_hours"]) for r in rows] == [("НАГР-1", 4, 6), ("НАГР-2", 2, 6)]
+        assert rows[0]["prep"] == "Нагрузкин Н.Н." and rows[0]["object"] == "Нагрузковедение"
+        # новая запись правит закэшированный агрегат без повторного GROUP BY
+        misses = workload.stats()["misses"]
+        lesson("2099-12-04", g2)
+        rows = client.get("/api/workload", params=period).json()
+        assert [(r["hours"], r["total_hours"]) for r in rows] == [(4, 8), (4, 8)]
+        assert workload.stats()["misses"] == misses
+        assert client.get("/api/workload", params={"date_from": "abc"}).status_code == 400
+
+        response = client.get("/api/export_excel", params={"date_from": "2099-12-01", "date_to": "2099-12-31"})
+        ws = load_workbook(io.BytesIO(response.content)).active
+        mine = [r for r in ws.iter_rows(min_row=9, values_only=True) if r[1] == "Нагрузкин Н.Н."]
+        assert [(r[3], r[4], r[5], r[7]) for r in mine] == [
+            ("Нагрузковедение", 4, "НАГР-1", 8), ("Нагрузковедение", 4, "НАГР-2", 8)]
+    finally:
+        for i in ids:
+            client.delete(f"/api/itog/{i}")
+        for path, item in (("groups", g1), ("groups", g2), ("objects", obj), ("preps", prep)):
+            client.delete(f"/api/{path}/{item['id']}")
+
+
+def test_23_free_auditorii(client):
+    a = client.post("/api/auditorii", json={"number": "СВОБ-1"}).json()
+    b = client.post("/api/auditorii", json={"number": "СВОБ-2"}).json()
+    lesson = client.post("/api/itog", json={"data": "2099-09-07", "time": "10:00", "id_au_fk": int(a["id"])}).json()
+
+    def free(**params):
+        ids = {r["id"] for r in client.get("/api/auditorii/free", params=params).json()}
+        return [x["number"] for x in (a, b) if x["id"] in ids]
+
+    try:
+        assert free(date="2099-09-07", time="10:00") == ["СВОБ-2"]
+        assert free(date="2099-09-07", time="08:00") == ["СВОБ-1", "СВОБ-2"]
+        assert free(date="2099-09-07") == ["СВОБ-2"]
+        assert free(date="2099-09-09", week="true") == ["СВОБ-2"]
+        assert free(date="2099-09-09") == ["СВОБ-1", "СВОБ-2"]
+        client.put(f"/api/itog/{lesson['id']}", json={"time": "12:00"})
+        assert free(date="2099-09-07", time="10:00") == ["СВОБ-1", "СВОБ-2"]
+        assert free(date="2099-09-07", time="12:00") == ["СВОБ-2"]
+        client.delete(f"/api/itog/{lesson['id']}")
+        assert free(date="2099-09-07") == ["СВОБ-1", "СВОБ-2"]
+        assert client.get("/api/auditorii/free", params={"date": "07.09.2099"}).status_code == 400
+    finally:
+        client.delete(f"/api/itog/{lesson['id']}")
+        client.delete(f"/api/auditorii/{a['id']}")
+        client.delete(f"/api/auditorii/{b['id']}")
+
+
+def test_24_schedule_generator(client):
+    import time
+    groups = [client.post("/api/groups", json={"name": f"ГЕН-{i}"}).json() for i in range(3)]
+    preps = [client.post("/api/preps", json={"fio": f"Генераторов {i}"}).json() for i in range(3)]
+    auds = [client.post("/api/auditorii", json={"number": f"ГЕН-{i}"}).json() for i in range(2)]
+    # уже стоящее занятие занимает преподавателя 0 в первый слот
+    fixed = client.post("/api/itog", json={"data": "2099-05-04", "time": "08:00",
+                                          "id_prep_fk": int(preps[0]["id"])}).json()
+    # 3 группы × 4 занятия, 3 преподавателя, 2 аудитории на 2 дня × 3 слота — аудитории заняты все 6 слотов
+    requirements = [{"group_id": int(g["id"]), "prep_id": int(preps[(i + k) % 3]["id"]), "hours": 4,
+                     "type": "ГенТест"} for i, g in enumerate(groups) for k in range(2)]
+    payload = {"date_from": "2099-05-04", "date_to": "2099-05-05", "times": ["08:00", "09:40", "11:30"],
+               "auditorii": [int(a["id"]) for a in auds], "requirements": requirements, "time_budget": 20}
+    try:
+        assert client.post("/api/generate", json=dict(payload, date_to="2099-05-01")).status_code == 400
+        job = client.post("/api/generate", json=payload)
+        assert job.status_code == 202
+        for _ in range(300):
+            state = client.get(f"/api/generate/{job.json()['id']}").json()
+            if state["status"] not in ("queued", "running"):
+                break
+            time.sleep(0.1)
+        assert state["status"] == "done", state
+        assert state["progress"]["lessons"] == 12 and state["progress"]["placed"] == 12
+        assert state["inserted"] == 12 and state["unplaced"] == []
+        rows = client.get("/api/itog", params={"type": "ГенТест"}).json()
+        assert len(rows) == 12
+        rows.append({**fixed, "date": "2099-05-04", "time": "08:00"})
+        for kind in ("group_id", "prep_id", "aud_id"):
+            slots = [(r["date"], r["time"], r[kind]) for r in rows if r[kind]]
+            assert len(slots) == len(set(slots)), kind
+    finally:
+        for r in client.get("/api/itog", params={"type": "ГенТест"}).json():
+            client.delete(f"/api/itog/{r['id']}")
+        client.delete(f"/api/itog/{fixed['id']}")
+        for path, items in (("groups", groups), ("preps", preps), ("auditorii", auds)):
+            for item in items:
+                client.delete(f"/api/{path}/{item['id']}")
+
+
+def test_25_change_events(client):
+    import asyncio
+    from app.events import events, format_sse, missed_events, parse_event_id
+    group = client.post("/api/groups", json={"name": "СОБ-1"}).json()
+    other = client.post("/api/groups", json={"name": "СОБ-2"}).json()
+
+    async def scenario():
+        mine = events.subscribe({"group_id": group["id"]})
+        everyone = events.subscribe()
+        try:
+            created = (await asyncio.to_thread(client.post, "/api/itog", json={
+                "data": "2099-10-01", "time": "08:00", "id_group_fk": int(group["id"]), "type": "Тест"})).json()
+            ev = await mine.get(5)
+            assert (ev["op"], ev["row"]["id"], "old" in ev) == ("create", created["id"], False)
+            # перенос в другую группу: прежней группе приходит update со старой строкой — убрать у себя
+            await asyncio.to_thread(client.put, f"/api/itog/{created['id']}", json={"id_group_fk": int(other["id"])})
+            ev = await mine.get(5)
+            assert (ev["op"], ev["old"]["group_id"], ev["row"]["group_id"]) == ("update", group["id"], other["id"])
+            await asyncio.to_thread(client.delete, f"/api/itog/{created['id']}")
+            assert await mine.get(0.5) is None  # занятие уже не в группе
+            await asyncio.to_thread(client.put, f"/api/groups/{other['id']}", json={"name": "СОБ-3"})
+            ev = await mine.get(5)
+            assert (ev["table"], ev["op"]) == ("groups", "reload")
+
+            seen = [(e["table"], e["op"]) for e in [await everyone.get(5) for _ in range(4)]]
+            assert seen == [("itog", "create"), ("itog", "update"), ("itog", "delete"), ("groups", "reload")]
+            assert format_sse(ev).startswith(f"id: {ev['id']}\nevent: groups\ndata: {{")
+            # переподключение: перечитать надо только таблицы, изменившиеся после Last-Event-ID
+            versions = dict(parse_event_id(ev["id"]), groups=parse_event_id(ev["id"])["groups"] + 1)
+            assert [e["table"] for e in missed_events(parse_event_id(ev["id"]), versions)] == ["groups"]
+        finally:
+            events.unsubscribe(mine)
+            events.unsubscribe(everyone)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        for g in (group, other):
+            client.delete(f"/api/groups/{g['id']}")
+
+
+def test_26_delete_ref_keeps_lessons(client):
+    from app.timetable import timetable
+    group = client.post("/api/groups", json={"name": "УДАЛ-1"}).json()
+    aud = client.post("/api/auditorii", json={"number": "УДАЛ-101"}).json()
+    ids = [client.post("/api/itog", json={
+        "data": f"2099-09-0{d}", "time": "08:00", "id_group_fk": int(group["id"]), "id_au_fk": int(aud["id"]),
+        "type": "Тест"}).json()["id"] for d in (1, 2, 3)]
+    try:
+        client.get("/api/timetable", params={"group_id": group["id"], "week": "2099-09-01"})
+        loads = timetable.stats()["loads"]
+        response = client.delete(f"/api/groups/{group['id']}")
+        assert response.status_code == 200 and response.json()["lessons"] == 3
+        rows = client.get("/api/itog", params={"date_from": "2099-09-01", "date_to": "2099-09-03"}).json()
+        assert sorted(r["id"] for r in rows if r["aud_id"] == aud["id"]) == sorted(ids)
+        assert all(r["group_id"] is None for r in rows if r["id"] in ids)
+        # изменённые строки ушли слушателям: сетка поправлена без перестройки
+        grid = client.get("/api/timetable", params={"group_id": group["id"], "week": "2099-09-01"}).json()
+        assert grid["times"] == [] and timetable.stats()["loads"] == loads
+        assert client.delete(f"/api/groups/{group['id']}").status_code == 404
+        assert client.delete(f"/api/auditorii/{aud['id']}").json()["lessons"] == 3
+    finally:
+        for i in ids:
+            client.delete(f"/api/itog/{i}")
+        client.delete(f"/api/auditorii/{aud['id']}")
+
+
+def test_27_static_fingerprinted(client):
+    import re
+    page = client.get("/").text
+    js = re.search(r'src="(/static/js/app\.[0-9a-f]{10}\.js)"', page).group(1)
+    assert re.search(r'href="/static/css/style\.[0-9a-f]{10}\.css"', page)
+    response = client.get(js, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200 and response.headers["content-encoding"] == "gzip"
+    assert "immutable" in response.headers["cache-control"] and "connectEvents" in response.text
+    assert client.get(js, headers={"If-None-Match": response.headers["etag"],
+                                   "Accept-Encoding": "gzip"}).status_code == 304
+    plain = client.get("/static/js/app.js", headers={"Accept-Encoding": "identity"})
+    assert plain.headers["cache-control"] == "no-cache" and "content-encoding" not in plain.headers
+    # у каждого варианта свой сильный ETag: сжатый ETag не подходит к несжатому ответу
+    assert plain.headers["etag"] != response.headers["etag"] and response.headers["etag"].endswith('-gzip"')
+    assert client.get("/static/js/app.js", headers={"If-None-Match": response.headers["etag"],
+                                                    "Accept-Encoding": "identity"}).status_code == 200
+    assert plain.content == response.content
+    assert client.get("/static/js/missing.js").status_code == 404
+    assert "cache-control" not in client.get("/api/pool_stats").headers
+
+
+def test_28_cold_import_and_pdf(client):
+    # импорт без доступной БД и без библиотек экспортов; шрифт PDF — TTF или Helvetica
+    from bench.bench_startup import IMPORT_PROBE, NO_DB_URL, _probe
+    assert _probe(IMPORT_PROBE, {"DATABASE_URL": NO_DB_URL})["heavy"] == []
+    response = client.get("/api/export_pdf")
+    assert response.status_code == 200 and response.content.startswith(b"%PDF")
+
+
+def test_29_bench_synthetic_and_compare():
+    from collections import Counter
+    from bench.load_test import compare
+    from bench.synthetic import lessons, references
+    rows = list(lessons(groups=12, preps=9, rooms=8, rows=2000))
+    assert len(rows) == 2000
+    # без накладок по группам и аудиториям, id справочников в пределах масштаба
+    for col, n in ((3, 12), (5, 8)):
+        assert max(Counter((r[0], r[1], r[col]) for r in rows).values()) == 1
+        assert {r[col] for r in rows} == set(range(1, n + 1))
+    refs = references(12, 9, 8)
+    assert all(len(set(names)) == len(names) for names in refs.values())
+
+    baseline = {"scenarios": {"crud": {"p99_ms": 100, "rps": 50, "errors": 0}}, "server_peak_rss_kb": 1000}
+    same = {"scenarios": {"crud": {"p99_ms": 110, "rps": 48, "errors": 0}}, "server_peak_rss_kb": 1100}
+    worse = {"scenarios": {"crud": {"p99_ms": 200, "rps": 20, "errors": 1}}, "server_peak_rss_kb": 2000}
+    assert compare(same, baseline, 0.25) == []
+    assert len(compare(worse, baseline, 0.25)) == 4
+
+
+def test_30_metrics(client):
+    import re
+    from app import metrics
+    group = client.post("/api/groups", json={"name": "МЕТР-1"}).json()
+    try:
+        before = metrics.http_duration.count(method="PUT", route="/api/groups/{id_group}")
+        client.put(f"/api/groups/{group['id']}", json={"name": "МЕТР-2"})
+        client.get("/api/itog", params={"group_id": group["id"], "limit": 10})
+        client.get("/api/export_excel", params={"date_from": "2099-08-01", "date_to": "2099-08-02"})
+        text = client.get("/metrics").text
+        # шаблон маршрута, а не фактический путь
+        assert metrics.http_duration.count(method="PUT", route="/api/groups/{id_group}") == before + 1
+        assert f"/api/groups/{group['id']}" not in text
+        assert re.search(r'http_requests_total\{method="PUT",route="/api/groups/\{id_group\}",status="200"\} \d+', text)
+        queries = re.search(r'http_request_db_queries_sum\{method="GET",route="/api/itog"\} (\d+)', text)
+        assert queries and int(queries.group(1)) >= 1
+        assert re.search(r'http_request_db_seconds_count\{method="GET",route="/api/itog"\} \d+', text)
+        assert re.search(r'export_requests_total\{kind="excel",cached="(true|false)"\} \d+', text)
+        assert "# TYPE http_request_duration_seconds histogram" in text and "db_pool_checked_out " in text
+        assert metrics.db_queries.value() > 0
+    finally:
+        client.delete(f"/api/groups/{group['id']}")
+
+
+def test_31_query_profiling(client):
+    import time
+    from sqlalchemy import event, text
+    from app.models import engine, session_scope
+    from app.profiling import normalize, profiler
+    assert not event.contains(engine, "after_cursor_execute", profiler._after_cursor_execute)
+    client.post("/api/profiling", json={"enabled": True, "slow_ms": 0, "trace": True, "n_plus_one": 5, "clear": True})
+    group = client.post("/api/groups", json={"name": "ПРОФ-1"}).json()
+    try:
+        r = client.get("/api/itog", params={"group_id": group["id"], "limit": 10})
+        trace = client.get(f"/api/profiling/traces/{r.headers['x-query-trace']}").json()
+        assert trace["route"] == "/api/itog" and trace["statements_count"] == len(trace["statements"]) >= 1
+        # N+1: один и тот же оператор с разными литералами и длиной IN-списка
+        assert normalize("SELECT 1 WHERE id IN (1, 2, 3) AND x = 'a'") == normalize("SELECT  1 WHERE id IN (7) AND x = 'b'")
+        token = profiler.begin("GET", "/loop")
+        with session_scope() as db:
+            for i in range(6):
+                db.execute(text("SELECT id_itog FROM \"Itog\" WHERE id_group_fk = :g"), {"g": int(group["id"]) + i})
+        profiler.end(token, "/loop", 200)
+        status = client.get("/api/profiling").json()
+        assert any(f["route"] == "/loop" and f["count"] == 6 for f in status["n_plus_one"])
+        # медленные (порог 0 — все) с параметрами; план строится в фоне
+        for _ in range(50):
+            entry = next(s for s in reversed(profiler.slow) if "id_group_fk =" in s["sql"] and "SELECT" in s["sql"])
+            if entry["plan"]:
+                break
+            time.sleep(0.1)
+        assert str(int(group["id"]) + 5) in entry["params"] and "Scan" in entry["plan"]
+    finally:
+        client.delete(f"/api/groups/{group['id']}")
+        client.post("/api/profiling", json={"enabled": False, "clear": True})
+    # выключенный профилировщик снимает слушателей и не пишет трассы
+    assert not event.contains(engine, "after_cursor_execute", profiler._after_cursor_execute)
+    assert "x-query-trace" not in client.get("/api/groups").headers
+
+
+def test_32_itog_keyset_nulls(client):
+    group = client.post("/api/groups", json={"name": "КЛЮЧ-1"}).json()
+    slots = [("2099-03-01", "08:00"), ("2099-03-01", None), ("2099-03-01", "09:00"), ("2099-03-02", None),
+             ("2099-03-02", "08:00"), (None, "08:00"), (None, None), (None, None)]
+    ids = [client.post("/api/itog", json={"data": d, "time": t, "id_group_fk": group["id"]}).json()["id"]
+           for d, t in slots]
+    try:
+        # порядок date/time NULLS LAST, id — строки с NULL в конце своего дня и всей выборки
+        expected = [ids[i] for i in (0, 2, 1, 4, 3, 5, 6, 7)]
+        for limit in (1, 2, 3):
+            got, cursor = [], None
+            while True:
+                params = {"group_id": group["id"], "limit": limit, "fields": "id"}
+                if cursor:
+                    params["cursor"] = cursor
+                r = client.get("/api/itog", params=params)
+                got += [row["id"] for row in r.json()]
+                cursor = r.headers.get("X-Next-Cursor")
+                if not cursor:
+                    break
+            assert got == expected
+    finally:
+        client.delete(f"/api/groups/{group['id']}")
+        for i in ids:
+            client.delete(f"/api/itog/{i}")
+
+
+def test_33_ref_cache_other_process(client):
+    from sqlalchemy import text
+    from app.models import bump_table_versions, session_scope, store
+    created = client.post("/api/objects", json={"name": "КЭШ-Чужой"}).json()
+    try:
+        assert {"id": created["id"], "name": "КЭШ-Чужой"} in store.list_objects()
+        # запись другого процесса: строка и счётчик меняются в БД, invalidate() здесь не вызывается
+        with session_scope() as db:
+            db.execute(text('UPDATE "Objects" SET name_obj = :n WHERE id_obj = :id'), {"n": "КЭШ-Чужой-2",
+                                                                                        "id": int(created["id"])})
+        bump_table_versions("objects")
+        assert {"id": created["id"], "name": "КЭШ-Чужой-2"} in store.list_objects()
+        assert store.ref_names("objects")[created["id"]] == "КЭШ-Чужой-2"
+    finally:
+        client.delete(f"/api/objects/{created['id']}")
+
+
+def test_34_etag_body_after_other_worker_write(client):
+    from sqlalchemy import text
+    from app.models import bump_table_versions, session_scope
+    created = client.post("/api/groups", json={"name": "ВОРКЕР-1"}).json()
+    try:
+        first = client.get("/api/groups")
+        assert {"id": created["id"], "name": "ВОРКЕР-1"} in first.json()
+        # другой воркер переименовал группу: в этом процессе кэш не сбрасывали
+        with session_scope() as db:
+            db.execute(text('UPDATE "Groups" SET name_gr = :n WHERE id_group = :id'), {"n": "ВОРКЕР-2",
+                                                                                       "id": int(created["id"])})
+        bump_table_versions("groups")
+        second = client.get("/api/groups", headers={"If-None-Match": first.headers["ETag"]})
+        assert second.status_code == 200 and second.headers["ETag"] != first.headers["ETag"]
+        assert {"id": created["id"], "name": "ВОРКЕР-2"} in second.json()
+    finally:
+        client.delete(f"/api/groups/{created['id']}")
+
+
+def test_35_export_after_rename(client):
+    import io
+    import time
+    from docx import Document
+    from openpyxl import load_workbook
+    group = client.post("/api/groups", json={"name": "ПЕРЕИМ-1"}).json()
+    prep = client.post("/api/preps", json={"fio": "Имя 0"}).json()
+    lesson = client.post("/api/itog", json={"data": "2099-12-01", "time": "08:00", "id_group_fk": int(group["id"]),
+                                            "id_prep_fk": int(prep["id"])}).json()
+    try:
+        for n in range(3):
+            name = f"Имя {n}"
+            client.put(f"/api/preps/{prep['id']}", json={"fio": name})
+            # Word собирается в процессе пула со своим кэшем справочников
+            doc = Document(io.BytesIO(client.get("/api/export_word", params={"group": "ПЕРЕИМ-1"}).content))
+            assert doc.tables[0].rows[1].cells[3].text == name
+            job = client.post("/api/export_jobs", json={"kind": "excel"}).json()
+            for _ in range(300):
+                if job["status"] in ("done", "failed"):
+                    break
+                time.sleep(0.05)
+                job = client.get(f"/api/export_jobs/{job['id']}").json()
+            ws = load_workbook(io.BytesIO(client.get(f"/api/export_jobs/{job['id']}/download").content)).active
+            assert name in [row[1] for row in ws.iter_rows(min_row=9, values_only=True)]
+    finally:
+        client.delete(f"/api/itog/{lesson['id']}")
+        client.delete(f"/api/preps/{prep['id']}")
+        client.delete(f"/api/groups/{group['id']}")
+
+
+def test_36_generator_recheck_before_insert(client):
+    from app.generator import drop_taken
+    from app.models import session_scope
+    group = client.post("/api/groups", json={"name": "ГЕН-ПОЗЖЕ"}).json()
+    aud = client.post("/api/auditorii", json={"number": "ГЕН-ПОЗЖЕ"}).json()
+    g, a = int(group["id"]), int(aud["id"])
+    # занятие появилось, пока генератор решал: группа занята в 08:00
+    later = client.post("/api/itog", json={"data": "2099-05-11", "time": "08:00", "id_group_fk": g}).json()
+    try:
+        placed = [(0, ("2099-05-11", "08:00", None, g, None, a, "ГенТест")),
+                  (1, ("2099-05-11", "09:40", None, g, None, a, "ГенТест")),
+                  (2, ("2099-05-12", "08:00", None, g, None, a, "ГенТест"))]
+        with session_scope() as db:
+            kept, dropped = drop_taken(db, placed)
+        assert [req for req, _ in kept] == [1, 2] and dropped == [0]
+    finally:
+        client.delete(f"/api/itog/{later['id']}")
+        client.delete(f"/api/auditorii/{aud['id']}")
+        client.delete(f"/api/groups/{group['id']}")
+
+
+def test_37_itog_malformed_filters(client):
+    r = client.get("/api/itog?date_from=2024-13-01")
+    assert r.status_code == 400
+    assert client.get("/api/itog?date_to=завтра&limit=10").status_code == 400
+    assert client.post("/api/itog", json={"data": "32.01.2099", "time": "08:00"}).status_code == 400
+    assert client.put("/api/itog/1", json={"data": "2099-02-30", "time": "08:00"}).status_code == 400
+    # мусор в id-фильтрах — 400 и без limit, и со страницами
+    for query in ("group_id=abc", "prep_id=1x", "aud_id=-", "object_id=abc&limit=5"):
+        assert client.get(f"/api/itog?{query}").status_code == 400
+
+
+def test_38_index_load_once(client):
+    from concurrent.futures import ThreadPoolExecutor
+    from app.models import bump_table_versions
+    from app.timetable import timetable
+    client.get("/api/timetable", params={"group_id": 1})  # индекс на текущей версии
+    loads = timetable.loads
+    timetable.load(timetable.version)
+    assert timetable.loads == loads
+    # версия ушла вперёд: несколько запросов разом перестраивают индекс один раз
+    version = bump_table_versions("itog")["itog"]
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda _: timetable.load(version), range(4)))
+    assert timetable.loads == loads + 1 and timetable.version >= version
+
+
+def test_39_export_stream_shared(client):
+    from app.jobs import export_jobs
+    params = {"date_from": "2099-12-01", "date_to": "2099-12-31"}
+    first = export_jobs.prepare("excel", params)
+    assert export_jobs.start(first, True) is first and first.chunks is not None
+    # такой же экспорт во время сборки не собирается второй раз, а ждёт первый
+    assert export_jobs.start(export_jobs.prepare("excel", params), True) is first
+    body = b"".join(first.chunks)
+    assert first.future.done() and first.status == "done" and first.size == len(body)
+    # попадание в кэш у синхронного экспорта не заводит запись задания
+    hit = export_jobs.start(export_jobs.prepare("excel", params), True)
+    assert hit.cached and export_jobs.get(hit.id) is None
+    # брошенная потоковая сборка освобождает место в очереди
+    gone = export_jobs.start(export_jobs.prepare("excel", {"date_from": "2099-11-01"}), True)
+    gone.chunks = None
+    assert gone.status == "failed" and gone.key not in export_jobs._inflight
+
+
+def test_40_search_lc_raw_sql(client):
+    from sqlalchemy import text
+    from app.models import engine, normalize_search
+    fio = "  Ёжиков\tИВАН  Smith "
+    with engine.begin() as conn:
+        pid, key = conn.execute(text('INSERT INTO "Prepodavateli" (fio) VALUES (:fio) RETURNING id_prep, search_lc'),
+                                {"fio": fio}).one()
+        assert key == normalize_search(fio) == "ежиков иван smith"
+        key = conn.execute(text('UPDATE "Prepodavateli" SET fio = :fio WHERE id_prep = :id RETURNING search_lc'),
+                           {"fio": "Пётр Ёлкин", "id": pid}).scalar()
+        assert key == normalize_search("Пётр Ёлкин")
+    try:
+        assert [p["id"] for p in client.get("/api/preps", params={"fio": "петр елк"}).json()] == [str(pid)]
+    finally:
+        client.delete(f"/api/preps/{pid}")